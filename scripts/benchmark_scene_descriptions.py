@@ -0,0 +1,123 @@
+"""Compare writing scene descriptions in one structured call with one call per scene.
+
+Both modes describe the scenes of an existing scenario with the configured LLM, without
+saving the results. Tokens come from the usage LiteLLM reports for each completion, so the
+per-scene mode pays for its system prompt and the previous description on every call. Run
+it from the `src` directory with the LLM up and the models idle, e.g.
+`make benchmark-scene-descriptions SCENARIO=3`.
+"""
+
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import litellm  # noqa: E402
+from litellm.integrations.custom_logger import CustomLogger  # noqa: E402
+
+import services  # noqa: E402
+from db import get_model_usage, get_scenario  # noqa: E402
+from ml.telemetry import LLMCallRecord, build_record  # noqa: E402
+from utils import settings  # noqa: E402
+
+
+class CallCollector(CustomLogger):
+    """Keeps the metrics record of every completion made while it is registered."""
+
+    def __init__(self):
+        super().__init__()
+        self.records: list[LLMCallRecord] = []
+        self.lock = threading.Lock()
+
+    def log_success_event(self, kwargs, response_obj, start_time, end_time):
+        with self.lock:
+            self.records.append(build_record(kwargs, response_obj, start_time, end_time))
+
+    def log_failure_event(self, kwargs, response_obj, start_time, end_time):
+        with self.lock:
+            self.records.append(build_record(kwargs, response_obj, start_time, end_time,
+                                             error=str(kwargs.get("exception"))))
+
+    def wait_for(self, count: int, timeout: float = 5.0) -> list[LLMCallRecord]:
+        """LiteLLM logs from a background thread, so give the last records a moment to arrive."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if len(self.records) >= count:
+                    break
+            time.sleep(0.05)
+        with self.lock:
+            records, self.records = self.records, []
+        return records
+
+
+def per_scene(scenario, llm_model: str) -> list[str]:
+    llm = services.scene_description_llm(llm_model)
+    descriptions = []
+    previous = ""
+    for i in range(len(scenario.get_scene_summaries_as_array())):
+        previous = services.generate_scene_description(scenario, llm_model, i, previous, llm=llm) or ""
+        descriptions.append(previous)
+    return descriptions
+
+
+def single_call(scenario, llm_model: str) -> list[str]:
+    return services.generate_all_scene_descriptions(scenario, llm_model)
+
+
+def bench(name: str, describe, scenario, llm_model: str, collector: CallCollector, runs: int) -> dict:
+    scenes = len(scenario.get_scene_summaries_as_array())
+    seconds, calls, prompt_tokens, completion_tokens, written = 0.0, 0, 0, 0, 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        descriptions = describe(scenario, llm_model)
+        seconds += time.perf_counter() - start
+        records = collector.wait_for(1 if name == "single_call" else scenes)
+        calls += len(records)
+        prompt_tokens += sum(record.prompt_tokens or 0 for record in records)
+        completion_tokens += sum(record.completion_tokens or 0 for record in records)
+        written += sum(1 for description in descriptions if description)
+    return {"mode": name, "seconds": seconds / runs, "calls": calls / runs, "prompt_tokens": prompt_tokens / runs,
+            "completion_tokens": completion_tokens / runs, "scenes": f"{written / runs:.1f} of {scenes}"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenario_id", type=int, help="Scenario whose scenes are described")
+    parser.add_argument("--model", default=None, help="LLM to use, defaults to the selected one")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per mode, results are averaged")
+    args = parser.parse_args()
+
+    scenario = get_scenario(args.scenario_id)
+    if scenario is None:
+        sys.exit(f"Scenario {args.scenario_id} not found")
+    usage = get_model_usage()
+    llm_model = args.model or (usage.llm_model if usage and usage.llm_model else settings.INFERENCE_DEPLOYMENT_NAME)
+    collector = CallCollector()
+    litellm.callbacks.append(collector)
+    try:
+        # Warm up the model so loading it does not count against the first mode
+        services.generate_scene_description(scenario, llm_model, 0)
+        collector.wait_for(1)
+        rows = [
+            bench("per_scene", per_scene, scenario, llm_model, collector, args.runs),
+            bench("single_call", single_call, scenario, llm_model, collector, args.runs),
+        ]
+    finally:
+        litellm.callbacks.remove(collector)
+
+    for row in rows:
+        print(f"{row['mode']:<12} {row['seconds']:>7.2f}s {row['calls']:>5.1f} calls "
+              f"{row['prompt_tokens']:>8.0f} prompt + {row['completion_tokens']:>7.0f} completion tokens, "
+              f"{row['scenes']} scenes described")
+    per, single = rows
+    if single["seconds"]:
+        print(f"single_call is {per['seconds'] / single['seconds']:.1f}x faster and uses "
+              f"{per['prompt_tokens'] - single['prompt_tokens']:.0f} fewer prompt tokens per scenario")
+
+
+if __name__ == "__main__":
+    main()
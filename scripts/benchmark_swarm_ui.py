@@ -0,0 +1,122 @@
+"""Benchmark the SwarmUI client against the local stand-in server.
+
+The fake server sleeps for fixed load, step and download latencies and runs one generation
+at a time, like a single GPU. The time it spends loading and rendering is the floor for any
+client, so whatever the wall clock adds on top of it is client overhead: session and
+websocket setup, waiting on downloads, hashing and bookkeeping. Thumbnail rendering runs in
+a separate process pool and is left out unless `--derive` is given.
+Run it from the `src` directory, e.g. `make benchmark-swarmui`.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import media  # noqa: E402
+from ml import swarm_ui  # noqa: E402
+from ml.fake_swarmui import FakeSwarmUI  # noqa: E402
+from ml.image_cache import ImageCache  # noqa: E402
+
+MODEL = "model-a.safetensors"
+
+
+def use_fake_server(server: FakeSwarmUI, workdir: str, derive: bool) -> swarm_ui.SwarmUIClient:
+    """Point the shared client, the image folder and the media store at the benchmark."""
+    client = swarm_ui.SwarmUIClient(
+        api_url=server.api_url,
+        ws_url=server.ws_url,
+        base_url=server.base_url,
+        manage_container=False,
+    )
+    files_dir = os.path.join(workdir, "images")
+    swarm_ui._client = client
+    swarm_ui.FILES_DIR = files_dir
+    cache = ImageCache(os.path.join(files_dir, "cache"), 1 << 30)
+    swarm_ui.get_image_cache = lambda: cache
+    media.OBJECTS_DIR = os.path.join(workdir, "media", "objects")
+    media.DERIVED_DIR = os.path.join(workdir, "media", "derived")
+    if not derive:
+        media.derive_async = lambda source, sha256: None
+    return client
+
+
+def bench_images(server: FakeSwarmUI, count: int, batch: int) -> dict:
+    """Serial single prompt requests, as the profile page makes them."""
+    busy, start = server.busy_seconds, time.perf_counter()
+    images = 0
+    for i in range(count):
+        images += len(swarm_ui.image_from_prompt(f"benchmark {i}", model=MODEL, preset="draft", num_images=batch))
+    elapsed = time.perf_counter() - start
+    overhead = elapsed - (server.busy_seconds - busy)
+    return {"case": f"image_from_prompt x{count} (batch {batch})", "images": images,
+            "seconds": elapsed, "overhead_per_image_ms": 1000 * overhead / images}
+
+
+def bench_scenarios(server: FakeSwarmUI, scenarios: int, scenes: int, concurrency: int, max_queued: int) -> dict:
+    """Several scenarios generating their scene images at the same time."""
+
+    def scenario(n: int) -> int:
+        prompts = [f"scenario {n} scene {i} {time.perf_counter_ns()}" for i in range(scenes)]
+        results = swarm_ui.image_from_prompts(prompts, model=MODEL, max_queued=max_queued)
+        return sum(len(files) for files in results)
+
+    busy, start = server.busy_seconds, time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        images = sum(pool.map(scenario, range(scenarios)))
+    elapsed = time.perf_counter() - start
+    overhead = elapsed - (server.busy_seconds - busy)
+    return {"case": f"{scenarios} scenarios x {scenes} scenes, {concurrency} at once, queue {max_queued}",
+            "images": images, "seconds": elapsed,
+            "overhead_per_image_ms": 1000 * overhead / images,
+            "overhead_per_scenario_ms": 1000 * overhead / scenarios}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--step-latency", type=float, default=0.01, help="Seconds per sampling step")
+    parser.add_argument("--load-latency", type=float, default=0.5, help="Seconds to load a model")
+    parser.add_argument("--download-latency", type=float, default=0.005, help="Seconds per image download")
+    parser.add_argument("--session-latency", type=float, default=0.05, help="Seconds to open a session")
+    parser.add_argument("--images", type=int, default=20, help="Serial image_from_prompt calls")
+    parser.add_argument("--batch", type=int, default=1, help="Images per image_from_prompt call")
+    parser.add_argument("--scenarios", type=int, default=4)
+    parser.add_argument("--scenes", type=int, default=6)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--max-queued", type=int, default=None)
+    parser.add_argument("--derive", action="store_true", help="Also render thumbnails of the downloaded images")
+    args = parser.parse_args()
+
+    server = FakeSwarmUI(
+        session_latency=args.session_latency,
+        load_latency=args.load_latency,
+        step_latency=args.step_latency,
+        download_latency=args.download_latency,
+    )
+    with server, tempfile.TemporaryDirectory() as workdir:
+        client = use_fake_server(server, workdir, args.derive)
+        # Warm up the session, the websocket pool and the model so they do not count
+        client.ensure_model(MODEL)
+        swarm_ui.image_from_prompt("warm up", model=MODEL)
+
+        rows = [bench_images(server, args.images, args.batch)]
+        for concurrency in args.concurrency:
+            rows.append(bench_scenarios(server, args.scenarios, args.scenes, concurrency, args.max_queued))
+        client.close()
+
+    for row in rows:
+        line = (f"{row['case']:<60} {row['images']:>4} images {row['seconds']:>7.2f}s "
+                f"overhead {row['overhead_per_image_ms']:>7.1f} ms/image")
+        if "overhead_per_scenario_ms" in row:
+            line += f", {row['overhead_per_scenario_ms']:>7.1f} ms/scenario"
+        print(line)
+    print(f"Server calls: {server.calls}, websocket connections: {server.ws_connections}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import mimetypes
+import os
+import re
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import quote, unquote, urlsplit
+
+from ml.tts import FILES_DIR as SPEECH_DIR
+from utils import logger, settings
+
+CHUNK_SIZE = 64 * 1024
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)$")
+
+mimetypes.add_type("audio/ogg", ".ogg")
+mimetypes.add_type("audio/ogg", ".opus")
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_failed = False
+_server_lock = threading.Lock()
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """Inclusive (start, end) of a single `bytes=` range, or None for the whole file.
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        # Multiple or malformed ranges, serve the whole file
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
+
+
+class MediaRequestHandler(BaseHTTPRequestHandler):
+    """Serves the files below the server root with support for range requests.
+
+    Browsers fetch audio in ranges to start playback early and to seek, so only the bytes
+    that are played have to be sent.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(f"Media server: {format % args}")
+
+    def _resolve(self) -> Optional[str]:
+        root = os.path.realpath(self.server.root)
+        path = os.path.realpath(os.path.join(root, unquote(urlsplit(self.path).path).lstrip("/")))
+        if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+            return None
+        return path
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body: bool):
+        path = self._resolve()
+        if path is None:
+            self.send_error(404)
+            return
+        stat = os.stat(path)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        try:
+            byte_range = parse_range(self.headers.get("Range"), stat.st_size)
+        except ValueError:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{stat.st_size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        start, end = byte_range or (0, stat.st_size - 1)
+        length = end - start + 1 if stat.st_size else 0
+        self.send_response(206 if byte_range else 200)
+        self.send_header("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream")
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        if byte_range:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{stat.st_size}")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(stat.st_mtime, usegmt=True))
+        self.send_header("Cache-Control", "public, max-age=3600")
+        self.end_headers()
+        if not send_body:
+            return
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = length
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                try:
+                    self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The browser stops reading once it has buffered enough
+                    return
+                remaining -= len(chunk)
+
+
+def serve(root: str, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start serving `root` in a background thread and return the server."""
+    server = ThreadingHTTPServer((host, port), MediaRequestHandler)
+    server.daemon_threads = True
+    server.root = root
+    threading.Thread(target=server.serve_forever, daemon=True, name="media-server").start()
+    logger.info(f"Serving {root} on {host}:{server.server_address[1]}")
+    return server
+
+
+def start_media_server() -> Optional[ThreadingHTTPServer]:
+    """Start the shared speech server once per process. Returns None if it is disabled or failed.
+
+    Only the speech folder is served, on MEDIA_SERVER_HOST, which is the loopback interface
+    unless the deployment publishes the port itself.
+    """
+    global _server, _server_failed
+    if not settings.MEDIA_SERVER_ENABLED:
+        return None
+    with _server_lock:
+        if _server is None and not _server_failed:
+            try:
+                _server = serve(SPEECH_DIR, host=settings.MEDIA_SERVER_HOST, port=settings.MEDIA_SERVER_PORT)
+            except OSError as e:
+                logger.error(f"Could not start media server on port {settings.MEDIA_SERVER_PORT}: {e}")
+                _server_failed = True
+        return _server
+
+
+def media_url(path: Optional[str]) -> Optional[str]:
+    """URL the browser can stream a speech file from, or the path itself if it cannot be served.
+
+    Only a configured MEDIA_SERVER_URL is used, since the server is not reachable from other
+    machines by default; without it the path is returned and Streamlit sends the audio.
+    """
+    root = os.path.realpath(SPEECH_DIR)
+    if not settings.MEDIA_SERVER_URL or not path or not os.path.realpath(path).startswith(root + os.sep):
+        return path
+    if start_media_server() is None:
+        return path
+    return f"{settings.MEDIA_SERVER_URL.rstrip('/')}/{quote(os.path.relpath(os.path.realpath(path), root))}"
+
+
+def media_type(path: Optional[str], default: str = "audio/wav") -> str:
+    """MIME type of a media file, for players that need it up front."""
+    return (mimetypes.guess_type(path)[0] if path else None) or default
@@ -1,7 +1,8 @@
-from sqlalchemy import create_engine
+import json
+from sqlalchemy import create_engine, inspect, or_, text
 from sqlalchemy.orm import sessionmaker, joinedload
 from base import Base
-from models import Base, ModelUsage, ModelUsageSchema, Profile, ProfileSchema, Scenario, ScenarioSchema, Message, MessageSchema
+from models import Base, ModelUsage, ModelUsageSchema, Profile, ProfileSchema, Scenario, ScenarioSchema, Message, MessageSchema, MessageCandidate
 import os
 
 POSTGRES_USER = os.getenv("POSTGRES_USER", "postgres")
@@ -28,6 +29,27 @@ def init_db():
     ScenarioBase.metadata.create_all(bind=engine)
     from models import Base as MessageBase
     MessageBase.metadata.create_all(bind=engine)
+    from models import Base as MessageCandidateBase
+    MessageCandidateBase.metadata.create_all(bind=engine)
+    from models import Base as JobBase
+    JobBase.metadata.create_all(bind=engine)
+    add_missing_columns()
+
+def add_missing_columns():
+    """Add columns that were added to the models after their tables were created.
+
+    `create_all` only creates missing tables, so new nullable columns are added here.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
 
 def get_profiles():
     with SessionLocal() as session:
@@ -67,7 +89,8 @@ def save_profile(data):
                 profile_image_description=data.profile_image_description,
                 profile_image_path=data.profile_image_path,
                 chat_model=data.chat_model,
-                voice=data.voice
+                voice=data.voice,
+                stages=getattr(data, "stages", None)
             )
             session.add(profile)
         session.commit()
@@ -146,7 +169,8 @@ def save_scenario(data):
                 scene_summaries=data.scene_summaries,
                 invitation=data.invitation,
                 scene_descriptions=data.scene_descriptions,
-                images=data.images
+                images=data.images,
+                stages=getattr(data, "stages", None)
             )
             session.add(scenario)
         session.commit()
@@ -208,6 +232,71 @@ def delete_message(message_id: int):
             return True
         return False
 
+def release_speech(speech: str, message_id=None) -> bool:
+    """Detach a speech file from a message, deleting the file unless another message plays it.
+
+    The check and the delete run in one transaction that locks the messages playing the file.
+    Returns whether the file was deleted.
+    """
+    with SessionLocal() as session:
+        deleted = Message.release_speech(session, speech, message_id=message_id)
+        session.commit()
+        return deleted
+
+def replace_speech(old_speech: str, new_speech: str) -> int:
+    """Point every message that plays `old_speech` at `new_speech`. Returns the number updated."""
+    with SessionLocal() as session:
+        updated = session.query(Message).filter_by(speech=old_speech).update({Message.speech: new_speech})
+        session.commit()
+        return updated
+
+def get_unvoiced_messages(scenario_id=None, profile_id=None) -> list[tuple[MessageSchema, str | None]]:
+    """Character messages without speech and the voice of their profile, oldest first.
+
+    Limited to one scenario or to the scenarios of one profile when either is given.
+    """
+    with SessionLocal() as session:
+        query = (
+            session.query(Message, Profile.voice)
+            .join(Scenario, Message.scenario_id == Scenario.id)
+            .join(Profile, Scenario.profile_id == Profile.id)
+            .filter(Message.role == "character", or_(Message.speech.is_(None), Message.speech == ""))
+        )
+        if scenario_id is not None:
+            query = query.filter(Message.scenario_id == scenario_id)
+        if profile_id is not None:
+            query = query.filter(Scenario.profile_id == profile_id)
+        rows = query.order_by(Message.scenario_id, Message.order).all()
+        return [(MessageSchema.model_validate(message), voice) for message, voice in rows]
+
+def set_message_speeches(speeches: dict[int, str]) -> int:
+    """Set the speech of many messages in one update. Returns the number updated."""
+    if not speeches:
+        return 0
+    with SessionLocal() as session:
+        session.bulk_update_mappings(
+            Message, [{"id": message_id, "speech": speech} for message_id, speech in speeches.items()]
+        )
+        session.commit()
+        return len(speeches)
+
+def set_stage_done(model, entity_id: int, stage: str, done: bool = True) -> list[str]:
+    """Checkpoint a generation stage of a Profile or Scenario. Returns the stages now done.
+
+    Stages are only written here, not by save_profile and save_scenario, so saving a copy
+    loaded before the stage finished does not undo its checkpoint.
+    """
+    with SessionLocal() as session:
+        entity = session.query(model).filter_by(id=entity_id).with_for_update().first()
+        if entity is None:
+            return []
+        stages = [s for s in entity.completed_stages() if s != stage]
+        if done:
+            stages.append(stage)
+        entity.stages = json.dumps(stages)
+        session.commit()
+        return stages
+
 def get_next_message_order(scenario_id):
     with SessionLocal() as session:
         last_message = (
@@ -216,4 +305,29 @@ def get_next_message_order(scenario_id):
             .order_by(Message.order.desc())
             .first()
         )
-        return (last_message.order + 1) if last_message else 0
\ No newline at end of file
+        return (last_message.order + 1) if last_message else 0
+
+def save_message_candidates(message_id: int, contents: list[str]):
+    """Replace the alternative replies stored for a message."""
+    with SessionLocal() as session:
+        session.query(MessageCandidate).filter_by(message_id=message_id).delete()
+        for order, content in enumerate(contents):
+            session.add(MessageCandidate(message_id=message_id, content=content, order=order))
+        session.commit()
+
+def pop_message_candidate(message_id: int):
+    """Remove and return the next alternative reply for a message, or None if none are left."""
+    with SessionLocal() as session:
+        candidate = (
+            session.query(MessageCandidate)
+            .filter_by(message_id=message_id)
+            .order_by(MessageCandidate.order)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if not candidate:
+            return None
+        content = candidate.content
+        session.delete(candidate)
+        session.commit()
+        return content
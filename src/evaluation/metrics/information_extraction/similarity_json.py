@@ -5,7 +5,7 @@ from evaluation.metrics.utils import (
     create_dynamic_model,
     convert_to_json,
 )
-from utils import llmaaj_embedding_client
+from ml.embeddings import get_embedder
 
 
 def get_assert(output: str, context):
@@ -60,14 +60,22 @@ def compare_pydantic_objects(
     if not differences:
         differences = obj1.model_fields
 
+    # Embed every differing pair in a single batched request
+    to_embed = [
+        field for field in differences
+        if getattr(obj1, field) != getattr(obj2, field) and getattr(obj1, field) and getattr(obj2, field)
+    ]
+    texts = [str(getattr(obj, field)) for field in to_embed for obj in (obj1, obj2)]
+    embeddings = get_embedder().embed_texts(texts) if texts else []
+    pairs = {field: (embeddings[2 * i], embeddings[2 * i + 1]) for i, field in enumerate(to_embed)}
+
     for field in differences:
         value1 = getattr(obj1, field)
         value2 = getattr(obj2, field)
         if value1 != value2:
-            if value1 and value2:
-                embedding1 = llmaaj_embedding_client.embed_query(text=str(value1))
-                embedding2 = llmaaj_embedding_client.embed_query(text=str(value2))
-                similarity = round(cosine_similarity(embedding1, embedding2), 2)
+            if field in pairs:
+                embedding1, embedding2 = pairs[field]
+                similarity = round(float(cosine_similarity(embedding1, embedding2)), 2)
             else:
                 similarity = 0
         else:
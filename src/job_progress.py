@@ -0,0 +1,64 @@
+"""Progress of the queued jobs started from the Streamlit pages.
+
+Pages register each job they enqueue with `track_job` and call `show_job_progress` once, so a
+single polling fragment follows every active job of the session instead of one per widget.
+"""
+from typing import Optional
+
+import streamlit as st
+
+from jobs import FAILED, cancel_job, get_job, job_event
+from media import display_image
+from progress import bus as progress_bus
+from utils import settings
+
+_ACTIVE_JOBS = "active_jobs"
+
+
+def track_job(key: str, job_id: int, label: str, width: Optional[int] = None):
+    """Follow a job until it finishes. A job tracked under the same key replaces the earlier one.
+
+    Args:
+        key: Identifies what the job works on, e.g. "profile_images_3".
+        job_id: Id returned by `jobs.enqueue`.
+        label: Shown above the progress bar.
+        width: Width of the preview image, or None to show no preview.
+    """
+    st.session_state.setdefault(_ACTIVE_JOBS, {})[key] = {"job_id": job_id, "label": label, "width": width}
+
+
+def show_job_progress():
+    """Show the progress of the tracked jobs, polling only while there are any."""
+    if st.session_state.get(_ACTIVE_JOBS):
+        _job_progress()
+
+
+@st.fragment(run_every=settings.PROGRESS_POLL_SECONDS)
+def _job_progress():
+    """Live progress and preview of each tracked job, refreshed without rerunning the page."""
+    active = st.session_state.get(_ACTIVE_JOBS, {})
+    finished = False
+    for key, tracked in list(active.items()):
+        job = get_job(tracked["job_id"])
+        st.caption(tracked["label"])
+        if job and job.status == FAILED:
+            st.error(f"Job failed: {job.error}")
+            if st.button("Dismiss", key=f"dismiss_{key}"):
+                del active[key]
+                st.rerun()
+            continue
+        event = job_event(job) if job else None
+        if event is None or event.done:
+            del active[key]
+            if job and job.topic:
+                progress_bus.clear(job.topic)
+            finished = True
+            continue
+        st.progress(min(event.percent or 0.0, 1.0), text=event.message)
+        if tracked["width"] and event.preview:
+            st.image(display_image(event.preview, tracked["width"]), width=tracked["width"])
+        if st.button("Cancel", key=f"cancel_{key}"):
+            cancel_job(tracked["job_id"])
+    if finished:
+        # Rerun the whole page once so the results show up
+        st.rerun()
@@ -0,0 +1,269 @@
+"""Durable background jobs, queued in Postgres.
+
+Pages enqueue jobs instead of starting threads, so the work survives reruns and restarts and
+can be inspected and cancelled. Workers (see worker.py) claim jobs with `FOR UPDATE SKIP
+LOCKED`, so any number of them can poll the table without handing out a job twice. A running
+job whose worker stops checking in is handed to another worker once its lease runs out.
+"""
+
+import contextlib
+import contextvars
+import json
+import threading
+import time
+from typing import Callable, Optional
+
+from db import SessionLocal
+from models import Job, JobSchema
+from progress import ProgressEvent, bus as progress_bus
+from utils import logger, settings
+
+# Lower runs first: chat is interactive, image and voice batches can wait
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DEFAULT = 50
+PRIORITY_BATCH = 100
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class ModelsBusy(RuntimeError):
+    """The models are in use by other work. A job that raises it is queued again, see `requeue`."""
+
+
+_cancel_event: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar(
+    "job_cancel_event", default=None
+)
+
+
+def enqueue(kind: str, priority: int = PRIORITY_DEFAULT, topic: Optional[str] = None,
+            max_attempts: Optional[int] = None, **kwargs) -> int:
+    """Queue a job for the handler registered as `kind` and return its ID.
+
+    The keyword arguments are passed to the handler and must be JSON serializable.
+    """
+    with SessionLocal() as session:
+        job = Job(
+            kind=kind,
+            args=json.dumps(kwargs),
+            priority=priority,
+            status=PENDING,
+            topic=topic,
+            attempts=0,
+            max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+            run_after=0.0,
+            cancel_requested=False,
+            created_at=time.time(),
+        )
+        session.add(job)
+        session.commit()
+        logger.info(f"Queued job {job.id}: {kind} {kwargs}")
+        return job.id
+
+
+def get_job(job_id: int) -> Optional[JobSchema]:
+    with SessionLocal() as session:
+        job = session.get(Job, job_id)
+        return JobSchema.model_validate(job) if job else None
+
+
+def list_jobs(statuses: Optional[list[str]] = None, limit: int = 50) -> list[JobSchema]:
+    """The most recent jobs, newest first, optionally only those with one of `statuses`."""
+    with SessionLocal() as session:
+        query = session.query(Job)
+        if statuses:
+            query = query.filter(Job.status.in_(statuses))
+        jobs = query.order_by(Job.id.desc()).limit(limit).all()
+        return [JobSchema.model_validate(job) for job in jobs]
+
+
+def claim_job(worker: str, choose: Optional[Callable[[list[str]], int]] = None) -> Optional[JobSchema]:
+    """Mark the next runnable job as running by `worker` and return it, or None if there is none.
+
+    Among the runnable jobs of the most urgent priority, up to `JOB_CLAIM_WINDOW` of them,
+    `choose` picks one by the list of their kinds, e.g. one that runs on a backend already
+    in VRAM. Without it the oldest is claimed.
+    """
+    now = time.time()
+    with SessionLocal() as session:
+        # Jobs of workers that stopped checking in go back in the queue, or fail if out of attempts
+        expired = (Job.status == RUNNING) & (Job.heartbeat_at < now - settings.JOB_LEASE_SECONDS)
+        session.query(Job).filter(expired, Job.attempts >= Job.max_attempts).update(
+            {Job.status: FAILED, Job.error: "Worker stopped responding", Job.finished_at: now},
+            synchronize_session=False,
+        )
+        session.query(Job).filter(expired).update(
+            {Job.status: PENDING, Job.worker: None}, synchronize_session=False
+        )
+        candidates = (
+            session.query(Job)
+            .filter(Job.status == PENDING, Job.run_after <= now)
+            .order_by(Job.priority, Job.id)
+            .with_for_update(skip_locked=True)
+            .limit(settings.JOB_CLAIM_WINDOW if choose else 1)
+            .all()
+        )
+        if not candidates:
+            session.commit()
+            return None
+        candidates = [job for job in candidates if job.priority == candidates[0].priority]
+        job = candidates[0]
+        if choose and len(candidates) > 1:
+            try:
+                job = candidates[choose([candidate.kind for candidate in candidates])]
+            except Exception as e:
+                logger.warning(f"Could not choose the next job, claiming the oldest: {e}")
+        job.status = RUNNING
+        job.worker = worker
+        job.attempts += 1
+        job.started_at = now
+        job.heartbeat_at = now
+        session.commit()
+        return JobSchema.model_validate(job)
+
+
+def pending_kinds() -> list[str]:
+    """The kinds of the jobs waiting to run, in claim order."""
+    with SessionLocal() as session:
+        rows = session.query(Job.kind).filter(Job.status == PENDING).order_by(Job.priority, Job.id).all()
+        return [kind for kind, in rows]
+
+
+def heartbeat(job_id: int, progress: Optional[ProgressEvent] = None) -> bool:
+    """Renew the lease of a running job and store its progress. Returns True if it should stop."""
+    with SessionLocal() as session:
+        job = session.get(Job, job_id)
+        if job is None:
+            return True
+        job.heartbeat_at = time.time()
+        if progress is not None:
+            job.progress = progress.model_dump_json()
+        session.commit()
+        return job.cancel_requested
+
+
+def finish_job(job_id: int, status: str = SUCCEEDED, error: Optional[str] = None):
+    with SessionLocal() as session:
+        job = session.get(Job, job_id)
+        if job is None:
+            return
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        session.commit()
+    logger.info(f"Job {job_id} {status}" + (f": {error}" if error else ""))
+
+
+def retry_or_fail(job_id: int, error: str):
+    """Queue a failed job again after a growing delay, or fail it once it is out of attempts."""
+    with SessionLocal() as session:
+        job = session.get(Job, job_id)
+        if job is None:
+            return
+        job.error = error
+        if job.attempts < job.max_attempts and not job.cancel_requested:
+            job.status = PENDING
+            job.worker = None
+            job.run_after = time.time() + settings.JOB_RETRY_SECONDS * 2 ** (job.attempts - 1)
+            logger.warning(f"Job {job_id} failed on attempt {job.attempts}, retrying: {error}")
+        else:
+            job.status = FAILED
+            job.finished_at = time.time()
+            logger.error(f"Job {job_id} failed after {job.attempts} attempt(s): {error}")
+        session.commit()
+
+
+def requeue(job_id: int, delay: Optional[float] = None):
+    """Queue a job that could not start yet again, without using up one of its attempts."""
+    with SessionLocal() as session:
+        job = session.get(Job, job_id)
+        if job is None:
+            return
+        cancelled = job.cancel_requested
+        if cancelled:
+            job.status = CANCELLED
+            job.finished_at = time.time()
+        else:
+            job.status = PENDING
+            job.worker = None
+            job.attempts = max(job.attempts - 1, 0)
+            job.run_after = time.time() + (settings.JOB_POLL_SECONDS if delay is None else delay)
+        session.commit()
+    if cancelled:
+        logger.info(f"Job {job_id} cancelled while waiting for the models")
+    else:
+        logger.info(f"Job {job_id} queued again, the models are busy")
+
+
+def cancel_job(job_id: int) -> bool:
+    """Cancel a queued job, or ask a running one to stop. Returns False if it already finished.
+
+    Running jobs stop at the next point where their handler checks `cancel_event`; work that
+    is already saved is kept.
+    """
+    with SessionLocal() as session:
+        job = session.get(Job, job_id)
+        if job is None or job.status in FINISHED:
+            return False
+        if job.status == PENDING:
+            job.status = CANCELLED
+            job.finished_at = time.time()
+        job.cancel_requested = True
+        session.commit()
+        logger.info(f"Cancellation requested for job {job_id}")
+        return True
+
+
+def queue_position(job: JobSchema) -> int:
+    """Number of pending jobs that will be claimed before `job`."""
+    with SessionLocal() as session:
+        return (
+            session.query(Job)
+            .filter(
+                Job.status == PENDING,
+                (Job.priority < job.priority) | ((Job.priority == job.priority) & (Job.id < job.id)),
+            )
+            .count()
+        )
+
+
+def job_event(job: JobSchema) -> ProgressEvent:
+    """Progress of a job for display, live from the bus if it runs in this process."""
+    topic = job.topic or f"job:{job.id}"
+    if job.status == PENDING:
+        ahead = queue_position(job)
+        message = f"Queued, {ahead} job(s) ahead" if ahead else "Queued, up next"
+        if job.attempts:
+            message += f" (retry {job.attempts} of {job.max_attempts - 1})"
+        return ProgressEvent(topic=topic, message=message, percent=0.0)
+    if job.status in FINISHED:
+        return ProgressEvent(topic=topic, message=job.error or job.status.capitalize(), done=True)
+    event = progress_bus.latest(job.topic) if job.topic else None
+    if event is None and job.progress:
+        event = ProgressEvent.model_validate_json(job.progress)
+    if event is None or event.done:
+        event = ProgressEvent(topic=topic, message="Running")
+    return event
+
+
+def cancel_event() -> threading.Event:
+    """Set when the job running in this context is cancelled. Handlers check it between steps.
+
+    Outside of a job this is an event that is never set. Pass it along explicitly to worker
+    threads, since they do not inherit the context.
+    """
+    return _cancel_event.get() or threading.Event()
+
+
+@contextlib.contextmanager
+def cancellable(event: threading.Event):
+    """Make `event` the cancel event of the code run in this block, see `cancel_event`."""
+    token = _cancel_event.set(event)
+    try:
+        yield event
+    finally:
+        _cancel_event.reset(token)
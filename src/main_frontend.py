@@ -1,11 +1,16 @@
 import streamlit as st
-from db import get_profiles, get_scenarios, get_scenarios_for_profile, init_db, get_model_usage, save_message, save_model_usage, save_profile, get_messages
-from services import generate_profile, generate_profile_image_description, generate_sample_profile_images, generate_scenario, generate_scenario_images, generate_scene_descriptions, stop_models, set_status_to_idle, voice_response
+from db import init_db, get_model_usage, save_message, save_model_usage
+from services import stop_models, set_status_to_idle
 from ml.llm import list_ollama_models
-from ml.swarm_ui import list_image_models, seed_from_image
+from ml.swarm_ui import list_image_models
 from models import ModelUsageSchema
+from jobs import enqueue
+from job_progress import show_job_progress, track_job
+from progress import surprise_me_topic
+from worker import start_workers
 
 init_db()
+start_workers()
 
 st.write("# Kizlar Agha")
 
@@ -45,67 +50,10 @@ if st.button("Surprise Me"):
         usage['image_model'] = image_models[0]['name']
         st.write(f"Image model set to: {usage['image_model']}")
         save_model_usage(ModelUsageSchema(**usage))
-    # Generate up to 5 random profiles if there are not already 5 profiles
-    profiles = get_profiles()
-    requests = ["Latina", "East Asian", "Northern European Blonde", "American Redhead", "Eastern European Brunette"]
-    if len(profiles) < len(requests):
-        # Use only the last requests needed to get to 5 total profiles
-        requests = requests[len(profiles):]
-        st.write(f"Generating {len(requests)} random profiles...")
-        for request in requests:
-            st.write(f"Generating {request} profile")
-            generate_profile(usage['llm_model'], request)
-            st.success(f"{request} profile generated.")
-    # Generate profile image descriptions and a scenario for each profile
-    for profile in get_profiles():
-        if not profile.profile_image_description:
-            st.write(f"Generating image for profile {profile.name}")
-            generate_profile_image_description(profile.id, usage['llm_model'])
-            st.success(f"Image description generated for profile {profile.name}.")
-        else:
-            st.write(f"Profile {profile.name} already has an image description.")
-        if not get_scenarios_for_profile(profile.id):
-            st.write(f"Generating scenario for profile {profile.name}")
-            generate_scenario(profile.id, usage['llm_model'])
-            st.success(f"Generated scenario for: {profile.name}")
-    # Generate scene descriptions for each scenario
-    for scenario in get_scenarios():
-        if not scenario.scene_descriptions:
-            st.write(f"Generating scene descriptions for scenario {scenario.title}")
-            generate_scene_descriptions(scenario.id, usage['llm_model'])
-            st.success(f"Generated scene descriptions for: {scenario.title}.")
-        else:
-            st.write(f"Scenario {scenario.title} already has scene descriptions.")
-    # Generate a profile image for each profile
-    for profile in get_profiles():
-        if not profile.profile_image_path:
-            st.write(f"Generating profile image for: {profile.name}")
-            profile = generate_sample_profile_images(profile.id, usage['image_model'], num_images=1)
-            st.success(f"Profile image generated for: {profile.name}.")
-        images = profile.get_images()
-        if not profile.image_seed:
-            if images:
-                # Select first image seed as profile image_seed so we can generate scenario images
-                profile.image_seed = seed_from_image(images[0])
-                save_profile(profile)
-                st.success(f"Image seed generated for {profile.name}.")
-            else:
-                profile.image_seed = -1
-                save_profile(profile)
-                st.warning(f"No image seed generated for {profile.name}. Using -1 (random).")
-    # Generate scenario images for each scenario
-    for scenario in get_scenarios():
-        if not scenario.images:
-            st.write(f"Generating images for scenario {scenario.title}")
-            generate_scenario_images(scenario.id, usage['image_model'])
-            st.success(f"Images generated for: {scenario.title}.")
-        else:
-            st.write(f"Scenario {scenario.title} already has images.")
-        # Voice messages if not already voiced
-        messages = get_messages(scenario.id)
-        for msg in messages:
-            if not msg.speech:
-                st.write(f"Voicing speech for message {msg.id} in scenario {scenario.title}")
-                voice_response(msg.id, profile.voice)
-                st.success(f"Speach generated for message {msg.id}.")
+    # Build profiles, scenarios, images and speech as a graph, overlapping the LLM and GPU work
+    job_id = enqueue(
+        "run_surprise_me", topic=surprise_me_topic(), llm_model=usage['llm_model'], image_model=usage['image_model']
+    )
+    track_job("surprise_me", job_id, "Building the starter library")
+show_job_progress()
 st.markdown("---")
@@ -0,0 +1,185 @@
+import hashlib
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional
+
+from media_render import render_derivatives
+from utils import logger, settings
+
+MEDIA_DIR = os.path.join(os.path.dirname(__file__), "/kizlar-agha/files/media")
+OBJECTS_DIR = os.path.join(MEDIA_DIR, "objects")
+DERIVED_DIR = os.path.join(MEDIA_DIR, "derived")
+# Size label of the full resolution derivative
+FULL = "full"
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_pending: dict[str, Future] = {}
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=4096)
+def _cached_sha256(path: str, mtime_ns: int, size: int) -> str:
+    return file_sha256(path)
+
+
+def content_hash(path: str) -> str:
+    """Hash of a file's content, cached until the file changes."""
+    stat = os.stat(path)
+    return _cached_sha256(path, stat.st_mtime_ns, stat.st_size)
+
+
+def object_path(sha256: str, ext: str) -> str:
+    return os.path.join(OBJECTS_DIR, sha256[:2], f"{sha256}{ext}")
+
+
+def derivative_path(sha256: str, size, fmt: Optional[str] = None) -> str:
+    fmt = fmt or display_format()
+    return os.path.join(DERIVED_DIR, sha256[:2], f"{sha256}_{size}.{fmt}")
+
+
+@lru_cache(maxsize=1)
+def display_format() -> str:
+    """Format of the derivatives: AVIF when configured and supported by Pillow, otherwise WebP."""
+    if settings.MEDIA_FORMAT == "avif":
+        from PIL import features
+        if features.check("avif"):
+            return "avif"
+        logger.warning("Pillow was built without AVIF support, using WebP derivatives.")
+    return "webp"
+
+
+def _link_or_copy(source: str, dest: str):
+    """Hardlink `source` to `dest` through a temporary name so `dest` is replaced atomically."""
+    tmp_path = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        # Different filesystem or no hardlink support
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, dest)
+
+
+def ingest(path: str, derive: bool = True) -> Optional[str]:
+    """Add an image to the store and return its content hash.
+
+    The file stays at `path`, since its name carries the seed, but identical files share a
+    single copy on disk: if the content is already stored, `path` is replaced with a hardlink
+    to it. Thumbnail and full size derivatives are then rendered in a process pool.
+    """
+    if not path or not os.path.isfile(path):
+        logger.error(f"Cannot ingest missing media file: {path}")
+        return None
+    sha256 = content_hash(path)
+    stored = object_path(sha256, os.path.splitext(path)[1].lower())
+    os.makedirs(os.path.dirname(stored), exist_ok=True)
+    try:
+        if not os.path.exists(stored):
+            _link_or_copy(path, stored)
+        elif not os.path.samefile(path, stored):
+            logger.info(f"{path} duplicates {stored}, sharing one copy")
+            _link_or_copy(stored, path)
+    except OSError as e:
+        logger.warning(f"Could not dedupe {path}: {e}")
+    if derive:
+        derive_async(stored, sha256)
+    return sha256
+
+
+def _sizes() -> list:
+    return [*sorted(settings.MEDIA_THUMBNAIL_SIZES), FULL]
+
+
+def _targets(sha256: str, sizes: list) -> dict:
+    return {None if size == FULL else size: derivative_path(sha256, size) for size in sizes}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned workers do not inherit the threads of the Streamlit server
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.MEDIA_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def derive_async(source: str, sha256: str) -> Future:
+    """Render the derivatives of a stored image in the background, once per image."""
+    with _pool_lock:
+        future = _pending.get(sha256)
+        if future is not None:
+            return future
+    future = _get_pool().submit(
+        render_derivatives, source, _targets(sha256, _sizes()), display_format(), settings.MEDIA_QUALITY
+    )
+    with _pool_lock:
+        _pending[sha256] = future
+    future.add_done_callback(lambda f: _derived(sha256, f))
+    return future
+
+
+def _derived(sha256: str, future: Future):
+    with _pool_lock:
+        _pending.pop(sha256, None)
+    if future.exception():
+        logger.error(f"Error rendering derivatives of {sha256}: {future.exception()}")
+
+
+def display_image(path: str, width: Optional[int] = None) -> str:
+    """Path of the smallest stored version of an image that is sharp at `width` pixels.
+
+    Thumbnails are chosen for twice the display width to stay crisp on high density screens.
+    Without a width the full size derivative is used. Missing derivatives are rendered on
+    the spot, and the original is returned if that is not possible.
+    """
+    if not path or not os.path.isfile(path):
+        return path
+    try:
+        sha256 = content_hash(path)
+        size = FULL
+        if width:
+            size = next((s for s in sorted(settings.MEDIA_THUMBNAIL_SIZES) if s >= width * 2), FULL)
+        dest = derivative_path(sha256, size)
+        if not os.path.exists(dest):
+            render_derivatives(path, _targets(sha256, [size]), display_format(), settings.MEDIA_QUALITY)
+        return dest
+    except Exception as e:
+        logger.warning(f"Showing original of {path}: {e}")
+        return path
+
+
+def remove(path: str):
+    """Delete an image and, once nothing else links to its content, the stored copy and derivatives."""
+    try:
+        sha256 = content_hash(path)
+    except OSError as e:
+        logger.error(f"Error deleting image {path}: {e}")
+        return
+    os.remove(path)
+    logger.info(f"Deleted image: {path}")
+    stored = object_path(sha256, os.path.splitext(path)[1].lower())
+    try:
+        if os.stat(stored).st_nlink > 1:
+            return
+        os.remove(stored)
+    except FileNotFoundError:
+        pass
+    for size in _sizes():
+        for fmt in ("webp", "avif"):
+            derived = derivative_path(sha256, size, fmt)
+            if os.path.exists(derived):
+                os.remove(derived)
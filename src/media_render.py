@@ -0,0 +1,39 @@
+"""Image resizing run in the media process pool.
+
+Kept free of the app settings and Docker client so spawned workers import it cheaply.
+"""
+import os
+
+from PIL import Image
+
+
+def render_derivatives(source: str, targets: dict, fmt: str, quality: int) -> list[str]:
+    """Write resized copies of an image.
+
+    Args:
+        source: Path of the original image.
+        targets: Destination path per size, where a size is the longest side in pixels or
+            None for the full resolution.
+        fmt: Pillow format name of the derivatives, e.g. "webp".
+        quality: Encoder quality from 0 to 100.
+
+    Returns:
+        The paths that were written; existing derivatives are skipped.
+    """
+    written = []
+    with Image.open(source) as image:
+        image.load()
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        for size, dest in targets.items():
+            if os.path.exists(dest):
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            resized = image.copy()
+            if size:
+                resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+            tmp_path = f"{dest}.{os.getpid()}.tmp"
+            resized.save(tmp_path, format=fmt.upper(), quality=quality, method=4)
+            os.replace(tmp_path, dest)
+            written.append(dest)
+    return written
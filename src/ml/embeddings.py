@@ -0,0 +1,202 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+from ml.llm import EmbeddingLLMConfig
+from utils import logger, settings
+
+
+class EmbeddingCache:
+    """Content-hash cache of embedding vectors, in memory with an optional on-disk store."""
+
+    def __init__(self, max_items: int = 4096, cache_dir: Optional[str] = None):
+        self.max_items = max_items
+        self.cache_dir = cache_dir
+        self._items: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._items.get(key)
+            if vector is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return vector
+        if self.cache_dir and os.path.exists(self._path(key)):
+            try:
+                vector = np.load(self._path(key))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable cached embedding {key}: {e}")
+            else:
+                self._remember(key, vector)
+                with self._lock:
+                    self.hits += 1
+                return vector
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, vector: np.ndarray):
+        self._remember(key, vector)
+        if self.cache_dir:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, vector)
+            os.replace(tmp_path, path)
+
+    def _remember(self, key: str, vector: np.ndarray):
+        with self._lock:
+            self._items[key] = vector
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+class BatchingEmbedder:
+    """Coalesces embedding requests into batched calls to an `EmbeddingLLMConfig`.
+
+    Concurrent `embed_text` calls are queued and sent together once `max_batch_size` texts are
+    waiting or `max_wait` seconds have passed since the first one arrived. Results are cached
+    by content hash, so repeated texts never reach the embedding model twice.
+    """
+
+    def __init__(
+            self,
+            config: EmbeddingLLMConfig,
+            max_batch_size: int = 32,
+            max_wait: float = 0.01,
+            cache: Optional[EmbeddingCache] = None
+        ):
+        self.config = config
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.cache = cache or EmbeddingCache()
+        self._queue: queue.Queue[tuple[str, str]] = queue.Queue()
+        self._pending: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, daemon=True, name="embedding-batcher")
+        self._worker.start()
+
+    def _key(self, text: str) -> str:
+        return EmbeddingCache.key(self.config.model_name, text)
+
+    def embed_text(self, text: str) -> np.ndarray:
+        """Embed a single text, batching it with any other concurrent requests."""
+        return self.submit(text).result()
+
+    def submit(self, text: str) -> Future:
+        """Queue a text for embedding and return a future for its vector."""
+        key = self._key(text)
+        future: Future = Future()
+        cached = self.cache.get(key)
+        if cached is not None:
+            future.set_result(cached)
+            return future
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            self._pending[key] = future
+        self._queue.put((key, text))
+        return future
+
+    def embed_texts(self, texts: list[str]) -> np.ndarray:
+        """Embed many texts, one row per text, sending only uncached texts to the model."""
+        futures = [self.submit(text) for text in texts]
+        if not futures:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([future.result() for future in futures])
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._embed_batch(batch)
+            except Exception as e:
+                # Never let the batcher thread die, every later submit would wait forever
+                logger.error(f"Error handling embedding batch: {e}")
+                self._fail([key for key, _ in batch], e)
+
+    def _fail(self, keys: list[str], error: BaseException):
+        with self._lock:
+            futures = [self._pending.pop(key, None) for key in keys]
+        for future in futures:
+            if future is not None and not future.done():
+                future.set_exception(error)
+
+    def _embed_batch(self, batch: list[tuple[str, str]]):
+        keys = [key for key, _ in batch]
+        texts = [text for _, text in batch]
+        try:
+            logger.debug(f"Embedding batch of {len(texts)} texts with {self.config.model_name}")
+            vectors = list(self.config.embed_texts(texts))
+        except Exception as e:
+            logger.error(f"Error embedding batch of {len(texts)} texts: {e}")
+            self._fail(keys, e)
+            return
+        if len(vectors) < len(keys):
+            logger.error(f"Got {len(vectors)} embeddings for a batch of {len(keys)} texts")
+            self._fail(keys[len(vectors):], ValueError(
+                f"The embedding model returned {len(vectors)} vectors for {len(keys)} texts"
+            ))
+        for key, vector in zip(keys, vectors):
+            try:
+                vector = np.asarray(vector, dtype=np.float32)
+            except Exception as e:
+                self._fail([key], e)
+                continue
+            try:
+                self.cache.put(key, vector)
+            except Exception as e:
+                logger.warning(f"Could not cache embedding {key}: {e}")
+            with self._lock:
+                future = self._pending.pop(key)
+            future.set_result(vector)
+
+
+@lru_cache(maxsize=1)
+def get_embedder() -> BatchingEmbedder:
+    """Shared batching embedder for the embedding model configured in settings."""
+    config = EmbeddingLLMConfig(
+        model_name=settings.EMBEDDINGS_DEPLOYMENT_NAME,
+        base_url=settings.EMBEDDINGS_BASE_URL,
+        api_key=settings.EMBEDDINGS_API_KEY,
+    )
+    return BatchingEmbedder(
+        config,
+        max_batch_size=settings.EMBEDDINGS_BATCH_SIZE,
+        max_wait=settings.EMBEDDINGS_BATCH_WAIT_MS / 1000,
+        cache=EmbeddingCache(
+            max_items=settings.EMBEDDINGS_CACHE_SIZE,
+            cache_dir=settings.EMBEDDINGS_CACHE_DIR,
+        ),
+    )
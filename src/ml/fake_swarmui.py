@@ -0,0 +1,284 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import struct
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+WS_MAGIC = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def tiny_png(seed: int) -> bytes:
+    """A 1x1 PNG whose colour depends on the seed."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+    pixel = bytes([0, seed % 256, (seed // 256) % 256, (seed // 65536) % 256])
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(pixel))
+        + chunk(b"IEND", b"")
+    )
+
+
+class FakeSwarmUI:
+    """In-process stand-in for the SwarmUI HTTP and websocket API.
+
+    It answers the routes the client uses with canned responses, renders tiny PNGs instead of
+    real images and sleeps for configurable latencies, so the client can be tested and
+    benchmarked without a container or GPU. Like a single GPU backend, it runs one generation
+    or model load at a time and queues the others.
+    """
+
+    def __init__(
+            self,
+            models: Optional[list[str]] = None,
+            session_latency: float = 0.0,
+            load_latency: float = 0.0,
+            step_latency: float = 0.0,
+            download_latency: float = 0.0,
+            close_after_command: bool = False
+        ):
+        self.models = models or ["model-a.safetensors", "model-b.safetensors"]
+        self.session_latency = session_latency
+        self.load_latency = load_latency
+        self.step_latency = step_latency
+        self.download_latency = download_latency
+        self.close_after_command = close_after_command
+        self.sessions: set[str] = set()
+        self.loaded_model: Optional[str] = None
+        self.images: dict[str, bytes] = {}
+        self.calls: dict[str, int] = {}
+        self.ws_connections = 0
+        # Seconds spent loading models and rendering, the floor for any client
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+        self._gpu = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.base_url}/API"
+
+    @property
+    def ws_url(self) -> str:
+        return f"ws://127.0.0.1:{self.port}/API"
+
+    def start(self) -> "FakeSwarmUI":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="fake-swarmui")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        """Start serving in a background thread."""
+        return self.start()
+
+    def __exit__(self, *exc):
+        """Shut the server down and close its socket."""
+        self.stop()
+
+    def expire_sessions(self):
+        """Forget every session, as SwarmUI does when it restarts."""
+        with self._lock:
+            self.sessions.clear()
+
+    def _count(self, route: str):
+        with self._lock:
+            self.calls[route] = self.calls.get(route, 0) + 1
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, body: dict, status: int = 200):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                route = self.path.rsplit("/", 1)[-1]
+                server._count(route)
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                self._json(server.handle_api(route, payload))
+
+            def do_GET(self):
+                if self.headers.get("Upgrade", "").lower() == "websocket":
+                    route = self.path.rsplit("/", 1)[-1]
+                    server._count(route)
+                    self._upgrade()
+                    server.serve_websocket(route, self.connection)
+                    self.close_connection = True
+                    return
+                path = self.path.lstrip("/")
+                data = server.images.get(path)
+                if data is None:
+                    self.send_error(404)
+                    return
+                time.sleep(server.download_latency)
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _upgrade(self):
+                accept = base64.b64encode(
+                    hashlib.sha1((self.headers["Sec-WebSocket-Key"] + WS_MAGIC).encode()).digest()
+                ).decode()
+                self.send_response(101)
+                self.send_header("Upgrade", "websocket")
+                self.send_header("Connection", "Upgrade")
+                self.send_header("Sec-WebSocket-Accept", accept)
+                self.end_headers()
+                with server._lock:
+                    server.ws_connections += 1
+
+        return Handler
+
+    def handle_api(self, route: str, payload: dict) -> dict:
+        if route == "GetNewSession":
+            time.sleep(self.session_latency)
+            session_id = uuid.uuid4().hex
+            with self._lock:
+                self.sessions.add(session_id)
+            return {"session_id": session_id}
+        if payload.get("session_id") not in self.sessions:
+            return {"error_id": "invalid_session_id", "error": "Invalid session ID. You may need to refresh."}
+        if route == "GetCurrentStatus":
+            return {"status": {"waiting_gens": 0, "loading_models": 0, "waiting_backends": 0, "live_gens": 0}}
+        if route == "ListModels":
+            return {"folders": [], "files": [{"name": name} for name in self.models]}
+        if route == "ListBackends":
+            return {"0": {"id": 0, "type": "comfyui_selfstart", "status": "running", "current_model": self.loaded_model}}
+        if route == "SelectModel":
+            self._load(payload.get("model"))
+            return {"success": True}
+        return {"error": f"Unknown route {route}"}
+
+    def _load(self, model: str):
+        with self._gpu:
+            start = time.perf_counter()
+            self._load_locked(model)
+            self.busy_seconds += time.perf_counter() - start
+
+    def _load_locked(self, model: str):
+        if model != self.loaded_model:
+            time.sleep(self.load_latency)
+            self.loaded_model = model
+            self._count("model_load")
+
+    def _generate(self, payload: dict, send):
+        images = int(payload.get("images") or 1)
+        steps = int(payload.get("steps") or 1)
+        seed = int(payload.get("seed", -1))
+        send({"status": {"waiting_gens": images, "live_gens": 0}})
+        with self._gpu:
+            start = time.perf_counter()
+            self._render(payload.get("model"), images, steps, seed, send)
+            self.busy_seconds += time.perf_counter() - start
+        send({"status": {"waiting_gens": 0, "live_gens": 0}})
+
+    def _render(self, model: str, images: int, steps: int, seed: int, send):
+        self._load_locked(model)
+        for index in range(images):
+            image_seed = seed + index if seed >= 0 else int.from_bytes(os.urandom(3), "big")
+            for step in range(steps):
+                time.sleep(self.step_latency)
+                send({"gen_progress": {
+                    "batch_index": str(index),
+                    "overall_percent": (index + (step + 1) / steps) / images,
+                    "current_percent": (step + 1) / steps,
+                }})
+            path = f"View/local/raw/{image_seed}-{uuid.uuid4().hex[:8]}.png"
+            self.images[path] = tiny_png(image_seed)
+            send({"image": {"image": path, "batch_index": str(index), "metadata": json.dumps({"seed": image_seed})}})
+
+    def serve_websocket(self, route: str, conn):
+        reader = conn.makefile("rb")
+
+        def send(body: dict):
+            _send_frame(conn, 0x1, json.dumps(body).encode())
+
+        while True:
+            frame = _read_frame(reader)
+            if frame is None:
+                return
+            opcode, data = frame
+            if opcode == 0x8:
+                _send_frame(conn, 0x8, data[:2])
+                return
+            if opcode == 0x9:
+                _send_frame(conn, 0xA, data)
+                continue
+            if opcode != 0x1:
+                continue
+            payload = json.loads(data)
+            if payload.get("session_id") not in self.sessions:
+                send({"error_id": "invalid_session_id", "error": "Invalid session ID. You may need to refresh."})
+            elif route == "SelectModelWS":
+                self._load(payload.get("model"))
+                send({"success": True})
+            elif route == "GenerateText2ImageWS":
+                self._generate(payload, send)
+            else:
+                send({"error": f"Unknown route {route}"})
+            if self.close_after_command:
+                _send_frame(conn, 0x8, struct.pack(">H", 1000))
+                return
+
+
+def _read_frame(reader: io.BufferedReader) -> Optional[tuple[int, bytes]]:
+    header = reader.read(2)
+    if len(header) < 2:
+        return None
+    opcode = header[0] & 0x0F
+    length = header[1] & 0x7F
+    if length == 126:
+        length = struct.unpack(">H", reader.read(2))[0]
+    elif length == 127:
+        length = struct.unpack(">Q", reader.read(8))[0]
+    mask = reader.read(4) if header[1] & 0x80 else b"\0\0\0\0"
+    data = bytearray(reader.read(length))
+    for i in range(len(data)):
+        data[i] ^= mask[i % 4]
+    return opcode, bytes(data)
+
+
+def _send_frame(conn, opcode: int, data: bytes):
+    header = bytes([0x80 | opcode])
+    if len(data) < 126:
+        header += bytes([len(data)])
+    elif len(data) < 65536:
+        header += bytes([126]) + struct.pack(">H", len(data))
+    else:
+        header += bytes([127]) + struct.pack(">Q", len(data))
+    conn.sendall(header + data)
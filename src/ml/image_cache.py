@@ -0,0 +1,113 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+from typing import Optional
+
+import media
+from utils import logger
+
+
+class ImageCache:
+    """Cache of deterministic renders, keyed by a hash of everything that affects the pixels.
+
+    Entries are hardlinks to the rendered files named `<key>-<original name>`, so a hit can be
+    put back under its original, seed carrying name without copying. The least recently used
+    entries are evicted once the cache grows past `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(
+            model: str,
+            prompt: str,
+            neg_prompt: str,
+            seed: int,
+            width: int,
+            height: int,
+            steps: int,
+            cfgscale: float,
+            sampler: str,
+            scheduler: str
+        ) -> str:
+        params = {
+            "model": model,
+            "prompt": prompt,
+            "neg_prompt": neg_prompt,
+            "seed": seed,
+            "width": width,
+            "height": height,
+            "steps": steps,
+            "cfgscale": cfgscale,
+            "sampler": sampler,
+            "scheduler": scheduler,
+        }
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _entries(self) -> list[str]:
+        return glob.glob(os.path.join(self.cache_dir, "*", "*"))
+
+    def _find(self, key: str) -> Optional[str]:
+        matches = glob.glob(os.path.join(self.cache_dir, key[:2], f"{key}-*"))
+        return matches[0] if matches else None
+
+    def get(self, key: str, dest_folder: str) -> Optional[str]:
+        """Return the cached render as a file in `dest_folder`, or None on a miss."""
+        with self._lock:
+            entry = self._find(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Touch the entry so eviction sees it as recently used
+            os.utime(entry)
+            filename = os.path.join(dest_folder, os.path.basename(entry)[len(key) + 1:])
+            try:
+                if not os.path.exists(filename) or not os.path.samefile(entry, filename):
+                    os.makedirs(dest_folder, exist_ok=True)
+                    tmp_path = f"{filename}.{threading.get_ident()}.tmp"
+                    os.link(entry, tmp_path)
+                    os.replace(tmp_path, filename)
+            except OSError as e:
+                logger.warning(f"Could not restore cached image {entry}: {e}")
+                return None
+        logger.info(f"Image cache hit {key[:12]}, reusing {filename}")
+        return filename
+
+    def put(self, key: str, path: str):
+        """Remember the render for `key`, evicting old entries if the cache is full."""
+        entry = os.path.join(self.cache_dir, key[:2], f"{key}-{os.path.basename(path)}")
+        with self._lock:
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            if self._find(key):
+                return
+            try:
+                os.link(path, entry)
+            except OSError as e:
+                logger.warning(f"Could not cache image {path}: {e}")
+                return
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in self._entries():
+            try:
+                stat = os.stat(entry)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            logger.debug(f"Evicting cached image {entry}")
+            # Also drops the stored copy once no profile or scenario uses the image
+            media.remove(entry)
+            total -= size
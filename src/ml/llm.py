@@ -1,5 +1,7 @@
 import ast
-from typing import Optional, Type
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional, Type
 
 import instructor
 import litellm
@@ -12,17 +14,30 @@ from langfuse.decorators import observe
 from litellm import supports_response_schema, acompletion, completion, aembedding, embedding
 from pydantic import BaseModel, SecretStr, ConfigDict, model_validator
 from typing_extensions import Self
-from tenacity import (
-    retry,
-    stop_after_attempt,
-    wait_fixed,
-    retry_if_exception_type,
-)
-
+from ml.resilience import register_probe, resilient, timeout
+from ml.telemetry import call_metadata, llm_call_logger, track_request
+from ml.vram_scheduler import LLM
 from utils import settings, logger, docker_client
 
 OLLAMA_CONTAINER = "ollama"
 
+# Record latency and token metrics for every completion
+if llm_call_logger not in litellm.callbacks:
+    litellm.callbacks.append(llm_call_logger)
+
+# Errors worth retrying: the server is busy, starting or unreachable
+TRANSIENT_ERRORS = (
+    litellm.exceptions.RateLimitError,
+    litellm.APIConnectionError,
+    litellm.exceptions.ServiceUnavailableError,
+    litellm.exceptions.Timeout,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
+
+# Ollama answers its model list as soon as it can serve requests
+register_probe(LLM, lambda: requests.get(f"{settings.INFERENCE_BASE_URL}/api/tags", timeout=2).ok)
+
 def start_ollama_container():
     """Start the Ollama container if not already running."""
     containers = docker_client.containers.list(all=True)
@@ -47,19 +62,14 @@ def start_ollama_container():
         except docker.errors.APIError as e:
             logger.error(f"Error starting {OLLAMA_CONTAINER} container: {e}")
 
-@retry(
-    wait=wait_fixed(30),
-    stop=stop_after_attempt(2),
-    after=lambda retry_state: logger.warning(
-        f"Retrying list Ollama models due to error: {retry_state.outcome.exception()}"
-    ),
-)
+@resilient(LLM, retry_on=TRANSIENT_ERRORS)
 def list_ollama_models():
     """List all models available in the Ollama container."""
     start_ollama_container()
     response = requests.get(
         f"{settings.INFERENCE_BASE_URL}/api/tags",
         headers={"Accept": "application/json"},
+        timeout=timeout(30),
     )
     if response.status_code != 200:
         logger.error(f"Failed to list Ollama models: {response.status_code} - {response.text}")
@@ -144,6 +154,8 @@ class InferenceLLMConfig(BaseModel):
     temperature: Optional[float] = None
     seed: int = 1729
     max_tokens: Optional[int] = None
+    # Label used to group latency and token metrics (e.g. profile, scenario, scene, chat)
+    task: Optional[str] = None
 
     @model_validator(mode="after")
     def init_client(self) -> Self:
@@ -176,13 +188,10 @@ class InferenceLLMConfig(BaseModel):
         )
 
     @observe(as_type="generation")
-    @retry(
-        wait=wait_fixed(60),
-        stop=stop_after_attempt(6),
-        retry=retry_if_exception_type(
-            (litellm.exceptions.RateLimitError, instructor.exceptions.InstructorRetryException)
-        ),
-    )
+    @track_request
+    # A reply that does not fit the schema is asked for again without tripping the breaker
+    @resilient(LLM, retry_on=(instructor.exceptions.InstructorRetryException,), breaker=False)
+    @resilient(LLM, retry_on=TRANSIENT_ERRORS)
     async def a_generate_from_messages(
         self, messages: list, schema: Type[BaseModel] = None, *args, **kwargs
     ):
@@ -195,6 +204,8 @@ class InferenceLLMConfig(BaseModel):
                     base_url=self.base_url,
                     messages=messages,
                     response_format=schema,
+                    timeout=timeout(settings.INFERENCE_REQUEST_TIMEOUT_SECONDS),
+                    metadata=call_metadata(self.task),
                 )
                 if res.choices[0].finish_reason == "content_filter":
                     raise ValueError(f"Response filtred by content filter")
@@ -210,6 +221,8 @@ class InferenceLLMConfig(BaseModel):
                     base_url=self.base_url,
                     messages=messages,
                     response_model=schema,
+                    timeout=timeout(settings.INFERENCE_REQUEST_TIMEOUT_SECONDS),
+                    metadata=call_metadata(self.task),
                 )
                 return res
         else:
@@ -218,6 +231,8 @@ class InferenceLLMConfig(BaseModel):
                 api_key=self.api_key.get_secret_value(),
                 base_url=self.base_url,
                 messages=messages,
+                timeout=timeout(settings.INFERENCE_REQUEST_TIMEOUT_SECONDS),
+                metadata=call_metadata(self.task),
             )
             return res.choices[0].message.content
 
@@ -227,18 +242,10 @@ class InferenceLLMConfig(BaseModel):
         return self.generate_from_messages(messages=messages, schema=schema, *args, **kwargs)
 
     @observe(as_type="generation")
-    @retry(
-        wait=wait_fixed(30),
-        stop=stop_after_attempt(3),
-        retry=retry_if_exception_type(
-            (litellm.exceptions.RateLimitError,
-             litellm.APIConnectionError,
-             instructor.exceptions.InstructorRetryException)
-        ),
-        after=lambda retry_state: logger.warning(
-            f"Retrying generation due to error: {retry_state.outcome.exception()}"
-        ),
-    )
+    @track_request
+    # A reply that does not fit the schema is asked for again without tripping the breaker
+    @resilient(LLM, retry_on=(instructor.exceptions.InstructorRetryException,), breaker=False)
+    @resilient(LLM, retry_on=TRANSIENT_ERRORS)
     def generate_from_messages(
         self, messages: list, schema: Type[BaseModel] = None, *args, **kwargs
     ):
@@ -252,6 +259,8 @@ class InferenceLLMConfig(BaseModel):
                     base_url=self.base_url,
                     messages=messages,
                     response_format=schema,
+                    timeout=timeout(settings.INFERENCE_REQUEST_TIMEOUT_SECONDS),
+                    metadata=call_metadata(self.task),
                 )
                 if res.choices[0].finish_reason == "content_filter":
                     raise ValueError(f"Response filtred by content filter")
@@ -266,6 +275,8 @@ class InferenceLLMConfig(BaseModel):
                     base_url=self.base_url,
                     messages=messages,
                     response_model=schema,
+                    timeout=timeout(settings.INFERENCE_REQUEST_TIMEOUT_SECONDS),
+                    metadata=call_metadata(self.task),
                 )
                 return res
         else:
@@ -274,9 +285,73 @@ class InferenceLLMConfig(BaseModel):
                 api_key=self.api_key.get_secret_value(),
                 base_url=self.base_url,
                 messages=messages,
+                timeout=timeout(settings.INFERENCE_REQUEST_TIMEOUT_SECONDS),
+                metadata=call_metadata(self.task),
             )
             return res.choices[0].message.content
 
+    @observe(as_type="generation")
+    @track_request
+    def stream_from_messages(self, messages: list, *args, **kwargs) -> Iterator[str]:
+        """Yield the reply text piece by piece as the model generates it.
+
+        Only the request itself is retried; once text has been yielded a failure is raised,
+        since the consumer may already have acted on the partial reply.
+        """
+        @resilient(LLM, retry_on=TRANSIENT_ERRORS)
+        def start():
+            return litellm.completion(
+                model=self.model_name,
+                api_key=self.api_key.get_secret_value(),
+                base_url=self.base_url,
+                messages=messages,
+                temperature=self.temperature,
+                stream=True,
+                timeout=timeout(settings.INFERENCE_REQUEST_TIMEOUT_SECONDS),
+                metadata=call_metadata(self.task),
+            )
+
+        for chunk in start():
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    @observe(as_type="generation")
+    @track_request
+    @resilient(LLM, retry_on=TRANSIENT_ERRORS)
+    def generate_candidates_from_messages(self, messages: list, n: int = 1, *args, **kwargs) -> list[str]:
+        """Generate up to `n` alternative completions for the same messages.
+
+        The `n` parameter is sent in a single request. Backends that ignore it (e.g. Ollama)
+        return one choice, so the missing candidates are requested in parallel slots with
+        different seeds.
+        """
+        def complete(seed: int, choices: int = 1):
+            return litellm.completion(
+                model=self.model_name,
+                api_key=self.api_key.get_secret_value(),
+                base_url=self.base_url,
+                messages=messages,
+                temperature=self.temperature,
+                seed=seed,
+                n=choices,
+                drop_params=True,
+                timeout=timeout(settings.INFERENCE_REQUEST_TIMEOUT_SECONDS),
+                metadata=call_metadata(self.task),
+            )
+
+        res = complete(self.seed, n)
+        candidates = [choice.message.content for choice in res.choices if choice.message.content]
+        missing = n - len(candidates)
+        if missing > 0:
+            seeds = range(self.seed + 1, self.seed + 1 + missing)
+            with ThreadPoolExecutor(max_workers=missing) as pool:
+                # Run each in a copy of this context, so the requests see the caller's deadline
+                futures = [pool.submit(contextvars.copy_context().run, complete, seed) for seed in seeds]
+                for res in (future.result() for future in futures):
+                    if res.choices[0].message.content:
+                        candidates.append(res.choices[0].message.content)
+        return candidates[:n]
+
     def get_model_name(self, *args, **kwargs) -> str:
         return self.model_name
 
@@ -0,0 +1,294 @@
+"""Retries and circuit breakers shared by the calls to the LLM, image and TTS backends.
+
+Each backend has a circuit breaker. After `BREAKER_FAILURES` failed calls in a row it opens,
+and calls to that backend fail at once with CircuitOpenError instead of every caller waiting
+through its own retries. After `BREAKER_RESET_SECONDS` one trial call is let through, and its
+outcome closes or reopens the breaker.
+
+Failed calls are retried after a jittered exponential backoff that starts in milliseconds, so
+a dropped connection recovers almost at once. When the backend has a readiness probe that
+reports it as not ready, e.g. while its container boots or loads a model, the retry waits for
+the probe instead of guessing a delay. Retries never run past the deadline set with
+`deadline()`, which also caps request timeouts through `timeout()`.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import inspect
+import random
+import threading
+import time
+from typing import Callable, Iterator, Optional
+
+from pydantic import BaseModel
+
+from utils import logger, settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("resilience_deadline", default=None)
+
+
+class CircuitOpenError(RuntimeError):
+    """The backend failed repeatedly, calls are refused until its breaker resets."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """There is no time left before the deadline to make or retry the call."""
+
+
+class BackendStats(BaseModel):
+    """Counters of the calls to one backend since the process started."""
+
+    backend: str
+    state: str = CLOSED
+    calls: int = 0
+    failures: int = 0
+    retries: int = 0
+    rejected: int = 0  # Calls refused while the breaker was open
+    consecutive_failures: int = 0
+    opened_at: Optional[float] = None
+    last_error: Optional[str] = None
+
+
+class CircuitBreaker:
+    """Tracks the failures of one backend and refuses calls while it looks down."""
+
+    def __init__(self, backend: str, failures: Optional[int] = None, reset_seconds: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failures = failures or settings.BREAKER_FAILURES
+        self.reset_seconds = reset_seconds if reset_seconds is not None else settings.BREAKER_RESET_SECONDS
+        self.clock = clock
+        self.stats = BackendStats(backend=backend)
+        self._opened = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        return self.stats.state
+
+    def allow(self):
+        """Raise CircuitOpenError unless a call may go through now."""
+        with self._lock:
+            if self.stats.state == OPEN and self.clock() - self._opened >= self.reset_seconds:
+                self.stats.state = HALF_OPEN
+                self._trial = False
+            if self.stats.state == OPEN or (self.stats.state == HALF_OPEN and self._trial):
+                self.stats.rejected += 1
+                raise CircuitOpenError(
+                    f"The {self.stats.backend} backend is unavailable after {self.stats.consecutive_failures} "
+                    f"failed calls: {self.stats.last_error}"
+                )
+            if self.stats.state == HALF_OPEN:
+                self._trial = True
+            self.stats.calls += 1
+
+    def success(self):
+        with self._lock:
+            if self.stats.state != CLOSED:
+                logger.info(f"The {self.stats.backend} backend recovered, closing its circuit breaker")
+            self.stats.state = CLOSED
+            self.stats.consecutive_failures = 0
+            self.stats.opened_at = None
+            self._trial = False
+
+    def release(self):
+        """End a call that has no outcome, e.g. it ran out of time, so a new trial call may go through."""
+        with self._lock:
+            self._trial = False
+
+    def failure(self, error: BaseException):
+        with self._lock:
+            self.stats.failures += 1
+            self.stats.consecutive_failures += 1
+            self.stats.last_error = f"{type(error).__name__}: {error}"
+            if self.stats.state == HALF_OPEN or self.stats.consecutive_failures >= self.failures:
+                if self.stats.state != OPEN:
+                    logger.error(f"Opening the circuit breaker of the {self.stats.backend} backend: "
+                                 f"{self.stats.last_error}")
+                self.stats.state = OPEN
+                self.stats.opened_at = time.time()
+                self._opened = self.clock()
+                self._trial = False
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_probes: dict[str, Callable[[], bool]] = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(backend: str) -> CircuitBreaker:
+    with _registry_lock:
+        if backend not in _breakers:
+            _breakers[backend] = CircuitBreaker(backend)
+        return _breakers[backend]
+
+
+def backend_stats() -> list[BackendStats]:
+    """A snapshot of the counters of every backend called so far."""
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return [breaker.stats.model_copy() for breaker in breakers]
+
+
+def register_probe(backend: str, probe: Callable[[], bool]):
+    """Set the cheap check of whether `backend` is up and able to serve calls."""
+    with _registry_lock:
+        _probes[backend] = probe
+
+
+def is_ready(backend: str) -> Optional[bool]:
+    """What the readiness probe of `backend` says, or None without a probe."""
+    probe = _probes.get(backend)
+    if probe is None:
+        return None
+    try:
+        return bool(probe())
+    except Exception:
+        return False
+
+
+@contextlib.contextmanager
+def deadline(seconds: float):
+    """Give the calls in this block, retries included, at most `seconds` from now.
+
+    Nested deadlines can only shorten the one around them.
+    """
+    at = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(at if outer is None else min(at, outer))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None without one."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def timeout(default: Optional[float] = None) -> Optional[float]:
+    """Timeout for a request, `default` shortened to end at the deadline."""
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("The deadline passed before the request was sent")
+    return left if default is None else min(default, left)
+
+
+def backoff(attempt: int) -> float:
+    """Full jitter exponential backoff before retry `attempt`, starting at 1."""
+    return random.uniform(0, min(settings.RETRY_MAX_SECONDS, settings.RETRY_BASE_SECONDS * 2 ** (attempt - 1)))
+
+
+def _pauses(backend: str, attempt: int, error: BaseException) -> Iterator[float]:
+    """The sleeps before the next attempt: the backoff, then polls until the backend is ready."""
+    waits = [backoff(attempt)]
+    waited = 0.0
+    while True:
+        for pause in waits:
+            left = remaining()
+            if left is not None and left < pause:
+                raise DeadlineExceeded(f"No time left to retry the {backend} call: {error}") from error
+            waited += pause
+            yield pause
+        if is_ready(backend) is not False or waited >= settings.RETRY_READY_TIMEOUT_SECONDS:
+            return
+        logger.info(f"Waiting for the {backend} backend to become ready")
+        waits = [settings.RETRY_READY_POLL_SECONDS]
+
+
+def resilient(backend: str, retry_on: tuple = (Exception,), attempts: Optional[int] = None, breaker: bool = True):
+    """Retry calls to `backend` that raise `retry_on`, guarded by the backend's circuit breaker.
+
+    Other exceptions mean the backend answered but rejected the request, so they are raised
+    at once and do not count against the breaker. Set `breaker` to False for retries of a
+    bad reply, e.g. JSON that does not parse, where the backend itself is fine.
+    """
+    def decorate(fn):
+        def attempts_of() -> Iterator[tuple[int, int, Optional[CircuitBreaker]]]:
+            total = attempts or settings.RETRY_ATTEMPTS
+            guard = get_breaker(backend) if breaker else None
+            for attempt in range(1, total + 1):
+                if guard:
+                    guard.allow()
+                yield attempt, total, guard
+
+        def failed(guard, attempt, total, error) -> bool:
+            """Record a failed attempt. Returns whether to retry it."""
+            if guard:
+                guard.failure(error)
+            if attempt >= total or (guard and guard.state == OPEN):
+                return False
+            if guard:
+                guard.stats.retries += 1
+            logger.warning(f"Retrying {fn.__name__} on the {backend} backend after attempt {attempt} of {total} "
+                           f"failed: {error}")
+            return True
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                for attempt, total, guard in attempts_of():
+                    try:
+                        result = await fn(*args, **kwargs)
+                    except DeadlineExceeded:
+                        if guard:
+                            guard.release()
+                        raise
+                    except retry_on as e:
+                        if not failed(guard, attempt, total, e):
+                            raise
+                        for pause in _pauses(backend, attempt, e):
+                            await asyncio.sleep(pause)
+                        continue
+                    except Exception:
+                        if guard:
+                            guard.success()
+                        raise
+                    except BaseException:
+                        # Cancelled or interrupted, the backend gave no answer either way
+                        if guard:
+                            guard.release()
+                        raise
+                    if guard:
+                        guard.success()
+                    return result
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                for attempt, total, guard in attempts_of():
+                    try:
+                        result = fn(*args, **kwargs)
+                    except DeadlineExceeded:
+                        if guard:
+                            guard.release()
+                        raise
+                    except retry_on as e:
+                        if not failed(guard, attempt, total, e):
+                            raise
+                        for pause in _pauses(backend, attempt, e):
+                            time.sleep(pause)
+                        continue
+                    except Exception:
+                        if guard:
+                            guard.success()
+                        raise
+                    except BaseException:
+                        # Cancelled or interrupted, the backend gave no answer either way
+                        if guard:
+                            guard.release()
+                        raise
+                    if guard:
+                        guard.success()
+                    return result
+        return wrapper
+    return decorate
@@ -1,66 +1,590 @@
+import contextvars
+import hashlib
 import os
-from typing import Optional
+from typing import Any, Callable, Iterable, Optional
 import time
+import threading
 import requests
+import requests.adapters
 import websocket
 import json
 import docker
 import re
+import select
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+import media
+from ml.image_cache import ImageCache
+from ml.resilience import timeout
 from utils import docker_client, logger, settings
 
 FILES_DIR = os.path.join(os.path.dirname(__file__), "/kizlar-agha/files/images")
 PROMPT = "A futuristic cityscape at sunset"
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+TARGET_PARAMS = {
+    "width": 1024,
+    "height": 1024,
+    "steps": 12,
+    "cfgscale": 4,
+    "sampler": "euler_ancestral",
+    "scheduler": "karras",
+}
+NEGATIVE_PROMPT = "logo timestamp artist name artist watermark web address copyright " \
+    "notice emblem comic title character border dog cow butterfly loli child kids teens text"
 
-def start_swarmui_session() -> Optional[str]:
-    """Start a new SwarmUI session. Returns session_id."""
-    # Check if the SwarmUI container is available
+class SessionExpiredError(Exception):
+    """Raised when SwarmUI no longer recognises the session id."""
+
+
+def _raise_for_session_error(response: dict):
+    if isinstance(response, dict) and response.get("error_id") == "invalid_session_id":
+        raise SessionExpiredError(response.get("error", "invalid_session_id"))
+
+
+def start_swarmui_container() -> bool:
+    """Start the SwarmUI container if it is not running. Returns whether it is available."""
     containers = docker_client.containers.list(all=True)
     if settings.SWARMUI_CONTAINER not in [c.name for c in containers]:
         logger.warning(f"{settings.SWARMUI_CONTAINER} not available. Available containers:")
         for container in containers:
             logger.warning(f"- {container.name}")
-        return
-    # Get the swarmui container
+        return False
     swarmui = docker_client.containers.get(settings.SWARMUI_CONTAINER)
     if swarmui.status == "running":
         logger.info(f"Container {settings.SWARMUI_CONTAINER} is running.")
-        # Try to get a session ID
-        r = requests.post(
-            f"{settings.SWARMUI_API_URL}/GetNewSession",
-            json={},
-            headers={'Content-type': 'application/json'}
-        )
-        if r.status_code == 200:
-            return r.json().get("session_id")
-        else:
-            logger.error(f"Error getting session ID: {r.status_code} - {r.text}")
-            return
-    else:
-        # If the container is not running, start it
-        logger.info(f"Container {settings.SWARMUI_CONTAINER} is not running. Starting it..")
+        return True
+    logger.info(f"Container {settings.SWARMUI_CONTAINER} is not running. Starting it..")
+    try:
+        swarmui.start()
+    except docker.errors.APIError as e:
+        logger.error(f"Error starting container {settings.SWARMUI_CONTAINER}: {e}")
+        return False
+    return True
+
+
+class WebSocketPool:
+    """A small pool of reusable websocket connections per SwarmUI endpoint.
+
+    Idle connections are pinged every `heartbeat_interval` seconds and dropped when the ping
+    fails. SwarmUI may close a socket once its command completes; such sockets are simply
+    not returned to the pool, so the next call opens a fresh one.
+    """
+
+    def __init__(self, ws_url: str, size: int = 2, heartbeat_interval: float = 20.0, timeout: float = 300.0):
+        self.ws_url = ws_url
+        self.size = size
+        self.heartbeat_interval = heartbeat_interval
+        self.timeout = timeout
+        self._idle: dict[str, list[websocket.WebSocket]] = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._heartbeat = None
+        self.opened = 0
+        self.reused = 0
+
+    def _start_heartbeat(self):
+        if self._heartbeat is None and self.heartbeat_interval:
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True, name="swarmui-ws-heartbeat")
+            self._heartbeat.start()
+
+    def _heartbeat_loop(self):
+        while not self._closed.wait(self.heartbeat_interval):
+            # Take the idle sockets out of the pool while they are checked
+            with self._lock:
+                idle, self._idle = self._idle, {}
+            for endpoint, conns in idle.items():
+                for ws in conns:
+                    if self._alive(ws):
+                        self.release(endpoint, ws)
+                    else:
+                        logger.debug(f"Dropping dead {endpoint} websocket")
+                        self._close(ws)
+
+    @staticmethod
+    def _alive(ws: websocket.WebSocket) -> bool:
+        timeout = ws.gettimeout()
         try:
-            docker_client.containers.get(settings.SWARMUI_CONTAINER).start()
-        except docker.errors.APIError as e:
-            logger.error(f"Error starting container {settings.SWARMUI_CONTAINER}: {e}")
-            return
-        # Try to get a session ID
+            ws.ping()
+            ws.settimeout(5)
+            opcode, _ = ws.recv_data_frame(True)
+            return opcode == websocket.ABNF.OPCODE_PONG
+        except Exception:
+            return False
+        finally:
+            if ws.connected:
+                ws.settimeout(timeout)
+
+    @staticmethod
+    def _close(ws: websocket.WebSocket):
+        try:
+            ws.close()
+        except Exception:
+            pass
+
+    def acquire(self, endpoint: str) -> websocket.WebSocket:
+        """Get a connected websocket for the endpoint, reusing an idle one if possible."""
+        while True:
+            with self._lock:
+                conns = self._idle.get(endpoint, [])
+                ws = conns.pop() if conns else None
+            if ws is None:
+                break
+            if ws.connected:
+                self.reused += 1
+                return ws
+            self._close(ws)
+        self._start_heartbeat()
+        self.opened += 1
+        return websocket.create_connection(f"{self.ws_url}/{endpoint}", timeout=timeout(self.timeout))
+
+    def release(self, endpoint: str, ws: websocket.WebSocket, reusable: bool = True):
+        """Return a websocket to the pool, closing it when it cannot be reused or the pool is full.
+
+        A socket that still has unread frames belongs to an unfinished command and is closed.
+        """
+        if reusable and ws.connected and not self._closed.is_set() and not self._has_pending(ws):
+            with self._lock:
+                conns = self._idle.setdefault(endpoint, [])
+                if len(conns) < self.size:
+                    conns.append(ws)
+                    return
+        self._close(ws)
+
+    @staticmethod
+    def _has_pending(ws: websocket.WebSocket) -> bool:
+        try:
+            readable, _, _ = select.select([ws.sock], [], [], 0)
+        except (OSError, TypeError, ValueError):
+            return True
+        return bool(readable)
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for ws in conns:
+                self._close(ws)
+
+
+class SwarmUIClient:
+    """Long-lived SwarmUI client that reuses its session, HTTP connections and websockets."""
+
+    def __init__(
+            self,
+            api_url: Optional[str] = None,
+            ws_url: Optional[str] = None,
+            base_url: Optional[str] = None,
+            session_ttl: Optional[float] = None,
+            ws_pool_size: Optional[int] = None,
+            heartbeat_interval: Optional[float] = None,
+            models_ttl: Optional[float] = None,
+            manage_container: bool = True
+        ):
+        self.api_url = api_url or settings.SWARMUI_API_URL
+        self.ws_url = ws_url or settings.SWARMUI_WS_URL
+        self.base_url = base_url or settings.SWARMUI_BASE_URL
+        self.session_ttl = session_ttl if session_ttl is not None else settings.SWARMUI_SESSION_TTL
+        self.models_ttl = models_ttl if models_ttl is not None else settings.SWARMUI_MODELS_TTL
+        self.manage_container = manage_container
+        pool_size = ws_pool_size or settings.SWARMUI_WS_POOL_SIZE
+        self.http = requests.Session()
+        # Room for the API calls plus a full set of parallel image downloads
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size + settings.SWARMUI_DOWNLOAD_WORKERS,
+        )
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+        self.http.headers.update({'Content-type': 'application/json'})
+        self.ws_pool = WebSocketPool(
+            self.ws_url,
+            size=pool_size,
+            heartbeat_interval=heartbeat_interval if heartbeat_interval is not None
+            else settings.SWARMUI_WS_HEARTBEAT_INTERVAL,
+        )
+        self._session_id: Optional[str] = None
+        self._session_used_at = 0.0
+        self._session_lock = threading.Lock()
+        # Model loaded on each SwarmUI backend, as last reported or selected
+        self._loaded_models: dict[str, Optional[str]] = {}
+        self._models_checked_at = float("-inf")
+        self._models_lock = threading.Lock()
+        self.model_loads = 0
+
+    def _new_session(self) -> Optional[str]:
+        if self.manage_container and not start_swarmui_container():
+            return None
         wait_time = 60
         for _ in range(wait_time):
             try:
-                r = requests.post(
-                    f"{settings.SWARMUI_API_URL}/GetNewSession",
-                    json={},
-                    headers={'Content-type': 'application/json'}
-                )
+                r = self.http.post(f"{self.api_url}/GetNewSession", json={},
+                                   timeout=timeout(settings.SWARMUI_REQUEST_TIMEOUT_SECONDS))
                 if r.status_code == 200:
-                    return r.json().get("session_id")
-            except Exception:
+                    session_id = r.json().get("session_id")
+                    status = self.http.post(f"{self.api_url}/GetCurrentStatus", json={"session_id": session_id},
+                                            timeout=timeout(settings.SWARMUI_REQUEST_TIMEOUT_SECONDS))
+                    logger.info(f"Started SwarmUI session {session_id}, status: {status.text}")
+                    return session_id
+                logger.error(f"Error getting session ID: {r.status_code} - {r.text}")
+            except requests.exceptions.ConnectionError:
                 pass
             time.sleep(1)
         raise RuntimeError(f"SwarmUI API did not become ready in {wait_time} seconds.")
 
+    def session_id(self, force_new: bool = False) -> Optional[str]:
+        """Return the cached session id, starting a new session if it expired or was rejected."""
+        with self._session_lock:
+            expired = time.monotonic() - self._session_used_at > self.session_ttl
+            if force_new or self._session_id is None or expired:
+                self._session_id = self._new_session()
+            self._session_used_at = time.monotonic()
+            return self._session_id
+
+    def reset(self):
+        """Forget the session and drop pooled connections (e.g. after the container stopped)."""
+        with self._session_lock:
+            self._session_id = None
+        with self._models_lock:
+            self._loaded_models = {}
+            self._models_checked_at = float("-inf")
+        self.ws_pool.close()
+        self.ws_pool = WebSocketPool(self.ws_url, size=self.ws_pool.size,
+                                     heartbeat_interval=self.ws_pool.heartbeat_interval)
+
+    def post(self, endpoint: str, payload: Optional[dict] = None, session_id: Optional[str] = None) -> Optional[dict]:
+        """Call an HTTP API route, renewing the session once if SwarmUI rejects it."""
+        for attempt in range(2):
+            sid = session_id or self.session_id(force_new=attempt > 0)
+            if not sid:
+                logger.error("Failed to start SwarmUI session.")
+                return None
+            r = self.http.post(f"{self.api_url}/{endpoint}", json={"session_id": sid, **(payload or {})},
+                               timeout=timeout(settings.SWARMUI_REQUEST_TIMEOUT_SECONDS))
+            if r.status_code != 200:
+                logger.error(f"Error calling {endpoint}: {r.status_code} - {r.text}")
+                return None
+            try:
+                response = r.json()
+                _raise_for_session_error(response)
+                return response
+            except SessionExpiredError:
+                if session_id:
+                    raise
+                logger.info("SwarmUI session expired, starting a new one.")
+        return None
+
+    def ws_events(self, endpoint: str, payload: dict, session_id: Optional[str] = None):
+        """Send a websocket command and yield its JSON events until the caller stops iterating."""
+        for attempt in range(2):
+            sid = session_id or self.session_id(force_new=attempt > 0)
+            if not sid:
+                logger.error("Failed to start SwarmUI session.")
+                return
+            ws = self.ws_pool.acquire(endpoint)
+            reusable = False
+            try:
+                ws.send(json.dumps({"session_id": sid, **payload}))
+                while True:
+                    # Each wait for an event ends at the caller's deadline
+                    ws.settimeout(timeout(self.ws_pool.timeout))
+                    try:
+                        msg = ws.recv()
+                    except websocket.WebSocketConnectionClosedException as e:
+                        logger.info(f"WebSocket closed: {e}")
+                        return
+                    except Exception as e:
+                        logger.error(f"WebSocket error: {e}")
+                        return
+                    if not msg.strip():
+                        continue  # skip empty messages
+                    try:
+                        event = json.loads(msg)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Non-JSON message received: {msg!r}")
+                        continue  # skip non-JSON messages
+                    _raise_for_session_error(event)
+                    reusable = True
+                    yield event
+                    reusable = False
+            except SessionExpiredError:
+                if session_id:
+                    raise
+                logger.info("SwarmUI session expired, starting a new one.")
+                continue
+            except GeneratorExit:
+                # The caller got what it needed, so the socket is idle again
+                reusable = True
+                raise
+            finally:
+                self.ws_pool.release(endpoint, ws, reusable=reusable)
+            return
+
+    def get_current_status(self, session_id: Optional[str] = None) -> Optional[dict]:
+        """Get the current status of the SwarmUI session."""
+        return self.post("GetCurrentStatus", session_id=session_id)
+
+    def list_models(self, session_id: Optional[str] = None) -> Optional[list[str]]:
+        """List available models in SwarmUI."""
+        response = self.post(
+            "ListModels",
+            {
+                "path": "",  # Empty path to use root
+                "depth": 2
+            },
+            session_id=session_id,
+        )
+        if response is None:
+            return None
+        return [model["name"] for model in response.get("files", [])]
+
+    def select_model(self, model: str, session_id: Optional[str] = None):
+        """Forcibly loads a model immediately on some or all backends."""
+        response = self.post("SelectModel", {"model": model}, session_id=session_id)
+        if response and response.get("success"):
+            logger.info(f"Model {model} loaded")
+            self._remember_model(model)
+        else:
+            logger.warning(f"Error loading model {model}: {response}")
+
+    def loaded_models(self, refresh: bool = True) -> dict[str, Optional[str]]:
+        """Model loaded on each SwarmUI backend, keyed by backend id.
+
+        The backends are asked through `ListBackends`. When that fails or does not report
+        models, the last known state from this client's own selections is returned.
+        """
+        if refresh:
+            reported = _backend_models(self.post("ListBackends"))
+            with self._models_lock:
+                self._models_checked_at = time.monotonic()
+                if reported:
+                    self._loaded_models = reported
+        with self._models_lock:
+            return dict(self._loaded_models)
+
+    def _models_stale(self) -> bool:
+        with self._models_lock:
+            return time.monotonic() - self._models_checked_at > self.models_ttl
+
+    def ensure_model(self, model: str, session_id: Optional[str] = None) -> bool:
+        """Load a model unless a backend already has it. Returns whether a load was issued.
+
+        The backends are only asked again through `ListBackends` when the model is missing from
+        the cached state or that state is older than `models_ttl`, so a run of images for the
+        same model does not cost an extra round trip each.
+        """
+        loaded = self.loaded_models(refresh=False)
+        if model not in loaded.values() or self._models_stale():
+            loaded = self.loaded_models()
+        if model in loaded.values():
+            logger.info(f"Model {model} is already loaded, skipping selection.")
+            return False
+        self.model_loads += 1
+        self.select_model_ws(model, session_id=session_id)
+        return True
+
+    def _remember_model(self, model: str):
+        with self._models_lock:
+            # Selecting a model loads it on every backend
+            self._loaded_models = {backend: model for backend in self._loaded_models} or {"*": model}
+
+    def select_model_ws(self, model: str, session_id: Optional[str] = None):
+        """Select a model using the SwarmUI SelectModelWS websocket API."""
+        events = self.ws_events("SelectModelWS", {"model": model}, session_id=session_id)
+        for event in events:
+            if event.get("success"):
+                logger.info(f"Model {model} loaded via websocket.")
+                self._remember_model(model)
+                break
+            else:
+                logger.warning(f"Failed to load model {model}: {event}")
+        events.close()
+
+    def generate_images_ws(
+            self,
+            model: str,
+            prompt: str,
+            neg_prompt: str = "",
+            images=1,
+            seed=-1,
+            width=1024,
+            height=1024,
+            steps=1,
+            cfgscale=1,
+            sampler="euler_ancestral",
+            scheduler="",
+            session_id: Optional[str] = None,
+            on_image: Optional[Callable[[str], Any]] = None,
+            on_progress: Optional[Callable[[dict], Any]] = None
+        ) -> list[str]:
+        """Generate images over the GenerateText2ImageWS websocket API, returning their paths.
+
+        `on_image` is called with each image path as soon as SwarmUI reports it, while the rest
+        of the batch is still rendering. `on_progress` receives every `gen_progress` event,
+        including the `preview` image SwarmUI attaches when previews are enabled.
+        """
+        logger.info("Listening for T2I websocket updates..")
+        image_paths = []
+        complete = False
+        events = self.ws_events(
+            "GenerateText2ImageWS",
+            {
+                "model": model,
+                "prompt": prompt,
+                "negativeprompt": neg_prompt,
+                "images": images,
+                "seed": seed,
+                "width": width,
+                "height": height,
+                "steps": steps,
+                "cfgscale": cfgscale,
+                "sampler": sampler,
+                "scheduler": scheduler
+            },
+            session_id=session_id,
+        )
+        for event in events:
+            if event.get("status"):
+                # Print the status of the event
+                logger.info(f"Status: {event['status']}")
+            if event.get("gen_progress"):
+                if on_progress:
+                    on_progress(event["gen_progress"])
+                # Print the generation progress
+                logger.debug(f"Generation progress: batch_index: {event['gen_progress']['batch_index']}, "
+                            f"overall_percent: {event['gen_progress']['overall_percent']}, "
+                            f"current_percent: {event['gen_progress']['current_percent']}")
+                if event['gen_progress']['overall_percent'] == 1.0 and event['gen_progress']['batch_index'] == str(images-1):
+                    complete = True
+                    continue
+            if event.get("image"):
+                image_info = event["image"]
+                if isinstance(image_info, dict) and "image" in image_info:
+                    image_paths.append(image_info["image"])
+                elif isinstance(image_info, str):
+                    image_paths.append(image_info)
+                else:
+                    logger.warning(f"Unexpected image format: {image_info}")
+                    continue
+                if on_image:
+                    on_image(image_paths[-1])
+                logger.debug(f"Image paths: {image_paths}")
+                if complete or len(image_paths) >= images:
+                    logger.info("Image generation complete.")
+                    break
+        events.close()
+        if image_paths:
+            # SwarmUI loads the requested model on the backend that ran the generation
+            with self._models_lock:
+                if model not in self._loaded_models.values():
+                    self._loaded_models = {**self._loaded_models, "*": model}
+        return image_paths
+
+    def download(self, image_path: str, dest_folder: str) -> Optional[str]:
+        """Stream an image to a file in `dest_folder`, returning its path.
+
+        The body is written in chunks to a temporary file and only renamed into place once its
+        size matches Content-Length. If a different file already has the same name, a numeric
+        suffix is appended after the seed; an identical file (same sha256) is reused as is.
+        """
+        image_url = image_path if image_path.startswith("http") else f"{self.base_url}/{image_path}"
+        logger.info(f"Downloading image from {image_url} to {dest_folder}")
+        os.makedirs(dest_folder, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=dest_folder, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f, self.http.get(image_url, stream=True, timeout=timeout(60)) as r:
+                r.raise_for_status()
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                expected_size = r.headers.get("Content-Length")
+            if expected_size is not None and int(expected_size) != size:
+                raise IOError(f"Incomplete download of {image_url}: got {size} of {expected_size} bytes")
+            filename = _place_file(tmp_path, os.path.join(dest_folder, os.path.basename(image_url)), digest.hexdigest())
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        logger.info(f"Image downloaded to {filename}")
+        return filename
+
+    def close(self):
+        self.ws_pool.close()
+        self.http.close()
+
+
+_place_lock = threading.Lock()
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _place_file(tmp_path: str, filename: str, sha256: str) -> str:
+    """Atomically move a downloaded file into place without clobbering a different file."""
+    stem, ext = os.path.splitext(filename)
+    candidate = filename
+    n = 1
+    with _place_lock:
+        while os.path.exists(candidate):
+            if _file_sha256(candidate) == sha256:
+                os.remove(tmp_path)
+                return candidate
+            candidate = f"{stem}_{n}{ext}"
+            n += 1
+        os.replace(tmp_path, candidate)
+    return candidate
+
+
+def _backend_models(response: Optional[dict]) -> dict[str, Optional[str]]:
+    """Pull the current model of each backend out of a `ListBackends` response.
+
+    SwarmUI versions differ in how they name the field, so a few spellings are accepted and
+    backends that are not running are left out.
+    """
+    if not isinstance(response, dict):
+        return {}
+    models = {}
+    for backend_id, info in response.items():
+        if not isinstance(info, dict):
+            continue
+        if str(info.get("status", "running")).lower() not in ("running", "loaded", "idle"):
+            continue
+        for field in ("current_model", "current_model_name", "CurrentModelName", "model"):
+            if field in info:
+                models[str(info.get("id", backend_id))] = info[field] or None
+                break
+    return models
+
+
+_client: Optional[SwarmUIClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> SwarmUIClient:
+    """Shared SwarmUI client for the configured server."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SwarmUIClient()
+        return _client
+
+
+def start_swarmui_session() -> Optional[str]:
+    """Start (or reuse) a SwarmUI session. Returns session_id."""
+    return get_client().session_id()
+
 def stop_swarmui():
     """Stop the SwarmUI container."""
+    get_client().reset()
     try:
         swarmui = docker_client.containers.get(settings.SWARMUI_CONTAINER)
         if swarmui.status == "running":
@@ -74,283 +598,308 @@ def stop_swarmui():
     except docker.errors.APIError as e:
         logger.error(f"Error stopping container {settings.SWARMUI_CONTAINER}: {e}")
 
-def get_current_status(session_id) -> Optional[dict]:
+def get_current_status(session_id=None) -> Optional[dict]:
     """Get the current status of the SwarmUI session."""
-    r = requests.post(
-        url=f"{settings.SWARMUI_API_URL}/GetCurrentStatus",
-        json={"session_id": session_id},
-        headers={'Content-type': 'application/json'}
-    )
-    if r.status_code == 200:
-        return r.json()
-    else:
-        logger.error(f"Error getting status: {r.status_code} - {r.text}")
-        return None
+    return get_client().get_current_status(session_id)
 
 def list_image_models(session_id: Optional[str] = None) -> Optional[list[str]]:
     """List available models in SwarmUI."""
-    if not session_id:
-        session_id = start_swarmui_session()
-        if not session_id:
-            logger.error("Failed to start SwarmUI session.")
-            return None
-    r = requests.post(
-        url=f"{settings.SWARMUI_API_URL}/ListModels",
-        json={
-            "session_id": session_id,
-            "path": "", # Empty path to use root
-            "depth": 2
-        },
-        headers={'Content-type': 'application/json'}
-    )
-    if r.status_code == 200:
-        models = r.json().get("files", [])
-        return [model["name"] for model in models]
-    else:
-        logger.error(f"Error listing models: {r.status_code} - {r.text}")
-        return None
+    return get_client().list_models(session_id)
 
 def select_model(session_id, model):
     """Forcibly loads a model immediately on some or all backends."""
-    r = requests.post(
-        url=f"{settings.SWARMUI_API_URL}/SelectModel",
-        json={
-            "session_id": session_id,
-            "model": model
-        },
-        headers={'Content-type': 'application/json'}
-    )
-    if r.status_code == 200:
-        success = r.json().get("success")
-        if (success):
-            logger.info(f"Model {model} loaded")
-        else:
-            logger.warning(r.text)
-    else:
-        logger.error(f"Error loading model: {r.status_code} - {r.text}")
+    get_client().select_model(model, session_id=session_id)
 
 def select_model_ws(session_id, model):
     """Select a model using the SwarmUI SelectModelWS websocket API."""
-    ws_url = f"{settings.SWARMUI_WS_URL}/SelectModelWS"
-    ws = websocket.create_connection(ws_url)
-    # Send the SelectModelWS command
-    ws.send(json.dumps({
-        "session_id": session_id,
-        "model": model
-    }))
-    # Wait for a response
-    while True:
-        try:
-            msg = ws.recv()
-        except websocket.WebSocketConnectionClosedException as e:
-            logger.warning(f"WebSocket closed: {e}")
-            break
-        except Exception as e:
-            logger.error(f"WebSocket error: {e}")
-            break
-        if not msg.strip():
-            continue  # skip empty messages
-        try:
-            event = json.loads(msg)
-        except json.JSONDecodeError:
-            logger.warning(f"Non-JSON message received: {msg!r}")
-            continue  # skip non-JSON messages
-        if event.get("success"):
-            logger.info(f"Model {model} loaded via websocket.")
-            break
-        else:
-            print(f"Failed to load model {model}: {event}")
-    ws.close()
+    get_client().select_model_ws(model, session_id=session_id)
 
-def generate_images_ws(
-        session_id: str,
-        model: str,
-        prompt: str,
-        neg_prompt: str = "",
-        images=1,
-        seed=-1,
-        width=1024,
-        height=1024,
-        steps=1,
-        cfgscale=1,
-        sampler="euler_ancestral",
-        scheduler=""
-    ) -> list[str]:
-    ws_url = f"{settings.SWARMUI_WS_URL}/GenerateText2ImageWS"
-    ws = websocket.create_connection(ws_url)
-    # Start image generation
-    ws.send(json.dumps(
-        {
-            "session_id": session_id,
-            "model": model,
-            "prompt": prompt,
-            "negativeprompt": neg_prompt,
-            "images": images,
-            "seed": seed,
-            "width": width,
-            "height": height,
-            "steps": steps,
-            "cfgscale": cfgscale,
-            "sampler": sampler,
-            "scheduler": scheduler
-        })
-    )
-    logger.info("Listening for T2I websocket updates..")
-    image_paths = []
-    complete = False
-    while True:
-        try:
-            msg = ws.recv()
-        except websocket.WebSocketConnectionClosedException as e:
-            logger.info(f"WebSocket closed: {e}")
-            break
-        except Exception as e:
-            logger.error(f"WebSocket error: {e}")
-            break
-        if not msg.strip():
-            continue  # skip empty messages
-        try:
-            event = json.loads(msg)
-        except json.JSONDecodeError:
-            logger.warning(f"Non-JSON message received: {msg!r}")
-            continue  # skip non-JSON messages
-        if event.get("status"):
-            # Print the status of the event
-            logger.info(f"Status: {event['status']}")
-        if event.get("gen_progress"):
-            # Print the generation progress
-            logger.info(f"Generation progress: batch_index: {event['gen_progress']['batch_index']}, "
-                        f"overall_percent: {event['gen_progress']['overall_percent']}, "
-                        f"current_percent: {event['gen_progress']['current_percent']}")
-            if event['gen_progress']['overall_percent'] == 1.0 and event['gen_progress']['batch_index'] == str(images-1):
-                complete = True
-                continue
-        if event.get("image"):
-            image_info = event["image"]
-            if isinstance(image_info, dict) and "image" in image_info:
-                image_paths.append(image_info["image"])
-            elif isinstance(image_info, str):
-                image_paths.append(image_info)
-            else:
-                logger.warning(f"Unexpected image format: {image_info}")
-            logger.debug(f"Image paths: {image_paths}")
-            if complete:
-                logger.info("Image generation complete.")
-                break
-    ws.close()
-    return image_paths
+def generate_images_ws(session_id: Optional[str], model: str, prompt: str, **kwargs) -> list[str]:
+    """Generate images over the GenerateText2ImageWS websocket API."""
+    return get_client().generate_images_ws(model, prompt, session_id=session_id, **kwargs)
 
-def generate_seed_search(session_id, model, prompt: str, num_images=1):
+def generate_seed_search(session_id, model, prompt: str, num_images=1, on_image=None, on_progress=None):
     """Generate a set of images with random seed."""
-    neg_prompt = "logo timestamp artist name artist watermark web address copyright " \
-    "notice emblem comic title character border dog cow butterfly loli child kids teens text"
     return generate_images_ws(
         session_id=session_id,
         model=model,
         prompt=prompt,
-        neg_prompt=neg_prompt,
+        neg_prompt=NEGATIVE_PROMPT,
         images=num_images,
         seed=-1,  # Random seed
         steps=9,
         cfgscale=3,
         sampler="euler_ancestral",
+        on_image=on_image,
+        on_progress=on_progress,
     )
 
-def generate_target(session_id, model, prompt: str, seed):
+def draft_params(model: str) -> dict:
+    """Draft render parameters for a model: the target parameters with fewer steps."""
+    steps = settings.SWARMUI_DRAFT_MODEL_STEPS.get(model, settings.SWARMUI_DRAFT_STEPS)
+    return {**TARGET_PARAMS, "steps": min(steps, TARGET_PARAMS["steps"])}
+
+def generate_draft(session_id, model, prompt: str, num_images=None, on_image=None, on_progress=None):
+    """Generate cheap candidate images with random seeds to pick a look from.
+
+    Drafts keep the resolution, sampler and scheduler of `generate_target` and only run fewer
+    steps, since the initial noise of a seed depends on the image size. The chosen seed then
+    re-renders as a sharper version of the same composition.
+    """
+    return generate_images_ws(
+        session_id=session_id,
+        model=model,
+        prompt=prompt,
+        neg_prompt=NEGATIVE_PROMPT,
+        images=num_images or settings.SWARMUI_DRAFT_BATCH,
+        seed=-1,  # Random seed
+        on_image=on_image,
+        on_progress=on_progress,
+        **draft_params(model),
+    )
+
+def generate_target(session_id, model, prompt: str, seed, on_image=None, on_progress=None):
     """Generate a target image with a specific seed."""
-    neg_prompt = "logo timestamp artist name artist watermark web address copyright " \
-    "notice emblem comic title character border dog cow butterfly loli child kids teens text"
     return generate_images_ws(
         session_id=session_id,
         model=model,
         prompt=prompt,
-        neg_prompt=neg_prompt,
+        neg_prompt=NEGATIVE_PROMPT,
         images=1,
         seed=seed,  # Specific seed
-        steps=12,
-        cfgscale=4,
-        sampler="euler_ancestral",
-        scheduler="karras",
+        on_image=on_image,
+        on_progress=on_progress,
+        **TARGET_PARAMS,
     )
 
 def download_image(image_path, dest_folder):
     """Download an image from a URL to a specified folder."""
-    image_url = image_path if image_path.startswith("http") else f"{settings.SWARMUI_BASE_URL}/{image_path}"
-    logger.info(f"Downloading image from {image_url} to {dest_folder}")
-    if not image_url:
+    if not image_path:
         logger.error("Image URL is empty. Cannot download.")
         return None
-    if not os.path.exists(dest_folder):
-        logger.info(f"Destination folder {dest_folder} does not exist. Creating it.")
-    if not os.path.isdir(dest_folder):
-        os.makedirs(dest_folder, exist_ok=True)
-    filename = os.path.join(dest_folder, os.path.basename(image_url))
-    r = requests.get(image_url)
-    r.raise_for_status()
-    with open(filename, "wb") as f:
-        f.write(r.content)
-    logger.info(f"Image downloaded to {filename}")
+    filename = get_client().download(image_path, dest_folder)
+    media.ingest(filename)
     return filename
 
-def image_from_prompt(
-        prompt: str,
-        model: Optional[str] = None,
-        preset: Optional[str] = None,
-        seed: Optional[int] = None
-    ):
-    """Generate an image from a prompt using SwarmUI."""
-    if not prompt:
-        logger.error("Prompt is empty. Please provide a valid prompt.")
-        return
-    logger.info(f"Generating image from prompt: {prompt} with model: {model}, preset: {preset}, seed: {seed}")
+@lru_cache(maxsize=1)
+def get_image_cache() -> ImageCache:
+    """Shared cache of deterministic renders."""
+    return ImageCache(os.path.join(FILES_DIR, "cache"), settings.SWARMUI_IMAGE_CACHE_MB * 1024 * 1024)
+
+def _cache_key(prompt, model, preset, seed) -> Optional[str]:
+    """Cache key of a render, or None when its output is not reproducible."""
+    if not settings.SWARMUI_IMAGE_CACHE_ENABLED or not model or preset != "target" or seed is None or int(seed) < 0:
+        return None
+    return ImageCache.key(model=model, prompt=prompt, neg_prompt=NEGATIVE_PROMPT, seed=int(seed), **TARGET_PARAMS)
+
+def _prepare_model(model: Optional[str]) -> tuple[Optional[str], Optional[str]]:
+    """Start (or reuse) a session and make sure the model is loaded. Returns (session_id, model)."""
     # Start a SwarmUI session
     session_id = start_swarmui_session()
     if not session_id:
         logger.error("Failed to start SwarmUI session.")
-        return
-    status = get_current_status(session_id)
-    if status:
-        logger.info(f"Current status: {status}")
-    else:
-        logger.error("Failed to get current status.")
-        return
+        return None, None
     if not model:
         models = list_image_models(session_id)
         logger.info(f"Available models: {models}")
         if not models:
             logger.error("No models available in SwarmUI.")
-            return
+            return None, None
         model = models[0]
-    select_model_ws(session_id, model)
-    image_files = []
+    get_client().ensure_model(model, session_id=session_id)
+    return session_id, model
+
+def _render(session_id, model, prompt, preset, seed, num_images, on_image, on_progress=None) -> list[str]:
+    """Run one SwarmUI generation request with the parameters of a preset."""
+    if preset == "draft":
+        logger.info(f"Generating {num_images} draft images")
+        return generate_draft(
+            session_id,
+            model,
+            prompt,
+            num_images=num_images,
+            on_image=on_image,
+            on_progress=on_progress,
+        )
     if preset == "seed_search":
         logger.info(f"Generating seed search images")
-        image_urls = generate_seed_search(
+        return generate_seed_search(
             session_id,
             model,
             prompt,
+            num_images=num_images,
+            on_image=on_image,
+            on_progress=on_progress,
         )
     elif preset == "target" and seed is not None:
         logger.info(f"Generating target image with seed: {seed}")
-        image_urls = generate_target(
+        return generate_target(
             session_id,
             model,
             prompt,
             seed,
+            on_image=on_image,
+            on_progress=on_progress,
         )
-    else:
-        logger.info("Generating random image")
-        image_urls = generate_images_ws(
-            session_id,
-            model,
-            prompt,
-        )
+    logger.info("Generating random image")
+    return generate_images_ws(
+        session_id,
+        model,
+        prompt,
+        images=num_images,
+        on_image=on_image,
+        on_progress=on_progress,
+    )
+
+def image_from_prompt(
+        prompt: str,
+        model: Optional[str] = None,
+        preset: Optional[str] = None,
+        seed: Optional[int] = None,
+        num_images: int = 1,
+        on_image: Optional[Callable[[str], Any]] = None,
+        on_progress: Optional[Callable[[dict], Any]] = None
+    ):
+    """Generate images from a prompt using SwarmUI.
+
+    All `num_images` images are rendered in a single SwarmUI request. Each one is downloaded
+    as soon as it is ready and, when given, passed to `on_image` before the next one arrives.
+    `on_progress` receives the raw SwarmUI progress events. Returns the downloaded file paths.
+    """
+    if not prompt:
+        logger.error("Prompt is empty. Please provide a valid prompt.")
+        return
+    logger.info(f"Generating {num_images} image(s) from prompt: {prompt} with model: {model}, "
+                f"preset: {preset}, seed: {seed}")
+    cache_key = _cache_key(prompt, model, preset, seed)
+    if cache_key:
+        cached = get_image_cache().get(cache_key, FILES_DIR)
+        if cached:
+            if on_image:
+                on_image(cached)
+            return [cached]
+    session_id, model = _prepare_model(model)
+    if not session_id:
+        return
     # Make sure the files directory exists
     os.makedirs(FILES_DIR, exist_ok=True)
-    for image_url in image_urls:
-        image_files.append(download_image(image_url, FILES_DIR))
+    image_files = []
+
+    def save_image(image_url: str):
+        filename = download_image(image_url, FILES_DIR)
+        image_files.append(filename)
+        if on_image:
+            on_image(filename)
+
+    _render(session_id, model, prompt, preset, seed, num_images, save_image, on_progress)
+    if cache_key and image_files:
+        get_image_cache().put(cache_key, image_files[0])
     return image_files
 
+def image_from_prompts(
+        prompts: list[str],
+        model: Optional[str] = None,
+        preset: Optional[str] = None,
+        seed: Optional[int] = None,
+        on_image: Optional[Callable[[int, str], Any]] = None,
+        on_progress: Optional[Callable[[int, dict], Any]] = None,
+        max_queued: Optional[int] = None,
+        download_workers: Optional[int] = None
+    ) -> list[list[str]]:
+    """Generate one image per prompt, keeping the SwarmUI queue full.
+
+    Up to `max_queued` prompts are submitted at once, each on its own websocket, so SwarmUI
+    always has the next render queued while earlier images are downloaded by a separate
+    worker pool. `on_image` is called with the prompt index and file path of every saved
+    image, and `on_progress` with the prompt index and each SwarmUI progress event. Returns
+    the file paths per prompt, in prompt order; failed prompts get an empty list.
+    Deterministic renders already in the image cache are not sent to SwarmUI at all.
+    """
+    return image_from_prompt_stream(prompts, model, preset, seed, on_image, on_progress, max_queued,
+                                    download_workers)
+
+def image_from_prompt_stream(
+        prompts: Iterable[str],
+        model: Optional[str] = None,
+        preset: Optional[str] = None,
+        seed: Optional[int] = None,
+        on_image: Optional[Callable[[int, str], Any]] = None,
+        on_progress: Optional[Callable[[int, dict], Any]] = None,
+        max_queued: Optional[int] = None,
+        download_workers: Optional[int] = None
+    ) -> list[list[str]]:
+    """Like `image_from_prompts`, but for prompts that are still being written.
+
+    Each prompt is submitted as soon as `prompts` yields it, so the first images render
+    while the producer works on the next prompts. The model is only prepared once the first
+    prompt that is not cached arrives. Returns after the last prompt is rendered.
+    """
+    results: list[list[str]] = []
+    cache_keys: list[Optional[str]] = []
+    todo: list[int] = []
+    rendered: dict[int, Future] = {}
+    session_id = None
+    unavailable = False
+    max_queued = max_queued or settings.SWARMUI_MAX_QUEUED_PROMPTS
+    download_workers = download_workers or settings.SWARMUI_DOWNLOAD_WORKERS
+    results_lock = threading.Lock()
+
+    with ThreadPoolExecutor(max_workers=download_workers, thread_name_prefix="swarmui-download") as downloads, \
+            ThreadPoolExecutor(max_workers=max_queued, thread_name_prefix="swarmui-render") as renders:
+        def save_image(index: int, image_url: str):
+            filename = download_image(image_url, FILES_DIR)
+            if not filename:
+                return
+            with results_lock:
+                results[index].append(filename)
+            if on_image:
+                on_image(index, filename)
+
+        def render(index: int, prompt: str) -> list[Future]:
+            pending = []
+            _render(
+                session_id, model, prompt, preset, seed, 1,
+                lambda image_url: pending.append(
+                    downloads.submit(contextvars.copy_context().run, save_image, index, image_url)),
+                (lambda progress: on_progress(index, progress)) if on_progress else None,
+            )
+            return pending
+
+        for index, prompt in enumerate(prompts):
+            with results_lock:
+                results.append([])
+            cache_key = _cache_key(prompt, model, preset, seed) if prompt else None
+            cache_keys.append(cache_key)
+            cached = get_image_cache().get(cache_key, FILES_DIR) if cache_key else None
+            if cached:
+                results[index].append(cached)
+                if on_image:
+                    on_image(index, cached)
+                continue
+            if not prompt:
+                logger.error(f"Prompt {index} is empty, skipping it.")
+                continue
+            if session_id is None and not unavailable:
+                session_id, model = _prepare_model(model)
+                unavailable = not session_id
+                os.makedirs(FILES_DIR, exist_ok=True)
+            if unavailable:
+                # Keep taking the prompts, so the producer is not left waiting
+                continue
+            todo.append(index)
+            # Run in a copy of this context, so the render and its downloads see the caller's deadline
+            rendered[index] = renders.submit(contextvars.copy_context().run, render, index, prompt)
+        for index, future in rendered.items():
+            try:
+                for download in future.result():
+                    download.result()
+            except Exception as e:
+                logger.error(f"Error generating image for prompt {index}: {e}")
+    for index in todo:
+        if cache_keys[index] and results[index]:
+            get_image_cache().put(cache_keys[index], results[index][0])
+    return results
+
 def seed_from_image(image_path: str) -> Optional[int]:
     """Extract a seed from an image filename."""
     if not image_path:
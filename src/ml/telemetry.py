@@ -0,0 +1,236 @@
+import contextvars
+import functools
+import glob
+import inspect
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Iterator, Optional
+
+import numpy as np
+from litellm.integrations.custom_logger import CustomLogger
+from pydantic import BaseModel
+
+from utils import logger, settings
+
+METRICS_DIR = os.path.join(os.path.dirname(__file__), "/kizlar-agha/files/metrics")
+LLM_CALLS_FILE = os.path.join(METRICS_DIR, "llm_calls.jsonl")
+
+_requested_at: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("requested_at", default=None)
+_sink_lock = threading.Lock()
+_sink_id: Optional[int] = None
+
+
+class LLMCallRecord(BaseModel):
+    """Timing and token counts for a single LLM completion call."""
+
+    timestamp: float
+    model: str
+    task: Optional[str] = None
+    streamed: bool = False
+    success: bool = True
+    queue_wait_ms: float = 0.0
+    ttft_ms: Optional[float] = None
+    latency_ms: float
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    tokens_per_s: Optional[float] = None
+    error: Optional[str] = None
+
+
+def _ensure_sink():
+    """Add the rotating JSON lines sink that only receives LLM metrics records."""
+    global _sink_id
+    with _sink_lock:
+        if _sink_id is not None:
+            return
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _sink_id = logger.add(
+            LLM_CALLS_FILE,
+            level="TRACE",
+            format="{message}",
+            filter=lambda record: record["extra"].get("llm_metrics", False),
+            rotation=settings.INFERENCE_METRICS_ROTATION,
+            retention=settings.INFERENCE_METRICS_RETENTION,
+            enqueue=True,
+        )
+
+
+def record_llm_call(record: LLMCallRecord):
+    """Append a metrics record to the local store."""
+    _ensure_sink()
+    logger.bind(llm_metrics=True).debug(record.model_dump_json())
+
+
+def load_llm_calls(since: Optional[float] = None) -> list[LLMCallRecord]:
+    """Read the metrics records from the current and rotated files."""
+    records = []
+    pattern = os.path.join(METRICS_DIR, "llm_calls*.jsonl")
+    for path in sorted(glob.glob(pattern)):
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = LLMCallRecord.model_validate_json(line)
+                except ValueError:
+                    logger.warning(f"Skipping malformed metrics record in {path}: {line!r}")
+                    continue
+                if since is None or record.timestamp >= since:
+                    records.append(record)
+    return records
+
+
+def _run_in(context: contextvars.Context, generator: Iterator) -> Iterator:
+    """Step a generator inside `context`, so the variables set there stay set between steps."""
+    try:
+        while True:
+            try:
+                item = context.run(next, generator)
+            except StopIteration as stop:
+                return stop.value
+            yield item
+    finally:
+        generator.close()
+
+
+def track_request(fn):
+    """Remember when an LLM call was first requested so retries and waits count as queue time."""
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def generator_wrapper(*args, **kwargs):
+            # The body only runs once iterated, so note the request time now
+            context = contextvars.copy_context()
+            context.run(_requested_at.set, _requested_at.get() or time.time())
+            return _run_in(context, fn(*args, **kwargs))
+        return generator_wrapper
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            token = _requested_at.set(_requested_at.get() or time.time())
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                _requested_at.reset(token)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _requested_at.set(_requested_at.get() or time.time())
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _requested_at.reset(token)
+    return wrapper
+
+
+def call_metadata(task: Optional[str]) -> dict:
+    """Metadata passed through LiteLLM so the callback can attribute the call."""
+    return {"task": task, "requested_at": _requested_at.get() or time.time()}
+
+
+def _seconds(value) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
+def _usage(response_obj) -> tuple[Optional[int], Optional[int]]:
+    usage = getattr(response_obj, "usage", None)
+    if usage is None and isinstance(response_obj, dict):
+        usage = response_obj.get("usage")
+    if usage is None:
+        return None, None
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens"), usage.get("completion_tokens")
+    return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+
+
+def build_record(kwargs: dict, response_obj, start_time, end_time, error: Optional[str] = None) -> LLMCallRecord:
+    """Turn the arguments of a LiteLLM callback into a metrics record."""
+    metadata = (kwargs.get("litellm_params") or {}).get("metadata") or {}
+    start = _seconds(start_time)
+    end = _seconds(end_time)
+    first_token = _seconds(kwargs.get("completion_start_time"))
+    streamed = bool(kwargs.get("stream"))
+    requested_at = metadata.get("requested_at") or start
+    prompt_tokens, completion_tokens = _usage(response_obj)
+    # Without streaming the first token arrives with the whole reply, so there is no TTFT to record
+    ttft = (first_token - start) if first_token and streamed else None
+    # Decoding time excludes the wait for the first token when it is known
+    decode = (end - first_token) if first_token and streamed and end > first_token else (end - start)
+    return LLMCallRecord(
+        timestamp=end,
+        model=kwargs.get("model") or "unknown",
+        task=metadata.get("task"),
+        streamed=streamed,
+        success=error is None,
+        queue_wait_ms=max(0.0, start - requested_at) * 1000,
+        ttft_ms=ttft * 1000 if ttft is not None else None,
+        latency_ms=(end - start) * 1000,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        tokens_per_s=completion_tokens / decode if completion_tokens and decode > 0 else None,
+        error=error,
+    )
+
+
+class LLMCallLogger(CustomLogger):
+    """LiteLLM callback that records latency and token metrics for every completion."""
+
+    def _record(self, kwargs, response_obj, start_time, end_time, error=None):
+        if kwargs.get("call_type") not in ("completion", "acompletion"):
+            return
+        try:
+            record_llm_call(build_record(kwargs, response_obj, start_time, end_time, error))
+        except Exception as e:
+            logger.warning(f"Could not record LLM call metrics: {e}")
+
+    def log_success_event(self, kwargs, response_obj, start_time, end_time):
+        self._record(kwargs, response_obj, start_time, end_time)
+
+    def log_failure_event(self, kwargs, response_obj, start_time, end_time):
+        self._record(kwargs, response_obj, start_time, end_time, error=str(kwargs.get("exception")))
+
+    async def async_log_success_event(self, kwargs, response_obj, start_time, end_time):
+        self._record(kwargs, response_obj, start_time, end_time)
+
+    async def async_log_failure_event(self, kwargs, response_obj, start_time, end_time):
+        self._record(kwargs, response_obj, start_time, end_time, error=str(kwargs.get("exception")))
+
+
+llm_call_logger = LLMCallLogger()
+
+
+def summarize_llm_calls(records: list[LLMCallRecord]) -> list[dict]:
+    """Percentile latency and throughput per model and task."""
+    groups: dict[tuple[str, str], list[LLMCallRecord]] = {}
+    for record in records:
+        groups.setdefault((record.model, record.task or "other"), []).append(record)
+    summary = []
+    for (model, task), group in sorted(groups.items()):
+        ok = [record for record in group if record.success]
+        latencies = [record.latency_ms for record in ok]
+        ttfts = [record.ttft_ms for record in ok if record.ttft_ms is not None]
+        throughput = [record.tokens_per_s for record in ok if record.tokens_per_s]
+        summary.append({
+            "model": model,
+            "task": task,
+            "calls": len(group),
+            "errors": len(group) - len(ok),
+            "p50_latency_s": round(float(np.percentile(latencies, 50)) / 1000, 2) if latencies else None,
+            "p90_latency_s": round(float(np.percentile(latencies, 90)) / 1000, 2) if latencies else None,
+            "p99_latency_s": round(float(np.percentile(latencies, 99)) / 1000, 2) if latencies else None,
+            "p50_ttft_s": round(float(np.percentile(ttfts, 50)) / 1000, 2) if ttfts else None,
+            "p90_queue_wait_s": round(float(np.percentile([r.queue_wait_ms for r in ok], 90)) / 1000, 2)
+            if ok else None,
+            "p50_tokens_per_s": round(float(np.percentile(throughput, 50)), 1) if throughput else None,
+            "prompt_tokens": sum(record.prompt_tokens or 0 for record in group),
+            "completion_tokens": sum(record.completion_tokens or 0 for record in group),
+        })
+    return summary
+
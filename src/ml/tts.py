@@ -1,18 +1,33 @@
 
+import contextvars
+import hashlib
+import io
+import json
+import queue
 import re
+import shutil
+import subprocess
+import threading
 import time
+import wave
 import docker
 import os
 import requests
+import requests.adapters
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional
+from ml.resilience import register_probe, resilient, timeout
+from ml.vram_scheduler import TTS
 from utils import docker_client, logger, settings
-from tenacity import (
-    retry,
-    stop_after_attempt,
-    wait_fixed,
-)
 
 FILES_DIR = os.path.join(os.path.dirname(__file__), "/kizlar-agha/files/speech")
+CACHE_DIR = os.path.join(FILES_DIR, "cache")
 TTS_CONTAINER = "orpheus-fastapi"
+# Compressed storage formats: file extension and ffmpeg encoder options
+STORAGE_FORMATS = {
+    "opus": (".ogg", ["-c:a", "libopus", "-application", "voip"]),
+    "mp3": (".mp3", ["-c:a", "libmp3lame"]),
+}
 ADDITIONAL_TTS_CONTAINER = "orpheus-fastapi-llama-cpp-server-1"
 
 def start_tts_container():
@@ -67,18 +82,54 @@ def stop_tts_container():
     except docker.errors.APIError as e:
         logger.error(f"Error stopping {TTS_CONTAINER} container: {e}")
 
-@retry(
-    wait=wait_fixed(30),
-    stop=stop_after_attempt(2),
-    after=lambda retry_state: logger.warning(
-        f"Retrying get_tts_audio due to error: {retry_state.outcome.exception()}"
-    ),
-)
-def get_tts_audio(input: str, model: str="orpheus", voice: str = "", response_format: str = "wav", speed: float = 0.5) -> str:
-    """Get TTS audio from the TTS service."""
-    start_tts_container()
-    logger.info(f"Getting TTS audio for input: {input}, model: {model}, voice: {voice}, response_format: {response_format}, speed: {speed}")
-    r = requests.post(
+def split_text(text: str, max_chars: Optional[int] = None, min_chars: Optional[int] = None) -> list[str]:
+    """Split text into sentence sized chunks that can be voiced independently.
+
+    Sentences longer than `max_chars` are split at clause boundaries (commas, semicolons,
+    colons, dashes), and as a last resort between words. Chunks shorter than `min_chars` are
+    merged with the next one, since very short inputs lose their intonation.
+    """
+    max_chars = max_chars or settings.TTS_CHUNK_MAX_CHARS
+    min_chars = settings.TTS_CHUNK_MIN_CHARS if min_chars is None else min_chars
+    pieces = []
+    for sentence in re.split(r"(?<=[.!?…])\s+|(?<=[.!?…][\"')\]])\s+", text.strip()):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        for clause in _pack(re.split(r"(?<=[,;:—–])\s+", sentence), max_chars):
+            pieces.extend([clause] if len(clause) <= max_chars else _pack(clause.split(), max_chars))
+    chunks = []
+    for piece in filter(None, (piece.strip() for piece in pieces)):
+        if chunks and len(chunks[-1]) < min_chars and len(chunks[-1]) + 1 + len(piece) <= max_chars:
+            chunks[-1] = f"{chunks[-1]} {piece}"
+        else:
+            chunks.append(piece)
+    # A short tail joins the chunk before it
+    if len(chunks) > 1 and len(chunks[-1]) < min_chars and len(chunks[-2]) + 1 + len(chunks[-1]) <= max_chars:
+        chunks[-2:] = [f"{chunks[-2]} {chunks[-1]}"]
+    return chunks
+
+def _pack(parts: list[str], max_chars: int) -> list[str]:
+    """Join consecutive parts with spaces into pieces of at most `max_chars` where possible."""
+    packed = []
+    for part in parts:
+        if packed and len(packed[-1]) + 1 + len(part) <= max_chars:
+            packed[-1] = f"{packed[-1]} {part}"
+        else:
+            packed.append(part)
+    return packed
+
+_http = requests.Session()
+_http.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=8))
+
+# The TTS server is up once it answers HTTP at all
+register_probe(TTS, lambda: _http.get(settings.TTS_BASE_URL, timeout=2).status_code < 500)
+
+@resilient(TTS, retry_on=(IOError,))
+def synthesize(input: str, model: str = "orpheus", voice: str = "", response_format: str = "wav", speed: float = 0.5) -> bytes:
+    """Voice one piece of text with the TTS service and return the encoded audio."""
+    logger.debug(f"Synthesizing {len(input)} characters with model: {model}, voice: {voice}")
+    r = _http.post(
         url=settings.TTS_API_URL,
         json={
             "model": model,
@@ -87,20 +138,354 @@ def get_tts_audio(input: str, model: str="orpheus", voice: str = "", response_fo
             "response_format": response_format,
             "speed": speed
         },
-        headers={'Content-type': 'application/json'}
+        headers={'Content-type': 'application/json'},
+        timeout=timeout(settings.TTS_REQUEST_TIMEOUT_SECONDS)
     )
+    if r.status_code == 429 or r.status_code >= 500:
+        raise IOError(f"Error getting TTS audio: {r.status_code} - {r.text}")
     if r.status_code != 200:
-        logger.error(f"Error getting TTS audio: {r.text}")
+        # The request itself was rejected, retrying it would not help
+        raise ValueError(f"Error getting TTS audio: {r.status_code} - {r.text}")
+    return r.content
+
+def speech_key(input: str, model: str, voice: str, response_format: str, speed: float) -> str:
+    """Hash of everything that changes the voiced audio, ignoring differences in whitespace."""
+    params = {
+        "input": " ".join(input.split()),
+        "model": model,
+        "voice": voice,
+        "response_format": response_format,
+        "speed": speed,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+_cache_lock = threading.Lock()
+
+def _cache_entry(key: str, response_format: str) -> str:
+    return os.path.join(CACHE_DIR, key[:2], f"{key}.{response_format}")
+
+def _link_or_write(dest: str, source: Optional[str] = None, data: Optional[bytes] = None):
+    """Atomically create `dest` as a hardlink to `source`, or with `data`."""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp_path = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if source is not None:
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            with open(source, "rb") as f:
+                data = f.read()
+    if data is not None:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+    os.replace(tmp_path, dest)
+
+def cache_get(key: str, response_format: str) -> Optional[bytes]:
+    """Audio voiced earlier for a cache key, or None."""
+    entry = _cache_entry(key, response_format)
+    try:
+        with open(entry, "rb") as f:
+            data = f.read()
+        # Touch the entry so eviction sees it as recently used
+        os.utime(entry)
+        return data
+    except OSError:
+        return None
+
+def cache_put(key: str, response_format: str, source: Optional[str] = None, data: Optional[bytes] = None):
+    """Remember voiced audio, from a file or bytes, evicting old entries once the cache is full."""
+    entry = _cache_entry(key, response_format)
+    with _cache_lock:
+        if os.path.exists(entry):
+            return
+        try:
+            _link_or_write(entry, source=source, data=data)
+        except OSError as e:
+            logger.warning(f"Could not cache speech {key[:12]}: {e}")
+            return
+        _evict()
+
+def _evict():
+    """Remove the least recently used cache entries until the cache fits in TTS_CACHE_MB.
+
+    Message audio files are separate links to the same data, so they survive eviction.
+    """
+    entries = []
+    for root, _, files in os.walk(CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    max_bytes = settings.TTS_CACHE_MB * 1024 * 1024
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        logger.debug(f"Evicting cached speech {path}")
+        os.remove(path)
+        total -= size
+
+def speech_path(key: str, response_format: str) -> str:
+    """Content addressed file of a message's audio, shared by every message with the same text."""
+    return os.path.join(FILES_DIR, f"{key}.{response_format}")
+
+def cached_speech(input: str, model: str = "orpheus", voice: str = "", response_format: str = "wav", speed: float = 0.5) -> Optional[str]:
+    """Path of the audio of a text voiced before, restored from the cache if needed, or None."""
+    key = speech_key(input, model, voice, response_format, speed)
+    path = speech_path(key, response_format)
+    if os.path.exists(path):
+        cache_put(key, response_format, source=path)
+        return path
+    entry = _cache_entry(key, response_format)
+    with _cache_lock:
+        if not os.path.exists(entry):
+            return None
+        os.utime(entry)
+        _link_or_write(path, source=entry)
+    return path
+
+def _cached_synthesize(input: str, model: str, voice: str, response_format: str, speed: float) -> bytes:
+    """Voice one chunk, reusing the audio of a phrase that was voiced before."""
+    key = speech_key(input, model, voice, response_format, speed)
+    audio = cache_get(key, response_format)
+    if audio is None:
+        audio = synthesize(input, model=model, voice=voice, response_format=response_format, speed=speed)
+        cache_put(key, response_format, data=audio)
+    else:
+        logger.debug(f"Reusing cached speech for: {input}")
+    return audio
+
+def synthesize_chunks(
+        chunks: list[str],
+        max_workers: Optional[int] = None,
+        **kwargs
+    ) -> Iterator[bytes]:
+    """Voice chunks concurrently, yielding their audio in order as soon as each one is ready.
+
+    At most `max_workers` requests are in flight, so the TTS server is kept busy without
+    being flooded. The first chunk is yielded while later ones are still being synthesized.
+    Chunks voiced before with the same settings come from the cache.
+    """
+    max_workers = max_workers or settings.TTS_MAX_PARALLEL
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts") as pool:
+        futures = [pool.submit(contextvars.copy_context().run, _cached_synthesize, chunk, **kwargs) for chunk in chunks]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            # Stop queued chunks when a chunk failed or the consumer gave up
+            for future in futures:
+                future.cancel()
+
+def concat_wav(parts: list[bytes]) -> bytes:
+    """Concatenate WAV files with the same sample format into a single WAV file."""
+    output = io.BytesIO()
+    with wave.open(output, "wb") as out:
+        params = None
+        for part in parts:
+            with wave.open(io.BytesIO(part), "rb") as wav:
+                if params is None:
+                    params = wav.getparams()
+                    out.setparams(params)
+                elif wav.getparams()[:3] != params[:3]:
+                    raise ValueError(f"Cannot join WAV chunks with formats {params[:3]} and {wav.getparams()[:3]}")
+                out.writeframes(wav.readframes(wav.getnframes()))
+    return output.getvalue()
+
+def get_tts_audio(
+        input: str,
+        model: str = "orpheus",
+        voice: str = "",
+        response_format: str = "wav",
+        speed: float = 0.5,
+        on_chunk: Optional[Callable[[int, int, bytes], Any]] = None,
+        max_workers: Optional[int] = None
+    ) -> str:
+    """Get TTS audio from the TTS service.
+
+    WAV output is voiced sentence by sentence, `max_workers` chunks at a time, and joined in
+    order. `on_chunk` is called with the chunk index, the number of chunks and the audio of
+    each chunk as soon as it and every chunk before it are ready, so playback can start early.
+    """
+    logger.info(f"Getting TTS audio for input: {input}, model: {model}, voice: {voice}, response_format: {response_format}, speed: {speed}")
+    # Other formats cannot be joined without decoding them
+    chunks = split_text(input) if response_format == "wav" else [input]
+    if not chunks or not chunks[0]:
+        logger.error("No text to voice after removing actions.")
         return ""
-    audio_data = r.content
-    # Create FILES_DIR if it doesn't already exist
-    os.makedirs(FILES_DIR, exist_ok=True)
-    audio_file_path = os.path.join(FILES_DIR, f"{int(time.time())}.{response_format}")
-    with open(audio_file_path, "wb") as audio_file:
-        audio_file.write(audio_data)
+    cached = cached_speech(input, model=model, voice=voice, response_format=response_format, speed=speed)
+    if cached:
+        logger.info(f"Reusing TTS audio {cached}")
+        return cached
+    start_tts_container()
+    try:
+        parts = []
+        for index, audio in enumerate(synthesize_chunks(
+                chunks, max_workers, model=model, voice=voice, response_format=response_format, speed=speed)):
+            parts.append(audio)
+            if on_chunk:
+                on_chunk(index, len(chunks), audio)
+        audio_data = parts[0] if len(parts) == 1 else concat_wav(parts)
+    except Exception as e:
+        logger.error(f"Error getting TTS audio: {e}")
+        return ""
+    logger.info(f"Voiced {len(chunks)} chunk(s)")
+    return save_speech(input, audio_data, model, voice, response_format, speed)
+
+def save_speech(input: str, audio_data: bytes, model: str, voice: str, response_format: str, speed: float) -> str:
+    """Store the audio of a whole text under its content addressed name and cache it."""
+    key = speech_key(input, model, voice, response_format, speed)
+    audio_file_path = speech_path(key, response_format)
+    try:
+        # A single chunk is already in the cache under the same key
+        _link_or_write(audio_file_path, source=_cache_entry(key, response_format))
+    except OSError:
+        _link_or_write(audio_file_path, data=audio_data)
+        cache_put(key, response_format, source=audio_file_path)
     logger.info(f"TTS audio saved to {audio_file_path}")
     return audio_file_path
 
+class SentenceBuffer:
+    """Collects text streamed from an LLM and hands out the chunks that are ready to voice.
+
+    Text is only cut after the end of a sentence (or a clause, once a sentence grows past
+    the chunk size), never inside an *action* or a <think> block, so those can be removed
+    before voicing just like in `remove_action_text`.
+
+    Each delta is scanned once: whether an action or <think> block is open and the last
+    places it is safe to cut are kept up to date, so a long block that cannot be cut does
+    not make every later delta slower.
+    """
+
+    TOKEN = re.compile(r"(?P<star>\*)|(?P<open></?think>)|(?P<sentence>[.!?…][\"')\]]?\s)|(?P<clause>[,;:—–]\s)")
+    # Longest token, so a token split across deltas is scanned again once it is complete
+    TOKEN_CHARS = len("</think>")
+
+    def __init__(self, max_chars: Optional[int] = None, min_chars: Optional[int] = None):
+        self.max_chars = max_chars or settings.TTS_CHUNK_MAX_CHARS
+        self.min_chars = settings.TTS_CHUNK_MIN_CHARS if min_chars is None else min_chars
+        self._raw = ""
+        self._scanned = 0  # Text before this index has been scanned
+        self._in_action = False
+        self._thinking = 0  # Open <think> blocks
+        self._sentence_cut = 0  # End of the last sentence that is safe to cut after
+        self._clause_cut = 0
+        self._speakable = (0, 0)  # Cut and length of the speakable text before it
+
+    def feed(self, text: str) -> list[str]:
+        """Add streamed text and return the chunks completed by it."""
+        self._raw += text
+        self._scan()
+        cut = self._sentence_cut
+        if cut == 0 and len(self._raw) > self.max_chars:
+            cut = self._clause_cut
+        if cut == 0 or self._speakable_chars(cut) < self.min_chars:
+            return []
+        return self._take(cut)
+
+    def flush(self) -> list[str]:
+        """Return whatever is left once the stream has ended."""
+        chunks = self._take(len(self._raw))
+        self._in_action, self._thinking = False, 0
+        return chunks
+
+    def _scan(self):
+        end = self._scanned
+        for match in self.TOKEN.finditer(self._raw, self._scanned):
+            end = match.end()
+            if match["star"]:
+                self._in_action = not self._in_action
+            elif match["open"]:
+                # A stray </think> does not close a block that opens later, as in `speakable_text`
+                self._thinking = max(self._thinking - 1, 0) if match["open"].startswith("</") else self._thinking + 1
+            elif not self._in_action and not self._thinking:
+                if match["sentence"]:
+                    self._sentence_cut = end
+                else:
+                    self._clause_cut = end
+        # The tail may hold the start of a token that is only completed by the next delta
+        self._scanned = max(end, len(self._raw) - self.TOKEN_CHARS + 1)
+
+    def _speakable_chars(self, cut: int) -> int:
+        if self._speakable[0] != cut:
+            self._speakable = (cut, len(speakable_text(self._raw[:cut])))
+        return self._speakable[1]
+
+    def _take(self, cut: int) -> list[str]:
+        text, self._raw = self._raw[:cut], self._raw[cut:]
+        self._scanned = max(self._scanned - cut, 0)
+        self._sentence_cut = max(self._sentence_cut - cut, 0)
+        self._clause_cut = max(self._clause_cut - cut, 0)
+        self._speakable = (0, 0)
+        return split_text(speakable_text(text), self.max_chars, self.min_chars)
+
+def speakable_text(text: str) -> str:
+    """Text with thinking and *actions* removed, as it should be voiced."""
+    return remove_action_text(re.sub(r"<think>.*?(</think>|$)", "", text, flags=re.DOTALL))
+
+def voice_stream(
+        deltas: Iterable[str],
+        model: str = "orpheus",
+        voice: str = "",
+        speed: float = 0.5,
+        on_chunk: Optional[Callable[[int, Optional[int], bytes], Any]] = None,
+        max_workers: Optional[int] = None
+    ) -> tuple[str, str]:
+    """Voice text while it is still being generated. Returns the full text and the audio path.
+
+    Each sentence is sent to TTS as soon as the stream completes it, with at most
+    `max_workers` requests in flight, so speech synthesis overlaps with text generation.
+    `on_chunk` gets the index and audio of every chunk, in order, as soon as it is voiced;
+    the number of chunks is not known yet and is passed as None. The chunks are joined and
+    stored like `get_tts_audio` output, so voicing the same text later is a cache hit.
+    """
+    response_format = "wav"
+    buffer = SentenceBuffer()
+    pieces: list[str] = []
+    parts: list[bytes] = []
+    pending: queue.Queue[Optional[Future]] = queue.Queue()
+    errors: list[Exception] = []
+
+    def play():
+        # Hand the chunks over in order while later ones are still being synthesized
+        while (future := pending.get()) is not None:
+            if errors:
+                continue
+            try:
+                parts.append(future.result())
+                if on_chunk:
+                    on_chunk(len(parts) - 1, None, parts[-1])
+            except Exception as e:
+                errors.append(e)
+
+    start_tts_container()
+    player = threading.Thread(target=play, daemon=True, name="tts-stream")
+    player.start()
+    with ThreadPoolExecutor(max_workers=max_workers or settings.TTS_MAX_PARALLEL, thread_name_prefix="tts") as pool:
+        def submit(chunks: list[str]):
+            for chunk in chunks:
+                pending.put(pool.submit(contextvars.copy_context().run, _cached_synthesize, chunk, model, voice, response_format, speed))
+        try:
+            for delta in deltas:
+                pieces.append(delta)
+                submit(buffer.feed(delta))
+            submit(buffer.flush())
+        finally:
+            pending.put(None)
+            player.join()
+    text = "".join(pieces)
+    if errors:
+        logger.error(f"Error voicing streamed text: {errors[0]}")
+        return text, ""
+    if not parts:
+        logger.warning("Nothing to voice in the streamed text.")
+        return text, ""
+    audio_data = parts[0] if len(parts) == 1 else concat_wav(parts)
+    logger.info(f"Voiced {len(parts)} streamed chunk(s)")
+    return text, save_speech(speakable_text(text), audio_data, model, voice, response_format, speed)
+
 def remove_action_text(content):
     """Remove anything between asterisks from the content."""
     if not content:
@@ -110,3 +495,65 @@ def remove_action_text(content):
     content = re.sub(r"\n+", " ", content)  # Replace multiple newlines with a single space
     content = content.strip()  # Remove leading and trailing whitespace
     return content
+
+_transcode_pool: Optional[ThreadPoolExecutor] = None
+_transcode_lock = threading.Lock()
+
+def transcode(path: str, storage_format: Optional[str] = None, bitrate: Optional[str] = None) -> Optional[str]:
+    """Compress a speech file with ffmpeg next to the original and return the new path.
+
+    Returns None when compression is off, the format is unknown or ffmpeg is not installed.
+    An existing compressed file is reused, since speech files are content addressed.
+    """
+    storage_format = storage_format or settings.TTS_STORAGE_FORMAT
+    if storage_format not in STORAGE_FORMATS:
+        if storage_format != "wav":
+            logger.warning(f"Unknown speech storage format {storage_format}, keeping {path}")
+        return None
+    if shutil.which("ffmpeg") is None:
+        logger.warning(f"ffmpeg is not installed, keeping {path} uncompressed")
+        return None
+    ext, codec = STORAGE_FORMATS[storage_format]
+    dest = os.path.splitext(path)[0] + ext
+    if os.path.exists(dest):
+        return dest
+    tmp_path = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp{ext}"
+    result = subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-i", path, *codec,
+         "-b:a", bitrate or settings.TTS_STORAGE_BITRATE, tmp_path],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        logger.error(f"Error compressing {path}: {result.stderr.strip()}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+    os.replace(tmp_path, dest)
+    logger.info(f"Compressed {path} ({os.path.getsize(path)} bytes) to {dest} ({os.path.getsize(dest)} bytes)")
+    return dest
+
+def transcode_async(path: str, on_done: Optional[Callable[[str, str], Any]] = None) -> Optional[Future]:
+    """Compress a speech file in a background worker, then call `on_done(path, compressed_path)`."""
+    global _transcode_pool
+    if settings.TTS_STORAGE_FORMAT not in STORAGE_FORMATS:
+        return None
+    with _transcode_lock:
+        if _transcode_pool is None:
+            _transcode_pool = ThreadPoolExecutor(
+                max_workers=settings.TTS_TRANSCODE_WORKERS, thread_name_prefix="tts-transcode"
+            )
+
+    def run():
+        dest = transcode(path)
+        if dest and on_done:
+            on_done(path, dest)
+        return dest
+
+    future = _transcode_pool.submit(run)
+    future.add_done_callback(lambda f: _transcoded(path, f))
+    return future
+
+def _transcoded(path: str, future: Future):
+    if future.exception():
+        logger.error(f"Error compressing {path}: {future.exception()}")
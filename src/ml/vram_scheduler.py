@@ -0,0 +1,396 @@
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Any, Callable, Optional
+
+from pydantic import BaseModel, ConfigDict
+
+from utils import docker_client, logger, settings
+
+LLM = "llm"
+IMAGE = "image"
+TTS = "tts"
+
+
+class Backend:
+    """A GPU backend that can be loaded into or unloaded from VRAM."""
+
+    def __init__(
+            self,
+            name: str,
+            vram_mb: int,
+            load: Callable[[], Any],
+            unload: Callable[[], Any],
+            is_resident: Optional[Callable[[], bool]] = None
+        ):
+        self.name = name
+        self.vram_mb = vram_mb
+        self._load = load
+        self._unload = unload
+        self._is_resident = is_resident
+        self._resident = False
+
+    @property
+    def resident(self) -> bool:
+        """Whether the backend currently holds its models in VRAM."""
+        if self._is_resident:
+            return self._is_resident()
+        return self._resident
+
+    def load(self):
+        logger.info(f"Loading {self.name} backend ({self.vram_mb} MB)")
+        self._load()
+        self._resident = True
+
+    def unload(self):
+        logger.info(f"Unloading {self.name} backend ({self.vram_mb} MB)")
+        self._unload()
+        self._resident = False
+
+
+class SimulatedClock:
+    """A manually advanced clock used to replay workloads without waiting."""
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        """Current simulated time in seconds."""
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+class SimulatedBackend(Backend):
+    """A backend that only advances a simulated clock when loaded or unloaded."""
+
+    def __init__(
+            self,
+            name: str,
+            vram_mb: int,
+            clock: SimulatedClock,
+            load_seconds: float = 0.0,
+            unload_seconds: float = 0.0
+        ):
+        super().__init__(
+            name,
+            vram_mb,
+            load=lambda: clock.advance(load_seconds),
+            unload=lambda: clock.advance(unload_seconds),
+        )
+        self.loads = 0
+        self.unloads = 0
+
+    def load(self):
+        super().load()
+        self.loads += 1
+
+    def unload(self):
+        super().unload()
+        self.unloads += 1
+
+
+class Job(BaseModel):
+    """A unit of work that needs one backend resident to run."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    backend: str
+    name: str = ""
+    model: Optional[str] = None  # Checkpoint the job needs loaded on its backend, if any
+    fn: Optional[Callable[[], Any]] = None
+    duration: float = 0.0  # Only used when replaying simulated workloads
+    submitted_at: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+class SwapPolicy(ABC):
+    """Decides which job runs next and which backends make room for it."""
+
+    @abstractmethod
+    def next_job(self, queue: list[Job], resident: set[str]) -> Job:
+        """Pick the job of `queue` to run next, given the backends that are `resident`."""
+
+    def eviction_order(self, candidates: list[Backend], queue: list[Job]) -> list[Backend]:
+        """Order resident backends from first to last to unload.
+
+        Backends with the least pending work go first so the ones still needed stay loaded.
+        """
+        pending = Counter(job.backend for job in queue)
+        return sorted(candidates, key=lambda backend: (pending[backend.name], -backend.vram_mb))
+
+
+class FifoPolicy(SwapPolicy):
+    """Run jobs strictly in submission order, swapping backends whenever needed."""
+
+    def next_job(self, queue: list[Job], resident: set[str]) -> Job:
+        return queue[0]
+
+
+class BatchingPolicy(SwapPolicy):
+    """Drain the pending jobs of resident backends before swapping another one in.
+
+    When nothing queued can run on a resident backend, the backend with the most pending
+    jobs is swapped in so the cost of the load is spread over the largest batch. `max_batch`
+    bounds how many jobs a resident backend may run in a row while others are waiting.
+    Within a backend, jobs for the model it last ran go first so checkpoints are not reloaded.
+    """
+
+    def __init__(self, max_batch: Optional[int] = None):
+        self.max_batch = max_batch
+        self._current: Optional[str] = None
+        self._streak = 0
+        self._models: dict[str, Optional[str]] = {}
+
+    def next_job(self, queue: list[Job], resident: set[str]) -> Job:
+        waiting = {job.backend for job in queue}
+        starved = (
+            self.max_batch is not None
+            and self._streak >= self.max_batch
+            and len(waiting - {self._current}) > 0
+        )
+        runnable = [job for job in queue if job.backend in resident]
+        if starved:
+            runnable = [job for job in runnable if job.backend != self._current]
+        if runnable:
+            job = self._same_model(runnable)
+        else:
+            pending = Counter(job.backend for job in queue)
+            if starved:
+                pending.pop(self._current, None)
+            backend = max(pending, key=lambda name: (pending[name], -self._first_index(queue, name)))
+            job = self._same_model([job for job in queue if job.backend == backend])
+        if job.model:
+            self._models[job.backend] = job.model
+        if job.backend == self._current:
+            self._streak += 1
+        else:
+            self._current = job.backend
+            self._streak = 1
+        return job
+
+    def _same_model(self, jobs: list[Job]) -> Job:
+        loaded = {backend: model for backend, model in self._models.items() if model}
+        return next((job for job in jobs if job.model and loaded.get(job.backend) == job.model), jobs[0])
+
+    @staticmethod
+    def _first_index(queue: list[Job], backend: str) -> int:
+        return next(i for i, job in enumerate(queue) if job.backend == backend)
+
+
+class VRAMScheduler:
+    """Keeps the backends that fit in VRAM resident and swaps them around the pending work.
+
+    The pending work is the scheduler's own `queue` plus whatever `pending` returns, e.g. the
+    jobs waiting in the jobs table. Workers that claim jobs from elsewhere ask `choose` which
+    one to run next, so the swap policy decides the order of the real work too.
+    """
+
+    def __init__(
+            self,
+            backends: list[Backend],
+            capacity_mb: int,
+            policy: Optional[SwapPolicy] = None,
+            clock: Callable[[], float] = time.monotonic,
+            pending: Optional[Callable[[], list[Job]]] = None
+        ):
+        self.backends = {backend.name: backend for backend in backends}
+        self.capacity_mb = capacity_mb
+        self.policy = policy or BatchingPolicy()
+        self.clock = clock
+        self.pending = pending
+        self.queue: list[Job] = []
+        self.history: list[Job] = []
+        self.swaps = 0
+        self._lock = threading.RLock()
+
+    def resident(self) -> set[str]:
+        return {name for name, backend in self.backends.items() if backend.resident}
+
+    def used_mb(self) -> int:
+        return sum(self.backends[name].vram_mb for name in self.resident())
+
+    def submit(
+            self,
+            backend: str,
+            fn: Optional[Callable[[], Any]] = None,
+            name: str = "",
+            duration: float = 0.0,
+            model: Optional[str] = None
+        ) -> Job:
+        """Queue a job to run once its backend is resident."""
+        if backend not in self.backends:
+            raise ValueError(f"Unknown backend: {backend}")
+        job = Job(backend=backend, name=name, fn=fn, duration=duration, model=model, submitted_at=self.clock())
+        with self._lock:
+            self.queue.append(job)
+        return job
+
+    def pending_jobs(self) -> list[Job]:
+        """The queued jobs and the work reported by `pending`."""
+        pending = []
+        if self.pending:
+            try:
+                pending = self.pending()
+            except Exception as e:
+                logger.warning(f"Could not look up the pending work: {e}")
+        return self.queue + pending
+
+    def choose(self, jobs: list[Job]) -> Job:
+        """The job of `jobs` the swap policy runs next, given the backends resident now."""
+        with self._lock:
+            return self.policy.next_job(jobs, self.resident())
+
+    def fits(self, *names: str) -> bool:
+        """Whether the given backends can be resident at the same time."""
+        return sum(self.backends[name].vram_mb for name in set(names)) <= self.capacity_mb
+
+    def ensure_resident(self, name: str, keep: tuple[str, ...] = ()) -> list[str]:
+        """Load a backend, unloading others first if it does not fit. Returns the unloaded names.
+
+        Backends named in `keep` are never unloaded, e.g. the LLM while its output is voiced.
+        Raises ValueError when the backend does not fit next to them, see `fits`.
+        """
+        with self._lock:
+            backend = self.backends[name]
+            if backend.resident:
+                return []
+            if backend.vram_mb > self.capacity_mb:
+                raise ValueError(
+                    f"{name} needs {backend.vram_mb} MB but only {self.capacity_mb} MB of VRAM is available."
+                )
+            kept = [other for other in self.resident() if other in keep and other != name]
+            if not self.fits(name, *kept):
+                raise ValueError(f"{name} does not fit in VRAM next to {kept}, which must stay loaded.")
+            unloaded = []
+            candidates = [self.backends[other] for other in self.resident() if other != name and other not in keep]
+            for victim in self.policy.eviction_order(candidates, self.pending_jobs()):
+                if self.used_mb() + backend.vram_mb <= self.capacity_mb:
+                    break
+                victim.unload()
+                unloaded.append(victim.name)
+            backend.load()
+            if unloaded:
+                self.swaps += 1
+                logger.info(f"Swapped {unloaded} out of VRAM for {name}")
+            return unloaded
+
+    def run_next(self) -> Optional[Job]:
+        """Run the job chosen by the policy. Returns None when the queue is empty."""
+        with self._lock:
+            if not self.queue:
+                return None
+            job = self.policy.next_job(self.queue, self.resident())
+            self.queue.remove(job)
+            self.ensure_resident(job.backend)
+        job.started_at = self.clock()
+        if job.fn:
+            job.fn()
+        elif job.duration and isinstance(self.clock, SimulatedClock):
+            self.clock.advance(job.duration)
+        job.finished_at = self.clock()
+        self.history.append(job)
+        return job
+
+    def run(self) -> list[Job]:
+        """Drain the queue, returning the jobs in the order they ran."""
+        completed = []
+        while (job := self.run_next()) is not None:
+            completed.append(job)
+        return completed
+
+
+def load_trace(path: str) -> list[dict]:
+    """Load a recorded workload trace, one JSON object per line.
+
+    Each entry has the arrival time `t` in seconds, the `backend` it needs, its `duration`
+    and an optional `name`.
+    """
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def replay_trace(trace: list[dict], scheduler: VRAMScheduler) -> dict:
+    """Replay a workload trace against a scheduler built on a `SimulatedClock`.
+
+    Jobs are only submitted once the simulated clock reaches their arrival time, so the policy
+    sees the same pending queue it would have seen live.
+    """
+    clock = scheduler.clock
+    if not isinstance(clock, SimulatedClock):
+        raise ValueError("Trace replay needs a scheduler running on a SimulatedClock.")
+    pending = sorted(trace, key=lambda entry: entry["t"])
+    start = clock()
+    while pending or scheduler.queue:
+        while pending and pending[0]["t"] <= clock() - start:
+            entry = pending.pop(0)
+            job = scheduler.submit(entry["backend"], name=entry.get("name", ""), duration=entry["duration"])
+            job.submitted_at = start + entry["t"]
+        if not scheduler.queue:
+            clock.advance(pending[0]["t"] - (clock() - start))
+            continue
+        scheduler.run_next()
+    waits = [job.started_at - job.submitted_at for job in scheduler.history]
+    return {
+        "jobs": len(scheduler.history),
+        "makespan": clock() - start,
+        "swaps": scheduler.swaps,
+        "loads": sum(getattr(backend, "loads", 0) for backend in scheduler.backends.values()),
+        "mean_wait": sum(waits) / len(waits) if waits else 0.0,
+        "order": [job.name or job.backend for job in scheduler.history],
+    }
+
+
+def _container_running(name: str) -> bool:
+    try:
+        return docker_client.containers.get(name).status == "running"
+    except Exception:
+        return False
+
+
+def default_backends() -> list[Backend]:
+    """The Ollama, SwarmUI and Orpheus TTS containers with footprints from settings."""
+    from ml.llm import OLLAMA_CONTAINER, start_ollama_container, stop_ollama_container
+    from ml.swarm_ui import start_swarmui_session, stop_swarmui
+    from ml.tts import TTS_CONTAINER, start_tts_container, stop_tts_container
+
+    return [
+        Backend(
+            LLM,
+            settings.INFERENCE_VRAM_MB,
+            load=start_ollama_container,
+            unload=stop_ollama_container,
+            is_resident=lambda: _container_running(OLLAMA_CONTAINER),
+        ),
+        Backend(
+            IMAGE,
+            settings.SWARMUI_VRAM_MB,
+            load=start_swarmui_session,
+            unload=stop_swarmui,
+            is_resident=lambda: _container_running(settings.SWARMUI_CONTAINER),
+        ),
+        Backend(
+            TTS,
+            settings.TTS_VRAM_MB,
+            load=start_tts_container,
+            unload=stop_tts_container,
+            is_resident=lambda: _container_running(TTS_CONTAINER),
+        ),
+    ]
+
+
+_scheduler: Optional[VRAMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> VRAMScheduler:
+    """Shared scheduler for the real backends."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = VRAMScheduler(default_backends(), settings.GPU_VRAM_MB)
+        return _scheduler
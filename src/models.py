@@ -1,14 +1,47 @@
 import os
-from sqlalchemy import Column, Integer, String, ForeignKey
-from sqlalchemy.orm import declarative_base, relationship
-from pydantic import BaseModel
+from sqlalchemy import Boolean, Column, Float, Index, Integer, String, ForeignKey
+from sqlalchemy.orm import declarative_base, object_session, relationship
+from pydantic import BaseModel, ConfigDict
 from base import Base
 import json
+import media
 from ml.llm import InferenceLLMConfig, extract_json_from_response, remove_thinking
 from utils import settings, logger
 
 Base = declarative_base()
 
+# Generation stages, in the order they run. Each one is checkpointed on the entity once done,
+# so a retry or re-run resumes from the first stage that is not
+PROFILE_STAGES = ("text", "image_description", "sample_images", "seed")
+SCENARIO_STAGES = ("text", "scene_descriptions", "scene_images")
+
+
+class StageCheckpoints:
+    """Stages done for an entity, stored as a JSON list in its `stages` column."""
+
+    STAGES: tuple = ()
+
+    def completed_stages(self) -> list:
+        if self.stages is None:
+            # Saved before stages were checkpointed, judge by the fields that are filled in
+            return [stage for stage in self.STAGES if self.stage_output_present(stage)]
+        try:
+            return json.loads(self.stages)
+        except json.JSONDecodeError:
+            logger.error(f"Invalid JSON in stages: {self.stages}")
+            return []
+
+    def is_done(self, stage: str) -> bool:
+        return stage in self.completed_stages()
+
+    def next_stage(self):
+        """The first stage that is not done yet, or None once all are."""
+        done = self.completed_stages()
+        return next((stage for stage in self.STAGES if stage not in done), None)
+
+    def stage_output_present(self, stage: str) -> bool:
+        return stage == "text"
+
 
 class ModelUsage(Base):
     __tablename__ = "model_usage"
@@ -37,8 +70,9 @@ class ModelUsageSchema(BaseModel):
     class Config:
         from_attributes = True
 
-class Profile(Base):
+class Profile(StageCheckpoints, Base):
     __tablename__ = "profiles"
+    STAGES = PROFILE_STAGES
     id = Column(Integer, primary_key=True)
     name = Column(String, nullable=False)
     background = Column(String)
@@ -51,6 +85,7 @@ class Profile(Base):
     profile_image_path = Column(String)
     chat_model = Column(String)
     voice = Column(String)
+    stages = Column(String, nullable=True)  # JSON list of the PROFILE_STAGES done
     scenarios = relationship("Scenario", back_populates="profile", cascade="all, delete-orphan")
 
     def model_dump(self, *args, **kwargs):
@@ -67,9 +102,18 @@ class Profile(Base):
             "profile_image_description": self.profile_image_description,
             "profile_image_path": self.profile_image_path,
             "chat_model": self.chat_model,
-            "voice": self.voice
+            "voice": self.voice,
+            "stages": self.stages
         }
 
+    def stage_output_present(self, stage: str) -> bool:
+        return {
+            "text": True,
+            "image_description": bool(self.profile_image_description),
+            "sample_images": bool(self.get_images()),
+            "seed": bool(self.image_seed),
+        }.get(stage, False)
+
     def get_images(self):
         """Get the list of image paths associated with this profile."""
         if not self.profile_image_path:
@@ -88,8 +132,7 @@ class Profile(Base):
             return
         for path in image_paths:
             try:
-                os.remove(path)
-                logger.info(f"Deleted image: {path}")
+                media.remove(path)
             except OSError as e:
                 logger.error(f"Error deleting image {path}: {e}")
         self.profile_image_path = None
@@ -116,13 +159,15 @@ class ProfileSchema(BaseModel):
     profile_image_path: str | None = None
     chat_model: str | None = None
     voice: str | None = None
+    stages: str | None = None
 
     class Config:
         from_attributes = True
 
 
-class Scenario(Base):
+class Scenario(StageCheckpoints, Base):
     __tablename__ = "scenarios"
+    STAGES = SCENARIO_STAGES
     id = Column(Integer, primary_key=True)
     profile_id = Column(Integer, ForeignKey('profiles.id'), nullable=False)
     title = Column(String, nullable=False)
@@ -131,6 +176,7 @@ class Scenario(Base):
     invitation = Column(String)
     scene_descriptions = Column(String)
     images = Column(String)
+    stages = Column(String, nullable=True)  # JSON list of the SCENARIO_STAGES done
     profile = relationship("Profile", back_populates="scenarios")
     messages = relationship("Message", back_populates="scenario", cascade="all, delete-orphan")
 
@@ -145,8 +191,16 @@ class Scenario(Base):
             "invitation": self.invitation,
             "scene_descriptions": self.scene_descriptions,
             "images": self.images,
+            "stages": self.stages,
         }
 
+    def stage_output_present(self, stage: str) -> bool:
+        return {
+            "text": True,
+            "scene_descriptions": bool(self.get_scene_descriptions()),
+            "scene_images": bool(self.images and self.images != "[]"),
+        }.get(stage, False)
+
     def get_scene_summaries_as_array(self) -> list:
         """Get the plot points as an array."""
         if self.scene_summaries:
@@ -186,8 +240,7 @@ class Scenario(Base):
             image_paths = [item for sublist in image_paths for item in sublist]
         for path in image_paths:
             try:
-                os.remove(path)
-                logger.info(f"Deleted image: {path}")
+                media.remove(path)
             except OSError as e:
                 logger.error(f"Error deleting image {path}: {e}")
         self.images = None
@@ -210,11 +263,17 @@ class ScenarioSchema(BaseModel):
     invitation: str | None = None
     scene_descriptions: str | None = None
     images: str | None = None
+    stages: str | None = None
 
     class Config:
         from_attributes = True
 
 
+class SceneDescriptionsSchema(BaseModel):
+    """Reply of the LLM when it describes all scenes of a scenario in one call."""
+    scene_descriptions: list[str]
+
+
 class Message(Base):
     __tablename__ = "messages"
     id = Column(Integer, primary_key=True)
@@ -224,6 +283,12 @@ class Message(Base):
     order = Column(Integer, nullable=False)
     speech = Column(String, nullable=True)
     scenario = relationship("Scenario", back_populates="messages")
+    candidates = relationship(
+        "MessageCandidate",
+        back_populates="message",
+        cascade="all, delete-orphan",
+        order_by="MessageCandidate.order"
+    )
 
     def model_dump(self, *args, **kwargs):
         """Override to return a dictionary representation of the message."""
@@ -237,16 +302,45 @@ class Message(Base):
         }
 
     def delete_speech(self):
-        """Delete associated speech"""
-        if self.speech:
-            try:
-                os.remove(self.speech)
-                logger.info(f"Deleted speech file: {self.speech}")
-            except OSError as e:
-                logger.error(f"Error deleting speech file {self.speech}: {e}")
+        """Delete associated speech, unless another message plays the same file"""
+        session = object_session(self)
+        if self.speech and session is not None:
+            Message.release_speech(session, self.speech, message_id=self.id)
+        elif self.speech:
+            _remove_speech_file(self.speech)
         self.speech = None
         logger.info(f"Message {self.id} deleted successfully.")
 
+    @staticmethod
+    def release_speech(session, speech: str, message_id=None) -> bool:
+        """Detach a speech file from a message and delete it once no other message plays it.
+
+        Every message playing the file is locked until the session commits, so two messages
+        letting go of a shared file at the same time serialize and the second one deletes it.
+        Returns whether the file was deleted.
+        """
+        users = (
+            session.query(Message).filter(Message.speech == speech).order_by(Message.id).with_for_update().all()
+        )
+        for message in users:
+            if message.id == message_id:
+                message.speech = None
+        shared = sum(message.id != message_id for message in users)
+        if shared:
+            logger.info(f"Keeping speech file {speech}, used by {shared} other message(s)")
+            return False
+        return _remove_speech_file(speech)
+
+
+def _remove_speech_file(speech: str) -> bool:
+    try:
+        os.remove(speech)
+        logger.info(f"Deleted speech file: {speech}")
+        return True
+    except OSError as e:
+        logger.error(f"Error deleting speech file {speech}: {e}")
+        return False
+
 
 class MessageSchema(BaseModel):
     id: int | None = None
@@ -257,4 +351,63 @@ class MessageSchema(BaseModel):
     speech: str | None = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class MessageCandidate(Base):
+    """An alternative reply kept for a message so regenerating it is instant."""
+    __tablename__ = "message_candidates"
+    id = Column(Integer, primary_key=True)
+    message_id = Column(Integer, ForeignKey('messages.id', ondelete="CASCADE"), nullable=False)
+    content = Column(String, nullable=False)
+    order = Column(Integer, nullable=False)
+    message = relationship("Message", back_populates="candidates")
+
+
+class Job(Base):
+    """A unit of background work, queued in the database so it survives reruns and restarts.
+
+    Workers claim pending jobs in priority order, see jobs.py and worker.py.
+    """
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    args = Column(String, nullable=False, default="{}")  # JSON keyword arguments for the handler
+    priority = Column(Integer, nullable=False, default=50)  # Lower runs first
+    status = Column(String, nullable=False, default="pending")
+    topic = Column(String, nullable=True)  # Progress bus topic the handler publishes on
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(Float, nullable=False, default=0.0)  # Epoch seconds, for retry backoff
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    worker = Column(String, nullable=True)
+    heartbeat_at = Column(Float, nullable=True)
+    progress = Column(String, nullable=True)  # Last progress event as JSON
+    error = Column(String, nullable=True)
+    created_at = Column(Float, nullable=False)
+    started_at = Column(Float, nullable=True)
+    finished_at = Column(Float, nullable=True)
+
+    __table_args__ = (Index("ix_jobs_claim", "status", "priority", "id"),)
+
+
+class JobSchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    kind: str
+    args: str
+    priority: int
+    status: str
+    topic: str | None = None
+    attempts: int
+    max_attempts: int
+    run_after: float
+    cancel_requested: bool
+    worker: str | None = None
+    heartbeat_at: float | None = None
+    progress: str | None = None
+    error: str | None = None
+    created_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
@@ -1,12 +1,18 @@
+import time
 import streamlit as st
 from db import init_db, get_model_usage, save_model_usage
+from jobs import FINISHED, cancel_job, job_event, list_jobs
 from models import ModelUsage, ModelUsageSchema
 from services import stop_models, set_status_to_idle
 from ml.llm import list_ollama_models
+from ml.resilience import backend_stats
 from ml.swarm_ui import list_image_models
+from ml.telemetry import load_llm_calls, summarize_llm_calls
 from utils import docker_client
+from worker import start_workers
 
 init_db()
+start_workers()
 
 st.title("Model Usage")
 
@@ -97,6 +103,71 @@ st.json({
     "status": usage["status"]
 })
 
+# --- Background jobs ---
+st.markdown("---")
+st.header("Jobs")
+jobs = list_jobs(limit=20)
+if jobs:
+    st.dataframe(
+        [
+            {
+                "id": job.id,
+                "kind": job.kind,
+                "priority": job.priority,
+                "status": job.status,
+                "attempts": f"{job.attempts} of {job.max_attempts}",
+                "progress": job_event(job).message if job.status not in FINISHED else job.error or "",
+                "queued": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(job.created_at)),
+                "seconds": round((job.finished_at or time.time()) - job.started_at, 1) if job.started_at else None,
+            }
+            for job in jobs
+        ],
+        hide_index=True,
+        use_container_width=True,
+    )
+    active = [job for job in jobs if job.status not in FINISHED and not job.cancel_requested]
+    if active:
+        job_col1, job_col2 = st.columns([3, 1])
+        with job_col1:
+            to_cancel = st.selectbox("Job", [f"{job.id}: {job.kind}" for job in active], key="job_to_cancel")
+        with job_col2:
+            if st.button("Cancel Job", key="cancel_job"):
+                cancel_job(int(to_cancel.split(":")[0]))
+                st.rerun()
+else:
+    st.info("No jobs queued yet.")
+
+# --- LLM latency and throughput ---
+st.markdown("---")
+st.header("LLM Performance")
+window = st.selectbox("Time window", ["Last hour", "Last day", "Last week", "All"], index=1, key="llm_metrics_window")
+window_seconds = {"Last hour": 3600, "Last day": 86400, "Last week": 7 * 86400, "All": None}[window]
+records = load_llm_calls(since=time.time() - window_seconds if window_seconds else None)
+if records:
+    st.dataframe(summarize_llm_calls(records), hide_index=True, use_container_width=True)
+else:
+    st.info("No LLM calls recorded in this time window.")
+
+# --- Backend retries and circuit breakers ---
+st.markdown("---")
+st.header("Backend Health")
+stats = backend_stats()
+if stats:
+    st.caption("Calls made by this process since it started; jobs run by `make run-worker` are not included.")
+    st.dataframe(
+        [
+            {
+                **s.model_dump(exclude={"opened_at"}),
+                "opened": time.strftime("%H:%M:%S", time.localtime(s.opened_at)) if s.opened_at else None,
+            }
+            for s in stats
+        ],
+        hide_index=True,
+        use_container_width=True,
+    )
+else:
+    st.info("No backend calls made yet.")
+
 # --- Show containers ---
 st.markdown("---")
 containers = docker_client.containers.list(all=True)
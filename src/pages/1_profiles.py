@@ -1,13 +1,19 @@
 import streamlit as st
-import threading
-from db import init_db, get_profiles, get_profile, save_profile, delete_profile, get_model_usage
+from db import init_db, get_profiles, get_profile, save_profile, delete_profile, get_model_usage, set_stage_done
+from jobs import PRIORITY_BATCH, enqueue
+from job_progress import show_job_progress, track_job
 from models import Profile, ProfileSchema, Scenario, ScenarioSchema
-from services import generate_profile, generate_profile_image_description, generate_sample_profile_images, generate_main_profile_image, stop_models, set_status_to_idle
+from services import stop_models, set_status_to_idle
 from ml.swarm_ui import list_image_models, seed_from_image
+from media import display_image
 from ml.llm import list_ollama_models
+from progress import profile_images_topic
 from utils import settings
+from worker import start_workers
 
 init_db()
+start_workers()
+
 
 st.title("Profile Management")
 
@@ -30,6 +36,9 @@ with btn_col2:
         set_status_to_idle()
         st.success("Status set to idle.")
 
+# Filled at the end of the page, so jobs started during this run show up right away
+jobs_panel = st.container()
+
 # Display existing profiles in a table format
 cols = st.columns([3, 2, 1])
 cols[0].markdown("**Profile Details**")
@@ -53,12 +62,23 @@ for i, profile in enumerate(profiles):
                     f"*Interests:* {profile.interests}<br>"
                     f"*Physical Characteristics:* {profile.physical_characteristics}",
                     unsafe_allow_html=True)
+        next_stage = profile.next_stage()
+        if next_stage:
+            st.caption(f"Not generated yet: {next_stage.replace('_', ' ')}")
+            if st.button("Resume Generation", key=f"resume_{i}"):
+                job_id = enqueue(
+                    "resume_profile", topic=profile_images_topic(profile.id), profile_id=profile.id,
+                    llm_model=llm_model, image_model=image_model
+                )
+                track_job(f"resume_{profile.id}", job_id, f"Resuming {profile.name}", 120)
     with row[1]:
         if not getattr(profile, "profile_image_description", None):
-            if st.button("Generate Profile Image Description", key=f"generate_profile_image_description_{i}", disabled=(status != "idle")):
+            if st.button("Generate Profile Image Description", key=f"generate_profile_image_description_{i}"):
                 try:
-                    threading.Thread(target=generate_profile_image_description, args=(profile.id, llm_model), daemon=True).start()
-                    st.success("Profile Image Description started in background. Refresh to see progress.")
+                    job_id = enqueue(
+                        "generate_profile_image_description", profile_id=profile.id, llm_model=llm_model
+                    )
+                    track_job(f"description_{profile.id}", job_id, f"Describing {profile.name}")
                 except Exception as e:
                     st.error(f"Error generating image description: {e}")
             break # Don't show anything more until the profile has an image description
@@ -69,28 +89,36 @@ for i, profile in enumerate(profiles):
                     if img:
                         img_seed = seed_from_image(img)
                         try:
-                            st.image(img, caption=f"{img_seed}", width=120)
+                            st.image(display_image(img, 120), caption=f"{img_seed}", width=120)
                             with st.popover(f"View Full Image {img_seed}"):
-                                st.image(img, caption=f"{img_seed}")
-                            if st.button(f"Make Main Image {img_seed}", key=f"main_image_{i}_{img_seed}", disabled=(status != "idle")):
-                                threading.Thread(target=generate_main_profile_image, args=(profile.id, image_model, img_seed), daemon=True).start()
-                                st.info("Image generation started in the background. Refresh to see progress.")
+                                st.image(display_image(img), caption=f"{img_seed}")
+                            if st.button(f"Make Main Image {img_seed}", key=f"main_image_{i}_{img_seed}"):
+                                job_id = enqueue(
+                                    "generate_main_profile_image", topic=profile_images_topic(profile.id),
+                                    profile_id=profile.id, image_model=image_model, image_seed=img_seed
+                                )
+                                track_job(profile_images_topic(profile.id), job_id,
+                                          f"Main image of {profile.name}", 120)
                                 break  # Exit loop after setting main image
                         except Exception as e:
                             st.error(f"Error displaying image {img_seed}: {e}")
                 if st.button(f"Delete All Images {getattr(profile, 'name', i)}", key=f"delete_images_{i}"):
                     profile.delete_images()
                     save_profile(profile)
+                    set_stage_done(Profile, profile.id, "sample_images", done=False)
                     st.success(f"All images deleted for profile {getattr(profile, 'name', i)}")
         # Select number of sample images to generate
         num_images = st.number_input(
             f"Number of images to generate for {getattr(profile, 'name', i)}",
-            min_value=1, max_value=5, value=1, step=1,
+            min_value=1, max_value=16, value=settings.SWARMUI_DRAFT_BATCH, step=1,
             key=f"num_images_{i}"
         )
-        if st.button("Generate Profile Images", key=f"generate_profile_images_{i}", disabled=(status != "idle")):
-            threading.Thread(target=generate_sample_profile_images, args=(profile.id, image_model, num_images), daemon=True).start()
-            st.info("Image generation started in the background. Refresh to see progress.")
+        if st.button("Generate Profile Images", key=f"generate_profile_images_{i}"):
+            job_id = enqueue(
+                "generate_sample_profile_images", priority=PRIORITY_BATCH, topic=profile_images_topic(profile.id),
+                profile_id=profile.id, image_model=image_model, num_images=int(num_images)
+            )
+            track_job(profile_images_topic(profile.id), job_id, f"Images of {profile.name}", 120)
     with row[2]:
         if st.button("Remove", key=f"remove_{i}"):
             delete_profile(profile.id)
@@ -110,9 +138,11 @@ with pro_col2:
     gen_images = st.checkbox("Generate Images", value=True)
 with pro_col3:
     # Generate a new profile
-    if st.button("Generate New Profile", disabled=(status != "idle")):
-        threading.Thread(target=generate_profile, args=(llm_model, special_requests, gen_images), daemon=True).start()
-        st.info("Profile generation started in the background. Refresh to see progress.")
+    if st.button("Generate New Profile"):
+        job_id = enqueue(
+            "generate_profile", llm_model=llm_model, special_requests=special_requests, gen_images=gen_images
+        )
+        track_job("new_profile", job_id, "New profile")
 
 profile_names = [f"{p.id}: {p.name}" for p in profiles]
 selected = st.selectbox("Select a profile", ["New"] + profile_names)
@@ -218,3 +248,6 @@ with st.form("profile_form"):
         profile_data.voice = voice
         saved = save_profile(profile_data)
         st.success(f"Profile saved (ID: {saved.id})")
+
+with jobs_panel:
+    show_job_progress()
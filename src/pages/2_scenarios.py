@@ -1,14 +1,20 @@
 import streamlit as st
 import json
-import threading
 from db import (
     get_scenarios_for_profile, init_db, get_scenarios, get_scenario, save_scenario, delete_scenario,
     get_profiles, get_profile, get_model_usage
 )
+from jobs import PRIORITY_BATCH, enqueue
+from job_progress import show_job_progress, track_job
 from models import Profile, ProfileSchema, Scenario, ScenarioSchema
-from services import generate_scenario, generate_scene_descriptions, generate_scenario_images, stop_models, set_status_to_idle
+from services import stop_models, set_status_to_idle
+from media import display_image
+from progress import scenario_images_topic
+from worker import start_workers
 
 init_db()
+start_workers()
+
 
 st.title("Scenario Management")
 
@@ -34,6 +40,9 @@ with btn_col2:
         set_status_to_idle()
         st.success("Status set to idle.")
 
+# Filled at the end of the page, so jobs started during this run show up right away
+jobs_panel = st.container()
+
 # --- Profile selection for scenario generation ---
 selected_profile = st.selectbox("Select a profile for scenario", profile_names)
 if not selected_profile:
@@ -70,9 +79,12 @@ with ns_col2:
     # checkbox to generate images
     gen_images = st.checkbox("Generate Images", value=True)
 with ns_col3:
-    if st.button("Generate New Scenario", disabled=(status != "idle")):
-        threading.Thread(target=generate_scenario, args=(profile_id, llm_model, special_requests, gen_images), daemon=True).start()
-        st.info("Scenario generation started in the background. Refresh to see progress.")
+    if st.button("Generate New Scenario"):
+        job_id = enqueue(
+            "generate_scenario", profile_id=profile_id, llm_model=llm_model, special_requests=special_requests,
+            gen_images=gen_images
+        )
+        track_job("new_scenario", job_id, f"New scenario for {character_profile.name}")
 
 # --- Scenario edit form ---
 with st.form("scenario_form"):
@@ -96,21 +108,49 @@ with st.form("scenario_form"):
         st.success(f"Scenario saved (ID: {saved.id})")
 
 # --- Generate scene descriptions ---
-if st.button("Generate Scene Descriptions", disabled=(status != "idle" or selected_scenario == "New")):
+if st.button("Generate Scene Descriptions", disabled=(selected_scenario == "New")):
     scenario_obj = get_scenario(scenario_id) if selected_scenario != "New" else None
     if scenario_obj:
-        threading.Thread(target=generate_scene_descriptions, args=(scenario_obj.id, llm_model), daemon=True).start()
-        st.info("Scenario generation started in the background. Refresh to see progress.")
+        job_id = enqueue("generate_scene_descriptions", scenario_id=scenario_obj.id, llm_model=llm_model)
+        track_job(f"scene_descriptions_{scenario_obj.id}", job_id, f"Scene descriptions of {scenario_obj.title}")
+if selected_scenario != "New":
+    scene_count = len(scenario.get_scene_descriptions())
+    if scene_count:
+        # Write one scene again, e.g. after editing its summary
+        sd_col1, sd_col2 = st.columns([1, 2])
+        with sd_col1:
+            scene_number = st.number_input("Scene", min_value=1, max_value=scene_count, value=1, step=1)
+        with sd_col2:
+            if st.button("Regenerate Scene Description"):
+                job_id = enqueue(
+                    "regenerate_scene_description", scenario_id=scenario_id, llm_model=llm_model,
+                    scene_index=int(scene_number) - 1
+                )
+                track_job(f"scene_description_{scenario_id}", job_id,
+                          f"Scene {int(scene_number)} of {scenario.title}")
 
 # --- Generate scenario images ---
 if character_profile.image_seed is None:
     st.warning("Please set an image seed in the profile to generate images.")
 else:
-    if st.button("Generate Scenario Images", disabled=(status != "idle" or scenario_data.scene_descriptions == "" or scenario_data.scene_descriptions == "[]")):
+    if st.button("Generate Scenario Images", disabled=(scenario_data.scene_descriptions == "" or scenario_data.scene_descriptions == "[]")):
         scenario_obj = get_scenario(scenario_id) if selected_scenario != "New" else None
         if scenario_obj:
-            threading.Thread(target=generate_scenario_images, args=(scenario_obj.id, image_model), daemon=True).start()
-            st.info("Image generation started in the background. Refresh to see progress.")
+            job_id = enqueue(
+                "generate_scenario_images", priority=PRIORITY_BATCH, topic=scenario_images_topic(scenario_obj.id),
+                scenario_id=scenario_obj.id, image_model=image_model
+            )
+            track_job(scenario_images_topic(scenario_obj.id), job_id, f"Images of {scenario_obj.title}", 320)
+
+# --- Resume generation ---
+if selected_scenario != "New" and scenario.next_stage():
+    st.caption(f"Not generated yet: {scenario.next_stage().replace('_', ' ')}")
+    if st.button("Resume Generation"):
+        job_id = enqueue(
+            "resume_scenario", topic=scenario_images_topic(scenario_id), scenario_id=scenario_id,
+            llm_model=llm_model, image_model=image_model
+        )
+        track_job(f"resume_{scenario_id}", job_id, f"Resuming {scenario.title}", 320)
 
 # --- Display images ---
 images = scenario_data.images
@@ -121,7 +161,7 @@ if images:
             st.write("Scenario Images:")
             for img in image_list:
                 if img:
-                    st.image(img, caption=f"{img}")
+                    st.image(display_image(img, 704), caption=f"{img}")
     except Exception as e:
         st.error(f"Error displaying images: {e}")
 
@@ -130,4 +170,7 @@ if selected_scenario != "New":
     if st.button("Remove Scenario"):
         scenario.delete_images()  # Delete images associated with the scenario=
         delete_scenario(scenario_id)
-        st.warning(f"Removed scenario {scenario_data.title}. Refresh to see changes.")
\ No newline at end of file
+        st.warning(f"Removed scenario {scenario_data.title}. Refresh to see changes.")
+
+with jobs_panel:
+    show_job_progress()
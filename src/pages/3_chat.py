@@ -1,13 +1,93 @@
-import threading
 import streamlit as st
 import json
 import re
 from db import (
-    delete_message, get_messages, get_scenarios_for_profile, get_scenario,
+    delete_message, get_message, get_messages, get_scenarios_for_profile, get_scenario,
     get_profiles, get_profile, get_model_usage, save_message
 )
-from services import respond_to_chat, stop_models, set_status_to_idle, add_message, voice_response
+from jobs import FINISHED, PRIORITY_INTERACTIVE, enqueue, get_job
+from services import (
+    reply_to_chat, regenerate_reply, stop_models, set_status_to_idle, add_message, remove_speech_chunks
+)
 from models import MessageSchema
+from media import display_image
+from progress import bus as progress_bus, chat_reply_speech_topic, chat_reply_topic, message_speech_topic
+from api.media_server import media_type, media_url
+from utils import settings
+from worker import start_workers
+
+start_workers()
+
+
+@st.fragment(run_every=settings.PROGRESS_POLL_SECONDS)
+def speech_progress(msg: dict):
+    """Play the voiced parts of the message being voiced while the rest is still being synthesized."""
+    subscription = st.session_state.get("speech_sub")
+    if subscription is None:
+        return
+    chunks = st.session_state.setdefault("speech_chunks", [])
+    if collect_voiced_parts(subscription, chunks) or job_finished(st.session_state.get("speech_job")):
+        # Swap the parts for the complete recording
+        subscription.close()
+        for key in ("speech_sub", "speech_chunks", "speech_job", "speech_message"):
+            st.session_state.pop(key, None)
+        message = get_message(msg['id'])
+        msg['speech'] = message.speech if message else None
+        remove_speech_chunks(chunks)
+        st.rerun()
+    play_voiced_parts(chunks)
+
+
+@st.fragment(run_every=settings.PROGRESS_POLL_SECONDS)
+def streaming_reply(scenario_id: int, name: str):
+    """Show the reply as it is written and play each sentence as soon as it is voiced."""
+    subscription = st.session_state.get("reply_speech_sub")
+    if subscription is None:
+        return
+    chunks = st.session_state.setdefault("reply_speech_chunks", [])
+    collect_voiced_parts(subscription, chunks)
+    latest = progress_bus.latest(chat_reply_topic(scenario_id))
+    if (latest and latest.done) or job_finished(st.session_state.get("reply_job")):
+        # The reply is saved, reload the chat to show it with its full recording
+        subscription.close()
+        del st.session_state["reply_speech_sub"]
+        del st.session_state["reply_speech_chunks"]
+        st.session_state.pop("reply_job", None)
+        progress_bus.clear(chat_reply_topic(scenario_id))
+        progress_bus.clear(chat_reply_speech_topic(scenario_id))
+        st.session_state.pop("messages", None)
+        remove_speech_chunks(chunks)
+        st.rerun()
+    st.markdown(f"**{name}:** {latest.message if latest else '...'}")
+    play_voiced_parts(chunks)
+
+
+def job_finished(job_id) -> bool:
+    """True once a queued job has finished, for jobs whose progress is published in another process."""
+    if job_id is None:
+        return False
+    job = get_job(job_id)
+    return job is None or job.status in FINISHED
+
+
+def collect_voiced_parts(subscription, chunks: list) -> bool:
+    """Add the files of newly voiced parts to `chunks`. Returns True once voicing is done.
+
+    The part files stay on disk until the page swaps them for the complete recording.
+    """
+    for event in subscription.drain():
+        if event.done:
+            return True
+        if event.preview:
+            chunks.append(event.preview)
+    return False
+
+
+def play_voiced_parts(chunks: list):
+    if chunks:
+        st.caption(f"Voiced {len(chunks)} part(s) so far")
+    for i, chunk in enumerate(chunks):
+        st.audio(chunk, format="audio/wav", autoplay=(i == 0))
 
 st.write("# Chat")
 
@@ -82,7 +162,7 @@ with col2:
             if images and isinstance(images[0], list):
                 images = [item for sublist in images for item in sublist]
             if scene_num < len(images):
-                st.image(images[scene_num], caption=f"{scenes[scene_num]}")
+                st.image(display_image(images[scene_num], 704), caption=f"{scenes[scene_num]}")
         except Exception as e:
             st.warning(f"Could not load scene image: {e}")
 
@@ -106,11 +186,20 @@ with st.container(height=400):
             if msg['role'] == 'character':
                 if 'speech' in msg and msg['speech']:
                     # If the message has speech, play it
-                    st.audio(msg['speech'], format="audio/wav")
+                    # Streamed from the media server so only the played bytes are sent
+                    st.audio(media_url(msg['speech']), format=media_type(msg['speech']))
                 else:
-                    if st.button("Speak", disabled=(status != "idle"), key=f"voice_{msg['id']}"):
-                        threading.Thread(target=voice_response, args=(msg['id'], character_profile.voice), daemon=True).start()
-                        st.info("Speech generation started in the background")
+                    # One message is voiced at a time, followed by a single fragment
+                    if st.button("Speak", disabled=("speech_sub" in st.session_state), key=f"voice_{msg['id']}"):
+                        st.session_state["speech_message"] = msg['id']
+                        st.session_state["speech_sub"] = progress_bus.subscribe(message_speech_topic(msg['id']))
+                        st.session_state["speech_job"] = enqueue(
+                            "voice_response", priority=PRIORITY_INTERACTIVE, topic=message_speech_topic(msg['id']),
+                            message_id=msg['id'], voice=character_profile.voice
+                        )
+                        st.info("Speech generation queued")
+                    if st.session_state.get("speech_message") == msg['id']:
+                        speech_progress(msg)
                 st.markdown(f"**{character_profile.name}:**<br>{msg['content']}", unsafe_allow_html=True)
             else:
                 # Wrap text between asterisks in <em> and </em> tags
@@ -133,34 +222,41 @@ with st.container(height=400):
                 rerun_needed = True
                 break  # Prevent index errors after deletion
             if st.button("↺", key=f"regenerate_{idx}", disabled=(status != "idle")):
-                # Regenerate the character's response
-                if msg['role'] == 'character':
-                    send_msg = st.session_state.messages[idx - 1] if idx > 0 else None
-                    # Remove the current message from the list to avoid duplication
-                    st.session_state.messages.pop(idx)
-                    delete_message(msg['id'])
-                else:
-                    send_msg = msg  # Use the current message if it's from the user
                 try:
-                    character_response = respond_to_chat(
-                        llm_model=llm_model,
-                        profile_id=profile_id,
-                        scenario_id=scenario_id,
-                        scene_num=scene_num,
-                        message=send_msg['content']
-                    )
-                    char_msg = add_message(scenario_id, "character", character_response)
-                    st.session_state.messages.append(
-                        {
-                            "role": "character",
-                            "content": character_response,
-                            "order": char_msg.order,
-                            "speech": char_msg.speech,
-                            "id": char_msg.id
-                        }
-                    )
+                    if msg['role'] == 'character':
+                        # Swap in the next stored candidate, or generate new ones if none are left
+                        send_msg = st.session_state.messages[idx - 1] if idx > 0 else None
+                        char_msg = regenerate_reply(
+                            llm_model=llm_model,
+                            message_id=msg['id'],
+                            profile_id=profile_id,
+                            scenario_id=scenario_id,
+                            scene_num=scene_num,
+                            message=send_msg['content'] if send_msg else ""
+                        )
+                        st.session_state.messages[idx].update(
+                            {"content": char_msg.content, "speech": char_msg.speech}
+                        )
+                    else:
+                        # Use the current message if it's from the user
+                        char_msg = reply_to_chat(
+                            llm_model=llm_model,
+                            profile_id=profile_id,
+                            scenario_id=scenario_id,
+                            scene_num=scene_num,
+                            message=msg['content']
+                        )
+                        st.session_state.messages.append(
+                            {
+                                "role": "character",
+                                "content": char_msg.content,
+                                "order": char_msg.order,
+                                "speech": char_msg.speech,
+                                "id": char_msg.id
+                            }
+                        )
                     rerun_needed = True
-                    break  # Prevent index errors after deletion
+                    break  # Prevent index errors after the change
                 except Exception as e:
                     st.error(f"Error regenerating message: {e}")
 
@@ -189,6 +285,8 @@ with st.container(height=400):
                 st.session_state["edit_content"] = ""
                 rerun_needed = True
         st.markdown("---")  # Separator line
+    if "reply_speech_sub" in st.session_state:
+        streaming_reply(scenario_id, character_profile.name)
     if rerun_needed:
         st.rerun()
 
@@ -199,22 +297,38 @@ if st.session_state.get("clear_input", False):
 
 # --- Chat input at the bottom (outside scrollable area) ---
 user_message = st.text_area("You:", key="chat_input", placeholder="Type your message here...")
+auto_voice = st.toggle(
+    "Auto-voice replies", key="auto_voice", disabled=not character_profile.voice,
+    help="Speak each sentence of the reply as soon as it is written"
+)
 if st.button("Send", key="send_message", disabled=(status != "idle")):
+    if auto_voice and character_profile.voice:
+        add_message(scenario_id, "user", user_message)
+        st.session_state.messages.append({"role": "user", "content": user_message})
+        progress_bus.clear(chat_reply_topic(scenario_id))
+        progress_bus.clear(chat_reply_speech_topic(scenario_id))
+        st.session_state["reply_speech_sub"] = progress_bus.subscribe(chat_reply_speech_topic(scenario_id))
+        st.session_state["reply_job"] = enqueue(
+            "reply_to_chat_voiced", priority=PRIORITY_INTERACTIVE, topic=chat_reply_topic(scenario_id),
+            llm_model=llm_model, profile_id=profile_id, scenario_id=scenario_id, scene_num=scene_num,
+            message=user_message, voice=character_profile.voice
+        )
+        st.session_state["clear_input"] = True
+        st.rerun()
     try:
         add_message(scenario_id, "user", user_message)
         st.session_state.messages.append({"role": "user", "content": user_message})
-        character_response = respond_to_chat(
+        char_msg = reply_to_chat(
             llm_model=llm_model,
             profile_id=profile_id,
             scenario_id=scenario_id,
             scene_num=scene_num,
             message=user_message
         )
-        char_msg = add_message(scenario_id, "character", character_response)
         st.session_state.messages.append(
             {
                 "role": "character",
-                "content": character_response,
+                "content": char_msg.content,
                 "order": char_msg.order,
                 "speech": char_msg.speech,
                 "id": char_msg.id
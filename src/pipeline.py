@@ -0,0 +1,238 @@
+"""Run a graph of dependent tasks on a few shared resources, as much in parallel as they allow.
+
+Each task needs one resource, e.g. the LLM or the GPU image backend, and may only start once
+the tasks it depends on have finished. The executor starts every ready task that has a free
+slot on its resource, preferring earlier items, then tasks that hand the most work to another
+resource, then tasks with the longest estimated chain of work still behind them. A pipeline
+over several items thus keeps every resource busy: the LLM writes item N+1 while the image
+backend renders item N. The report lists what ran when, how long each resource was busy,
+and the critical path: the chain of dependent tasks whose durations add up to the longest
+run, which no amount of extra concurrency can shorten.
+"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Optional
+
+from pydantic import BaseModel, ConfigDict
+
+from utils import logger
+
+
+class Task(BaseModel):
+    """A step of a pipeline. `fn` is called with the results of all tasks finished so far."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    name: str
+    fn: Callable[[dict[str, Any]], Any]
+    resource: str
+    deps: list[str] = []
+    estimate: float = 1.0  # Expected seconds, only used to order ready tasks
+    priority: int = 0  # Lower starts first among ready tasks, e.g. the index of the item it works on
+
+
+class TaskRun(BaseModel):
+    name: str
+    resource: str
+    deps: list[str] = []
+    status: str = "pending"  # pending, running, done, failed or skipped
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def seconds(self) -> float:
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+
+class RunReport(BaseModel):
+    runs: dict[str, TaskRun]
+    started_at: float
+    finished_at: float
+    results: dict[str, Any] = {}
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def seconds(self) -> float:
+        return self.finished_at - self.started_at
+
+    def busy_seconds(self) -> dict[str, float]:
+        """Total time each resource spent running tasks."""
+        busy: dict[str, float] = {}
+        for run in self.runs.values():
+            busy[run.resource] = busy.get(run.resource, 0.0) + run.seconds
+        return busy
+
+    def critical_path(self) -> list[str]:
+        """The chain of dependent tasks with the longest total running time."""
+        longest: dict[str, tuple[float, list[str]]] = {}
+
+        def path(name: str) -> tuple[float, list[str]]:
+            if name not in longest:
+                run = self.runs[name]
+                before = max((path(dep) for dep in run.deps if dep in self.runs), default=(0.0, []))
+                longest[name] = (before[0] + run.seconds, before[1] + [name])
+            return longest[name]
+
+        return max((path(name) for name in self.runs), default=(0.0, []))[1]
+
+    def summary(self) -> str:
+        busy = self.busy_seconds()
+        path = self.critical_path()
+        lines = [
+            f"Finished {sum(run.status == 'done' for run in self.runs.values())} of {len(self.runs)} tasks "
+            f"in {self.seconds:.1f}s",
+            "Busy: " + ", ".join(f"{resource} {seconds:.1f}s" for resource, seconds in sorted(busy.items())),
+            f"Critical path ({sum(self.runs[name].seconds for name in path):.1f}s): "
+            + " -> ".join(f"{name} ({self.runs[name].seconds:.1f}s)" for name in path),
+        ]
+        for run in self.runs.values():
+            if run.status in ("failed", "skipped"):
+                lines.append(f"{run.name} {run.status}" + (f": {run.error}" if run.error else ""))
+        return "\n".join(lines)
+
+
+class DagExecutor:
+    """Runs tasks once their dependencies are done, within per-resource concurrency limits.
+
+    `can_share(running, resource)` decides whether a task on `resource` may start while tasks
+    on the `running` resources are still going, e.g. whether both backends fit in VRAM.
+    `before_start(resource, running)` runs just before a task starts, e.g. to load its backend
+    without unloading the ones in use. A failed task skips everything that depends on it.
+    """
+
+    def __init__(
+            self,
+            limits: dict[str, int],
+            can_share: Optional[Callable[[set[str], str], bool]] = None,
+            before_start: Optional[Callable[[str, set[str]], Any]] = None,
+            on_update: Optional[Callable[[TaskRun], Any]] = None,
+            clock: Callable[[], float] = time.monotonic
+        ):
+        self.limits = limits
+        self.can_share = can_share
+        self.before_start = before_start
+        self.on_update = on_update
+        self.clock = clock
+
+    def run(self, tasks: list[Task]) -> RunReport:
+        by_name = {task.name: task for task in tasks}
+        for task in tasks:
+            missing = [dep for dep in task.deps if dep not in by_name]
+            if missing:
+                raise ValueError(f"Task {task.name} depends on unknown tasks {missing}")
+        rank = self._rank(by_name)
+        # Estimated work each task unblocks on other resources, which would otherwise sit idle
+        hands_off: dict[str, float] = {}
+        for task in tasks:
+            for dep in task.deps:
+                if by_name[dep].resource != task.resource:
+                    hands_off[dep] = max(hands_off.get(dep, 0.0), rank[task.name])
+        runs = {task.name: TaskRun(name=task.name, resource=task.resource, deps=task.deps) for task in tasks}
+        results: dict[str, Any] = {}
+        running: dict[Future, Task] = {}
+        start = self.clock()
+        workers = max(sum(self.limits.get(resource, 1) for resource in {task.resource for task in tasks}), 1)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline") as pool:
+            while True:
+                self._skip_blocked(runs)
+                ready = self._ready(by_name, runs, running, rank, hands_off)
+                for task in ready:
+                    run = runs[task.name]
+                    busy = {t.resource for t in running.values()}
+                    try:
+                        if self.before_start:
+                            self.before_start(task.resource, busy - {task.resource})
+                    except Exception as e:
+                        logger.error(f"Could not start pipeline task {task.name}: {e}")
+                        run.status, run.error = "failed", str(e)
+                        self._update(run)
+                        continue
+                    run.status, run.started_at = "running", self.clock()
+                    self._update(run)
+                    running[pool.submit(task.fn, dict(results))] = task
+                if not running:
+                    if ready:
+                        # Tasks failed to start, the ones waiting on them are skipped next
+                        continue
+                    break
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    run = runs[task.name]
+                    run.finished_at = self.clock()
+                    try:
+                        results[task.name] = future.result()
+                        run.status = "done"
+                    except Exception as e:
+                        logger.error(f"Pipeline task {task.name} failed: {e}")
+                        run.status, run.error = "failed", str(e)
+                    self._update(run)
+        return RunReport(runs=runs, started_at=start, finished_at=self.clock(), results=results)
+
+    def _ready(self, tasks: dict[str, Task], runs: dict[str, TaskRun], running: dict[Future, Task],
+               rank: dict[str, float], hands_off: dict[str, float]) -> list[Task]:
+        """Pending tasks to start now, in the order described in the module docstring."""
+        counts: dict[str, int] = {}
+        for task in running.values():
+            counts[task.resource] = counts.get(task.resource, 0) + 1
+        ready = [
+            task for task in tasks.values()
+            if runs[task.name].status == "pending" and all(runs[dep].status == "done" for dep in task.deps)
+        ]
+        ready.sort(key=lambda task: (task.priority, -hands_off.get(task.name, 0.0), -rank[task.name]))
+        started = []
+        for task in ready:
+            if counts.get(task.resource, 0) >= self.limits.get(task.resource, 1):
+                continue
+            busy = {resource for resource, count in counts.items() if count}
+            if self.can_share and task.resource not in busy and busy and not self.can_share(busy, task.resource):
+                continue
+            counts[task.resource] = counts.get(task.resource, 0) + 1
+            started.append(task)
+        return started
+
+    def _skip_blocked(self, runs: dict[str, TaskRun]):
+        changed = True
+        while changed:
+            changed = False
+            for run in runs.values():
+                if run.status == "pending" and any(runs[dep].status in ("failed", "skipped") for dep in run.deps):
+                    run.status, run.error = "skipped", "a dependency did not finish"
+                    self._update(run)
+                    changed = True
+
+    def _update(self, run: TaskRun):
+        if self.on_update:
+            try:
+                self.on_update(run)
+            except Exception as e:
+                logger.warning(f"Pipeline progress callback failed: {e}")
+
+    @staticmethod
+    def _rank(tasks: dict[str, Task]) -> dict[str, float]:
+        """Estimated seconds from the start of each task to the end of the longest chain after it."""
+        dependents: dict[str, list[str]] = {name: [] for name in tasks}
+        for task in tasks.values():
+            for dep in task.deps:
+                dependents[dep].append(task.name)
+        rank: dict[str, float] = {}
+        visiting: set[str] = set()
+
+        def visit(name: str) -> float:
+            if name in rank:
+                return rank[name]
+            if name in visiting:
+                raise ValueError(f"Tasks depend on each other in a cycle through {name}")
+            visiting.add(name)
+            rank[name] = tasks[name].estimate + max((visit(after) for after in dependents[name]), default=0.0)
+            visiting.discard(name)
+            return rank[name]
+
+        for name in tasks:
+            visit(name)
+        return rank
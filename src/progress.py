@@ -0,0 +1,175 @@
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+from pydantic import BaseModel
+
+from utils import logger, settings
+
+
+class ProgressEvent(BaseModel):
+    """Progress of a long running job, as published on the bus."""
+
+    topic: str
+    message: str = ""
+    current: Optional[int] = None  # Items finished, e.g. images or scenes
+    total: Optional[int] = None
+    percent: Optional[float] = None  # 0.0 to 1.0
+    preview: Optional[str] = None  # Image path, URL or data URL of the work in progress
+    done: bool = False
+    timestamp: float = 0.0
+
+
+class Subscription:
+    """Queue of the events published on a topic after subscribing."""
+
+    def __init__(self, bus: "ProgressBus", topic: str, maxsize: int):
+        self.bus = bus
+        self.topic = topic
+        self._queue: queue.Queue[ProgressEvent] = queue.Queue(maxsize=maxsize)
+
+    def put(self, event: ProgressEvent):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # Slow subscribers only need the most recent progress
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            self._queue.put_nowait(event)
+
+    def get(self, timeout: Optional[float] = None) -> Optional[ProgressEvent]:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self) -> list[ProgressEvent]:
+        events = []
+        while (event := self.get(timeout=0)) is not None:
+            events.append(event)
+        return events
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class ProgressBus:
+    """In-process publish/subscribe channel for job progress.
+
+    Publishing only touches memory, so producers can report every event they see. Pages poll
+    `latest` for a snapshot, while `subscribe` hands out a bounded queue of every event.
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._latest: dict[str, ProgressEvent] = {}
+        self._subscribers: dict[str, list[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def publish(self, topic: str, **fields) -> ProgressEvent:
+        with self._lock:
+            previous = self._latest.get(topic)
+            # Keep the last preview until a newer one arrives
+            if previous and not fields.get("preview") and not fields.get("done"):
+                fields["preview"] = previous.preview
+            event = ProgressEvent(topic=topic, timestamp=time.time(), **fields)
+            self._latest[topic] = event
+            subscribers = list(self._subscribers.get(topic, []))
+        for subscription in subscribers:
+            subscription.put(event)
+        return event
+
+    def latest(self, topic: str) -> Optional[ProgressEvent]:
+        with self._lock:
+            return self._latest.get(topic)
+
+    def subscribe(self, topic: str) -> Subscription:
+        subscription = Subscription(self, topic, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(topic, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.topic, [])
+            if subscription in subscribers:
+                subscribers.remove(subscription)
+
+    def clear(self, topic: str):
+        with self._lock:
+            self._latest.pop(topic, None)
+
+
+bus = ProgressBus()
+
+
+def profile_images_topic(profile_id) -> str:
+    return f"profile:{profile_id}:images"
+
+
+def scenario_images_topic(scenario_id) -> str:
+    return f"scenario:{scenario_id}:images"
+
+
+def message_speech_topic(message_id) -> str:
+    return f"message:{message_id}:speech"
+
+
+def voicing_topic(scenario_id=None, profile_id=None) -> str:
+    if scenario_id is not None:
+        return f"scenario:{scenario_id}:voicing"
+    if profile_id is not None:
+        return f"profile:{profile_id}:voicing"
+    return "voicing"
+
+
+def surprise_me_topic() -> str:
+    return "surprise_me"
+
+
+def chat_reply_topic(scenario_id) -> str:
+    return f"scenario:{scenario_id}:reply"
+
+
+def chat_reply_speech_topic(scenario_id) -> str:
+    return f"scenario:{scenario_id}:reply:speech"
+
+
+class ThrottledStatus:
+    """Writes a status text to the database at most once per `interval` seconds.
+
+    The first and the final update are always written, so the model usage status still gates
+    other jobs; the updates in between only keep the stored text roughly current.
+    """
+
+    def __init__(self, save: Callable[[str], None], interval: Optional[float] = None):
+        self._save = save
+        self.interval = settings.PROGRESS_PERSIST_INTERVAL if interval is None else interval
+        self._last_saved = 0.0
+        self._pending: Optional[str] = None
+        self._lock = threading.Lock()
+        self.writes = 0
+
+    def update(self, status: str, force: bool = False):
+        with self._lock:
+            now = time.monotonic()
+            if not force and self.writes and now - self._last_saved < self.interval:
+                self._pending = status
+                return
+            self._pending = None
+            self._last_saved = now
+            self.writes += 1
+        try:
+            self._save(status)
+        except Exception as e:
+            logger.warning(f"Could not save status {status!r}: {e}")
+
+    def flush(self):
+        """Write the last skipped update, if any."""
+        with self._lock:
+            status = self._pending
+        if status is not None:
+            self.update(status, force=True)
@@ -1,15 +1,37 @@
+import contextvars
 import json
-from models import Profile, Scenario, MessageSchema
-from db import get_message, get_model_usage, save_model_usage, get_profile, save_profile, get_scenario, save_scenario, get_messages, get_next_message_order, save_message
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional
+from models import Profile, ProfileSchema, Scenario, ScenarioSchema, SceneDescriptionsSchema, MessageSchema
+from db import (
+    get_message, get_model_usage, save_model_usage, get_profile, save_profile, get_scenario, save_scenario,
+    get_messages, get_next_message_order, save_message, save_message_candidates, pop_message_candidate,
+    release_speech, replace_speech, get_unvoiced_messages, set_message_speeches, get_profiles,
+    get_scenarios_for_profile, set_stage_done
+)
 from ml.llm import InferenceLLMConfig, stop_ollama_container, extract_json_from_response, remove_thinking
-from ml.swarm_ui import image_from_prompt, seed_from_image, stop_swarmui
-from ml.tts import get_tts_audio, remove_action_text, stop_tts_container
-from utils import settings, logger
-from tenacity import (
-    retry,
-    stop_after_attempt,
-    wait_fixed
+from ml.swarm_ui import image_from_prompt, image_from_prompt_stream, seed_from_image, stop_swarmui
+from ml.tts import (
+    FILES_DIR as SPEECH_DIR, cached_speech, get_tts_audio, remove_action_text, stop_tts_container, transcode_async,
+    voice_stream
+)
+from ml.vram_scheduler import get_scheduler, LLM, IMAGE, TTS
+from ml.resilience import resilient
+from jobs import ModelsBusy, cancel_event
+from progress import (
+    ThrottledStatus, bus as progress_bus, chat_reply_topic, chat_reply_speech_topic, message_speech_topic,
+    profile_images_topic, scenario_images_topic, surprise_me_topic, voicing_topic
 )
+from utils import settings, logger
+from pipeline import DagExecutor, RunReport, Task
+
+# Set while a pipeline stage runs, to report its status instead of saving it, see `model_usage`
+_stage_status: contextvars.ContextVar = contextvars.ContextVar("stage_status", default=None)
 
 def stop_models():
     """Stops models"""
@@ -17,6 +39,57 @@ def stop_models():
     stop_swarmui()
     stop_tts_container()
 
+def model_usage():
+    """The model usage record, as seen by the job about to use the models.
+
+    Stages of a pipeline share the models the pipeline holds, so they see them as idle, see
+    `run_surprise_me`.
+    """
+    usage = get_model_usage()
+    if usage is not None and _stage_status.get() is not None:
+        usage.status = "idle"
+    return usage
+
+def save_usage(usage):
+    """Save the model usage status, or report it as the status of the running pipeline stage."""
+    report = _stage_status.get()
+    if report is not None:
+        report(usage.status)
+        return
+    save_model_usage(usage)
+
+def usage_status(usage) -> ThrottledStatus:
+    """Throttled writer for the model usage status, so frequent progress does not flood the DB."""
+    # Progress callbacks run on other threads, so look up the pipeline stage up front
+    report = _stage_status.get()
+
+    def save(status):
+        usage.status = status
+        if report is not None:
+            report(status)
+        else:
+            save_model_usage(usage)
+    return ThrottledStatus(save)
+
+def stage_reporter(status: ThrottledStatus, label: str) -> Callable[[str, str], None]:
+    """Combine the statuses of stages running side by side into one usage status.
+
+    Returns `report(stage, stage_status)`, to be called from any thread; "idle" ends the
+    stage. The status reads "<label>: <status>; <status>", or just the label when no stage runs.
+    """
+    active: dict[str, str] = {}
+    lock = threading.Lock()
+
+    def report(stage: str, stage_status: str):
+        with lock:
+            if stage_status == "idle":
+                active.pop(stage, None)
+            else:
+                active[stage] = stage_status
+            text = "; ".join(active.values())
+        status.update(f"{label}: {text}" if text else label)
+    return report
+
 def set_status_to_idle():
     """Return status to idle"""
     usage = get_model_usage()
@@ -28,25 +101,54 @@ def set_status_to_idle():
         logger.info("No error state to clear, models already idle.")
     return usage.status
 
-@retry(
-    wait=wait_fixed(15),
-    stop=stop_after_attempt(2),
-    after=lambda retry_state: logger.warning(
-        f"Retrying profile generation due to error: {retry_state.outcome.exception()}"
-    ),
-)
-def generate_profile(llm_model: str, special_requests: str, gen_images: bool = True) -> Profile:
-    """Generate a profile based on the following prompts."""
-    usage = get_model_usage()
+def generate_profile(llm_model: str, special_requests: str, gen_images: bool = True) -> Optional[ProfileSchema]:
+    """Generate a profile based on the following prompts.
+
+    Only the text is retried. Once the profile is saved, failures of the image stages are
+    logged and left for `resume_profile`, so they never create a second profile.
+    """
+    usage = model_usage()
     if usage.status != "idle":
-        logger.warning("Model usage is not idle, cannot generate images.")
-        return
+        raise ModelsBusy("Model usage is not idle, cannot generate profile.")
     usage.status = "Generating Profile"
-    save_model_usage(usage)
+    save_usage(usage)
+    try:
+        profile_data = generate_profile_text(llm_model, special_requests)
+    finally:
+        usage.status = "idle"
+        save_usage(usage)
+    profile = save_profile(
+        Profile(
+            name=profile_data.get("name", "Default Name"),
+            background=profile_data.get("background"),
+            personality=profile_data.get("personality"),
+            interests=profile_data.get("interests"),
+            physical_characteristics=profile_data.get("physical_characteristics"),
+            voice="tara",
+            stages=json.dumps(["text"])
+        )
+    )
+    # Generate profile image description and single profile images if requested
+    if gen_images:
+        logger.info("Generating profile image description and main profile image.")
+        try:
+            profile = resume_profile(profile.id, llm_model, usage.image_model, num_images=1)
+            logger.info(f"Profile image description and images generated for profile ID {profile.id}")
+        except Exception as e:
+            logger.error(f"Error generating profile image: {e}")
+    logger.info(f"Profile generated")
+    return profile
+
+# The LLM call retries its own connection errors, this retries replies that do not parse
+@resilient(LLM, retry_on=(ValueError,), attempts=2, breaker=False)
+def generate_profile_text(llm_model: str, special_requests: str) -> dict:
+    """The fields of a new profile from the LLM."""
+    get_scheduler().ensure_resident(LLM)
     llm = InferenceLLMConfig(
         model_name=llm_model,
         base_url=settings.INFERENCE_BASE_URL,
         api_key=settings.INFERENCE_API_KEY,
+        task="profile",
     )
     logger.info(f"Generating profile using Ollama LLM: {llm.model_name}")
     response = llm.generate_from_messages(
@@ -85,59 +187,66 @@ def generate_profile(llm_model: str, special_requests: str, gen_images: bool = T
             },
         ]
     )
-    usage.status = "idle"
-    save_model_usage(usage)
     if not response:
         raise ValueError("Failed to generate profile: No content in response")
     profile_data = extract_json_from_response(response)
     if not profile_data:
         raise ValueError(f"Failed to extract profile data from response: {response}")
     logger.info(f"Profile data generated: {profile_data}")
-    profile = save_profile(
-        Profile(
-            name=profile_data.get("name", "Default Name"),
-            background=profile_data.get("background"),
-            personality=profile_data.get("personality"),
-            interests=profile_data.get("interests"),
-            physical_characteristics=profile_data.get("physical_characteristics"),
-            voice="tara"
-        )
-    )
-    # Generate profile image description and single profile images if requested
-    if gen_images:
-        logger.info("Generating profile image description and main profile image.")
-        try:
-            generate_profile_image_description(profile.id, llm_model=llm_model)
-            generate_sample_profile_images(
-                profile_id=profile.id,
-                image_model=usage.image_model,
-                num_images=1
-            )
-            # Save the first image seed to the profile
-            profile = get_profile(profile.id)  # Refresh profile to get updated image path
-            profile.image_seed = seed_from_image(profile.profile_image_path)
-            save_profile(profile)
-            logger.info(f"Profile image description and images generated for profile ID {profile.id}")
-        except Exception as e:
-            logger.error(f"Error generating profile image: {e}")
-    logger.info(f"Profile generated")
+    return profile_data
+
+def resume_profile(profile_id, llm_model: str, image_model: str, num_images=None) -> Optional[ProfileSchema]:
+    """Run the generation stages of a profile that are not done yet, in order.
+
+    Stops at the first stage that does not finish, so running it again picks up from there.
+    """
+    stage_runs = {
+        "image_description": lambda: generate_profile_image_description(profile_id, llm_model),
+        "sample_images": lambda: generate_sample_profile_images(profile_id, image_model, num_images),
+        "seed": lambda: set_profile_seed(profile_id),
+    }
+    profile = get_profile(profile_id)
+    if not profile:
+        logger.error(f"Cannot resume profile {profile_id}: it does not exist.")
+        return None
+    while (stage := profile.next_stage()) is not None:
+        if cancel_event().is_set():
+            break
+        logger.info(f"Resuming profile {profile_id} at stage {stage}")
+        stage_runs[stage]()
+        profile = get_profile(profile_id)
+        if not profile.is_done(stage) and not cancel_event().is_set():
+            raise RuntimeError(f"Stage {stage} of profile {profile_id} did not finish")
+    return ProfileSchema.model_validate(profile)
+
+def set_profile_seed(profile_id) -> Optional[str]:
+    """Seed scenario images from the first profile image."""
+    profile = get_profile(profile_id)
+    images = profile.get_images()
+    if not images:
+        raise ValueError("Cannot set image seed: the profile has no images.")
+    profile.image_seed = seed_from_image(images[0])
+    save_profile(profile)
+    set_stage_done(Profile, profile_id, "seed")
+    return profile.image_seed
 
 def generate_profile_image_description(profile_id, llm_model: str) -> str:
     """Generate a description for the profile image based on the profile's physical characteristics."""
     profile = get_profile(profile_id)
     if not profile.physical_characteristics:
         raise ValueError("Cannot generate image description: physical_characteristics is empty.")
-    usage = get_model_usage()
+    usage = model_usage()
     if usage.status != "idle":
-        logger.warning("Model usage is not idle, cannot generate images.")
-        return
+        raise ModelsBusy("Model usage is not idle, cannot generate profile image description.")
     usage.status = "Generating Profile Image Description"
-    save_model_usage(usage)
+    save_usage(usage)
     try:
+        get_scheduler().ensure_resident(LLM)
         llm = InferenceLLMConfig(
             model_name=llm_model,
             base_url=settings.INFERENCE_BASE_URL,
             api_key=settings.INFERENCE_API_KEY,
+            task="profile_image",
         )
         logger.info(f"Generating profile image description using Ollama LLM: {llm.model_name}")
         response = llm.generate_from_messages(
@@ -166,27 +275,35 @@ def generate_profile_image_description(profile_id, llm_model: str) -> str:
                 },
             ]
         )
-        usage.status = "idle"
-        save_model_usage(usage)
+        logger.info(f"Generated profile image description: {response}")
         if not response:
-            raise ValueError("Failed to generate profile image description: No content in response")
+            raise RuntimeError("Failed to generate profile image description: No content in response")
         profile.profile_image_description = response + ". solo, 1girl."
         save_profile(profile)
+        set_stage_done(Profile, profile_id, "image_description")
     except Exception as e:
         logger.error(f"Error generating profile image description: {e}")
+        raise
     finally:
-        logger.info(f"Generated profile image description: {response}")
+        usage.status = "idle"
+        save_usage(usage)
+
+def generate_sample_profile_images(profile_id, image_model, num_images=None):
+    """Generate a set of draft images based on a profile's image description.
 
-def generate_sample_profile_images(profile_id, image_model, num_images=3):
-    """Generate a set of images based on a profile's image description."""
+    Drafts are cheap renders to choose a seed from; the chosen one is rendered at full
+    quality by `generate_main_profile_image`.
+    """
+    num_images = num_images or settings.SWARMUI_DRAFT_BATCH
     profile = get_profile(profile_id)
     if not profile.profile_image_description:
         raise ValueError("Cannot generate images: profile image description is empty.")
-    usage = get_model_usage()
+    usage = model_usage()
     if usage.status != "idle":
-        logger.warning("Model usage is not idle, cannot generate images.")
-        return
+        raise ModelsBusy("Model usage is not idle, cannot generate images.")
     logger.info(f"Starting background image generation for profile ID {profile_id} using model {image_model}")
+    topic = profile_images_topic(profile_id)
+    status = usage_status(usage)
     try:
         # Load existing image paths if present
         if profile.profile_image_path:
@@ -199,39 +316,46 @@ def generate_sample_profile_images(profile_id, image_model, num_images=3):
         else:
             image_list = []
 
-        for i in range(num_images):
-            usage.status = f"Generating Sample Profile Image {i + 1} of {num_images}"
-            save_model_usage(usage)
-            filename = image_from_prompt(profile.profile_image_description, model=image_model, preset="seed_search")
-            usage.status = "idle"
-            save_model_usage(usage)
-            logger.info(f"Image(s) generated and saved to {filename}")
-            # Normalize filename(s) to a list of strings
-            if not filename:
-                logger.error("Failed to generate image: No filenames returned")
-                continue
-            if isinstance(filename, list):
-                image_list.extend(filename)
-            elif isinstance(filename, str) and filename.startswith("[") and "'" in filename:
-                # Replace single quotes with double quotes and parse as list
-                filename = filename.replace("'", '"')
-                try:
-                    parsed = json.loads(filename)
-                    if isinstance(parsed, list):
-                        image_list.extend(parsed)
-                    else:
-                        image_list.append(parsed)
-                except Exception:
-                    image_list.append(filename)
-            else:
-                image_list.append(filename)
-            # Save after each addition
+        get_scheduler().ensure_resident(IMAGE)
+        status.update(f"Generating Sample Profile Image 1 of {num_images}", force=True)
+
+        def save_image(filename):
+            # Persist each image as soon as it arrives so the page can show it
+            image_list.append(filename)
             profile.profile_image_path = json.dumps(image_list)
             save_profile(profile)
+            generated = len(image_list) - existing
+            logger.info(f"Image {generated} of {num_images} saved to {filename}")
+            progress_bus.publish(topic, message=f"Image {generated} of {num_images} done", current=generated,
+                                 total=num_images, percent=generated / num_images, preview=filename)
+            if generated < num_images:
+                status.update(f"Generating Sample Profile Image {generated + 1} of {num_images}")
+
+        def show_progress(progress):
+            index = int(progress.get("batch_index", 0))
+            progress_bus.publish(topic, message=f"Rendering image {index + 1} of {num_images}",
+                                 current=len(image_list) - existing, total=num_images,
+                                 percent=float(progress.get("overall_percent", 0)), preview=progress.get("preview"))
+
+        existing = len(image_list)
+        filenames = image_from_prompt(
+            profile.profile_image_description,
+            model=image_model,
+            preset="draft",
+            num_images=num_images,
+            on_image=save_image,
+            on_progress=show_progress,
+        )
+        if len(image_list) == existing:
+            raise RuntimeError("Failed to generate images: No filenames returned")
+        set_stage_done(Profile, profile_id, "sample_images")
         logger.info(f"Profile image path set to: {profile.profile_image_path}")
     except Exception as e:
         logger.error(f"Error generating images for profile ID {profile_id}: {e}")
+        raise
     finally:
+        status.update("idle", force=True)
+        progress_bus.publish(topic, message="Image generation finished", done=True)
         logger.info(f"Background image generation completed for profile ID {profile_id}")
     return profile
 
@@ -240,19 +364,17 @@ def generate_main_profile_image(profile_id, image_model: str, image_seed: str):
     profile = get_profile(profile_id)
     if not profile.profile_image_description:
         raise ValueError("Cannot generate image: profile_image_descriptiong is empty.")
-    usage = get_model_usage()
+    usage = model_usage()
     if usage.status != "idle":
-        logger.warning("Model usage is not idle, cannot generate images.")
-        return
+        raise ModelsBusy("Model usage is not idle, cannot generate images.")
     usage.status = "Generating Main Profile Image"
-    save_model_usage(usage)
+    save_usage(usage)
     try:
+        get_scheduler().ensure_resident(IMAGE)
         filenames = image_from_prompt(profile.profile_image_description, model=image_model, preset="target", seed=image_seed)
-        usage.status = "idle"
-        save_model_usage(usage)
         logger.info(f"Image(s) generated and saved to {filenames}")
         if not filenames:
-            raise ValueError("Failed to generate images: No filenames returned")
+            raise RuntimeError("Failed to generate images: No filenames returned")
         elif isinstance(filenames, list):
             # Convert list of filenames to a JSON string
             filenames = json.dumps(filenames)
@@ -266,36 +388,73 @@ def generate_main_profile_image(profile_id, image_model: str, image_seed: str):
         profile.profile_image_path = filenames
         profile.image_seed = image_seed
         save_profile(profile)
+        set_stage_done(Profile, profile_id, "seed")
         logger.info(f"Profile image path set to: {profile.profile_image_path}")
     except Exception as e:
         logger.error(f"Error generating images for profile ID {profile_id}: {e}")
+        raise
     finally:
+        usage.status = "idle"
+        save_usage(usage)
         logger.info(f"Background image generation completed for profile ID {profile_id}")
     return profile
 
-@retry(
-    wait=wait_fixed(15),
-    stop=stop_after_attempt(3),
-    after=lambda retry_state: logger.warning(
-        f"Retrying scenario generation due to error: {retry_state.outcome.exception()}"
-    ),
-)
-def generate_scenario(profile_id, llm_model: str, special_requests="", gen_images: bool = True) -> "Scenario":
-    """Generate a scenario based on the following prompts."""
+def generate_scenario(profile_id, llm_model: str, special_requests="", gen_images: bool = True) -> Optional[ScenarioSchema]:
+    """Generate a scenario based on the following prompts.
+
+    Only the text is retried. Once the scenario is saved, failures of the scene stages are
+    logged and left for `resume_scenario`, so they never create a second scenario.
+    """
     profile = get_profile(profile_id)
     if not profile:
         logger.error("Cannot generate scenario: profile is empty.")
         return
-    usage = get_model_usage()
+    usage = model_usage()
     if usage.status != "idle":
-        logger.error("Model usage is not idle, cannot generate scenario.")
-        return
+        raise ModelsBusy("Model usage is not idle, cannot generate scenario.")
     usage.status = "Generating Scenario"
-    save_model_usage(usage)
+    save_usage(usage)
+    try:
+        scenario_data = generate_scenario_text(profile, llm_model, special_requests)
+    finally:
+        usage.status = "idle"
+        save_usage(usage)
+    saved_senario = save_scenario(
+        Scenario(
+            title=scenario_data.get("title", "Default Title"),
+            profile_id=profile.id,
+            summary=scenario_data.get("summary"),
+            scene_summaries=scenario_data.get("scene_summaries"),
+            invitation=scenario_data.get("invitation"),
+            stages=json.dumps(["text"])
+        )
+    )
+    # Add the invitation as the first message
+    first_message = MessageSchema(
+        role="character",
+        content=scenario_data.get("invitation"),
+        scenario_id=saved_senario.id,
+        order=get_next_message_order(scenario_id=saved_senario.id)
+    )
+    save_message(first_message)
+    if gen_images:
+        try:
+            saved_senario = resume_scenario(saved_senario.id, llm_model, usage.image_model)
+            logger.info(f"Scenario images generated for scenario ID {saved_senario.id}")
+        except Exception as e:
+            logger.error(f"Error generating scenario images: {e}")
+    logger.info(f"Scenario data generated: {scenario_data}.")
+    return saved_senario
+
+@resilient(LLM, retry_on=(ValueError,), breaker=False)
+def generate_scenario_text(profile, llm_model: str, special_requests="") -> dict:
+    """The fields of a new scenario for `profile` from the LLM."""
+    get_scheduler().ensure_resident(LLM)
     llm = InferenceLLMConfig(
         model_name=llm_model,
         base_url=settings.INFERENCE_BASE_URL,
         api_key=settings.INFERENCE_API_KEY,
+        task="scenario",
     )
     logger.info(f"Generating scenario with {profile.name}")
     response = llm.generate_from_messages(
@@ -333,57 +492,83 @@ def generate_scenario(profile_id, llm_model: str, special_requests="", gen_image
             }
         ]
     )
-    usage.status = "idle"
-    save_model_usage(usage)
     if not response:
         raise ValueError("Failed to generate scenario: No content in response")
     scenario_data = extract_json_from_response(response)
     if not scenario_data:
         raise ValueError(f"Failed to extract scenario data from response: {response}")
-    saved_senario = save_scenario(
-        Scenario(
-            title=scenario_data.get("title", "Default Title"),
-            profile_id=profile.id,
-            summary=scenario_data.get("summary"),
-            scene_summaries=scenario_data.get("scene_summaries"),
-            invitation=scenario_data.get("invitation")
-        )
-    )
-    # Add the invitation as the first message
-    first_message = MessageSchema(
-        role="character",
-        content=scenario_data.get("invitation"),
-        scenario_id=saved_senario.id,
-        order=get_next_message_order(scenario_id=saved_senario.id)
+    return scenario_data
+
+def resume_scenario(scenario_id, llm_model: str, image_model: str) -> Optional[ScenarioSchema]:
+    """Run the generation stages of a scenario that are not done yet, in order.
+
+    Stops at the first stage that does not finish, so running it again picks up from there.
+    With SCENE_IMAGES_HANDOFF the scene images render while their descriptions are written.
+    """
+    stage_runs = {
+        "scene_descriptions": lambda: (
+            generate_scene_descriptions_and_images(scenario_id, llm_model, image_model)
+            if image_model and settings.SCENE_IMAGES_HANDOFF
+            else generate_scene_descriptions(scenario_id, llm_model)
+        ),
+        "scene_images": lambda: generate_scenario_images(scenario_id, image_model),
+    }
+    scenario = get_scenario(scenario_id)
+    if not scenario:
+        logger.error(f"Cannot resume scenario {scenario_id}: it does not exist.")
+        return None
+    while (stage := scenario.next_stage()) is not None:
+        if cancel_event().is_set():
+            break
+        logger.info(f"Resuming scenario {scenario_id} at stage {stage}")
+        stage_runs[stage]()
+        scenario = get_scenario(scenario_id)
+        if not scenario.is_done(stage) and not cancel_event().is_set():
+            raise RuntimeError(f"Stage {stage} of scenario {scenario_id} did not finish")
+    return ScenarioSchema.model_validate(scenario)
+
+SCENE_PROMPT_RULES = (
+    "Creativity and conciseness "
+    "are vital, as you must invent visual details that add depth to the scene while limiting "
+    "the size of your response to fit in an AI model's limited context window (adjective noun, "
+    " evocative phrase segments are best). "
+    "Start the prompt with the character's physical characteristics. Always include consistent "
+    "characteristics like hair color and eye color. Infer where the scene "
+    "takes place and what the character is doing based on the scenario summary and scene summary. "
+    "Describe their clothing (or revealed body parts if their clothing has been removed) based on "
+    "where they are and what they're doing maintaining consistent clothing color from previous "
+    "scenes. List their facial expression and posture. List elements "
+    "of the scene background noting lighting and details of any other relevant objects in the scene. "
+    "Reference the previous scene description if provided to avoid discontinuity in clothing or "
+    "scene background unless the current scene summary calls for a change. Include only the visual "
+    "elements that would be captured in a photograph. Replace the character's name with an "
+    "adjective and their gender (e.g., sexy woman). Remove any unnecessary words like articles "
+    "and conjunctions (e.g., with, and) or non-visible text (e.g., feelings, thoughts). "
+)
+
+def scene_description_llm(llm_model: str, task: str = "scene") -> InferenceLLMConfig:
+    return InferenceLLMConfig(
+        model_name=llm_model,
+        base_url=settings.INFERENCE_BASE_URL,
+        api_key=settings.INFERENCE_API_KEY,
+        task=task,
     )
-    save_message(first_message)
-    if gen_images:
-        try:
-            generate_scene_descriptions(saved_senario.id, llm_model)
-            generate_scenario_images(saved_senario.id, usage.image_model)
-            logger.info(f"Scenario images generated for scenario ID {saved_senario.id}")
-        except Exception as e:
-            logger.error(f"Error generating scenario images: {e}")
-    logger.info(f"Scenario data generated: {scenario_data}.")
 
-def generate_scene_description(scenario, llm_model: str, scene_id: int, previous_scene_description: str = ""):
+def generate_scene_description(scenario, llm_model: str, scene_id: int, previous_scene_description: str = "",
+                               llm: Optional[InferenceLLMConfig] = None):
     """Generate a scene description based on the profile's physical characteristics and scene."""
     if not scenario.profile.physical_characteristics:
         raise ValueError("Cannot generate scene description: physical_characteristics is empty.")
-    usage = get_model_usage()
+    usage = model_usage()
     if usage.status != "idle":
-        logger.warning("Model usage is not idle, cannot generate images.")
-        return
+        raise ModelsBusy("Model usage is not idle, cannot generate scene description.")
     scene_summary = scenario.get_scene_summaries_as_array()[scene_id] if scenario.get_scene_summaries_as_array() else ""
     total_scenes = len(scenario.get_scene_summaries_as_array())
     usage.status = f"Generating Scene Description {scene_id + 1} of {total_scenes}"
-    save_model_usage(usage)
+    save_usage(usage)
     try:
-        llm = InferenceLLMConfig(
-            model_name=llm_model,
-            base_url=settings.INFERENCE_BASE_URL,
-            api_key=settings.INFERENCE_API_KEY,
-        )
+        get_scheduler().ensure_resident(LLM)
+        llm = llm or scene_description_llm(llm_model)
         logger.info(f"Generating scene description for scene_id: {scene_id} using: {llm.model_name}")
         response = llm.generate_from_messages(
             messages=[
@@ -391,22 +576,7 @@ def generate_scene_description(scenario, llm_model: str, scene_id: int, previous
                     "role": "system",
                     "content": "As a scene generator, your job is to write a prompt for an image generator "
                     "(i.e., string of words, short phrases separated by commas) "
-                    "that describes a visual scene of a character. Creativity and conciseness "
-                    "are vital, as you must invent visual details that add depth to the scene while limiting "
-                    "the size of your response to fit in an AI model's limited context window (adjective noun, "
-                    " evocative phrase segments are best). "
-                    "Start the prompt with the character's physical characteristics. Always include consistent "
-                    "characteristics like hair color and eye color. Infer where the scene "
-                    "takes place and what the character is doing based on the scenario summary and scene summary. "
-                    "Describe their clothing (or revealed body parts if their clothing has been removed) based on "
-                    "where they are and what they're doing maintaining consistent clothing color from previous "
-                    "scenes. List their facial expression and posture. List elements "
-                    "of the scene background noting lighting and details of any other relevant objects in the scene. "
-                    "Reference the previous scene description if provided to avoid discontinuity in clothing or "
-                    "scene background unless the current scene summary calls for a change. Include only the visual "
-                    "elements that would be captured in a photograph. Replace the character's name with an "
-                    "adjective and their gender (e.g., sexy woman). Remove any unnecessary words like articles "
-                    "and conjunctions (e.g., with, and) or non-visible text (e.g., feelings, thoughts). "
+                    "that describes a visual scene of a character. " + SCENE_PROMPT_RULES +
                     "Write the response as a single string of 100 words or less.",
                 },
                 {
@@ -418,94 +588,428 @@ def generate_scene_description(scenario, llm_model: str, scene_id: int, previous
                 },
             ]
         )
-        usage.status = "idle"
-        save_model_usage(usage)
         #Strip out anything between <think>...</think> tags
         response = remove_thinking(response)
+        logger.info(f"Generated scene description: {response}")
         if not response:
             raise ValueError("Failed to generate scene description: No content in response")
     except Exception as e:
         logger.error(f"Error generating scene description: {e}")
-        usage.status = "Error generating scene description"
+        response = None
     finally:
-        logger.info(f"Generated scene description: {response}")
+        usage.status = "idle"
+        save_usage(usage)
     return response
 
-def generate_scene_descriptions(scenario_id, llm_model: str) -> str:
-    """Generate the scenario's scene descriptions based on the scene summaries."""
+def generate_all_scene_descriptions(scenario, llm_model: str, llm: Optional[InferenceLLMConfig] = None) -> list[str]:
+    """Describe every scene of a scenario in one structured LLM call, in scene order.
+
+    The model sees all scene summaries at once, so continuity between scenes is kept in
+    context instead of by passing each description on to the next call. Returns the
+    descriptions it got, which may be fewer than the scenes, or none on failure.
+    """
+    if not scenario.profile.physical_characteristics:
+        raise ValueError("Cannot generate scene descriptions: physical_characteristics is empty.")
+    usage = model_usage()
+    if usage.status != "idle":
+        raise ModelsBusy("Model usage is not idle, cannot generate scene descriptions.")
+    scene_summaries = scenario.get_scene_summaries_as_array()
+    usage.status = f"Generating {len(scene_summaries)} Scene Descriptions"
+    save_usage(usage)
+    descriptions = []
+    try:
+        get_scheduler().ensure_resident(LLM)
+        llm = llm or scene_description_llm(llm_model, task="scenes")
+        logger.info(f"Generating {len(scene_summaries)} scene descriptions in one call using: {llm.model_name}")
+        scenes = "\n".join(f"{i + 1}. {summary}" for i, summary in enumerate(scene_summaries))
+        response = llm.generate_from_messages(
+            messages=[
+                {
+                    "role": "system",
+                    "content": "As a scene generator, your job is to write one prompt for an image generator "
+                    "(i.e., string of words, short phrases separated by commas) per scene summary, each "
+                    "describing a visual scene of a character. " + SCENE_PROMPT_RULES +
+                    "The previous scene description is the one you wrote for the scene before. "
+                    "Write each description as a single string of 100 words or less. Use proper json "
+                    "format with the key 'scene_descriptions' holding an array of strings, one per "
+                    "scene summary and in the same order.",
+                },
+                {
+                    "role": "user",
+                    "content": f"Character physical characteristics: {scenario.profile.physical_characteristics}.\n"
+                    f"Scenario summary: {scenario.summary}.\n"
+                    f"Scene summaries:\n{scenes}",
+                },
+            ],
+            schema=SceneDescriptionsSchema,
+        )
+        descriptions = [remove_thinking(d).strip() for d in response.scene_descriptions]
+        if len(descriptions) != len(scene_summaries):
+            logger.warning(f"Got {len(descriptions)} scene descriptions for {len(scene_summaries)} scenes")
+        descriptions = descriptions[:len(scene_summaries)]
+    except Exception as e:
+        logger.error(f"Error generating scene descriptions: {e}")
+    finally:
+        usage.status = "idle"
+        save_usage(usage)
+    # Only keep the leading descriptions that have content, the scenes after them are written one by one
+    kept = []
+    for description in descriptions:
+        if not description:
+            break
+        kept.append(description)
+    return kept
+
+def stream_all_scene_descriptions(scenario, llm_model: str, llm: Optional[InferenceLLMConfig] = None) -> Iterator[str]:
+    """Describe every scene of a scenario in one streamed LLM call, yielding each description when it is written.
+
+    Like `generate_all_scene_descriptions`, but the model writes one numbered description
+    per line instead of JSON, so the first scenes can be rendered while it writes the rest.
+    Descriptions are taken by their scene number: repeated ones are dropped, and it stops at
+    a skipped scene or on failure, so it may yield fewer descriptions than there are scenes.
+    """
+    if not scenario.profile.physical_characteristics:
+        raise ValueError("Cannot generate scene descriptions: physical_characteristics is empty.")
+    usage = model_usage()
+    if usage.status != "idle":
+        raise ModelsBusy("Model usage is not idle, cannot generate scene descriptions.")
+    scene_summaries = scenario.get_scene_summaries_as_array()
+    usage.status = f"Generating {len(scene_summaries)} Scene Descriptions"
+    save_usage(usage)
+    written = 0
+    try:
+        get_scheduler().ensure_resident(LLM)
+        llm = llm or scene_description_llm(llm_model, task="scenes")
+        logger.info(f"Streaming {len(scene_summaries)} scene descriptions in one call using: {llm.model_name}")
+        scenes = "\n".join(f"{i + 1}. {summary}" for i, summary in enumerate(scene_summaries))
+        pieces = llm.stream_from_messages(
+            messages=[
+                {
+                    "role": "system",
+                    "content": "As a scene generator, your job is to write one prompt for an image generator "
+                    "(i.e., string of words, short phrases separated by commas) per scene summary, each "
+                    "describing a visual scene of a character. " + SCENE_PROMPT_RULES +
+                    "The previous scene description is the one you wrote for the scene before. "
+                    "Write each description as a single line of 100 words or less, starting with the "
+                    "number of its scene summary followed by a period (e.g., 1. ), in the same order "
+                    "as the scene summaries. Do not write anything else.",
+                },
+                {
+                    "role": "user",
+                    "content": f"Character physical characteristics: {scenario.profile.physical_characteristics}.\n"
+                    f"Scenario summary: {scenario.summary}.\n"
+                    f"Scene summaries:\n{scenes}",
+                },
+            ]
+        )
+        thinking = False
+        for line in _lines(pieces):
+            thinking = (thinking or "<think>" in line) and "</think>" not in line
+            numbered = _numbered_line(line)
+            if not numbered or thinking:
+                continue
+            number, description = numbered
+            if number > written + 1:
+                # A skipped scene cannot be filled in here, the scenes from it on are written one by one
+                logger.warning(f"Scene {written + 1} is missing from the streamed descriptions")
+                break
+            # Repeated scenes are dropped
+            if number == written + 1:
+                written += 1
+                yield description
+                if written == len(scene_summaries):
+                    break
+        if written != len(scene_summaries):
+            logger.warning(f"Got {written} scene descriptions for {len(scene_summaries)} scenes")
+    except Exception as e:
+        logger.error(f"Error streaming scene descriptions: {e}")
+    finally:
+        usage.status = "idle"
+        save_usage(usage)
+
+def _lines(pieces: Iterable[str]) -> Iterator[str]:
+    """The lines of streamed text, each one as soon as it is complete."""
+    pending = ""
+    for piece in pieces:
+        pending += piece
+        *lines, pending = pending.split("\n")
+        yield from lines
+    yield pending
+
+def _numbered_line(line: str) -> Optional[tuple[int, str]]:
+    """The number and text of a line like "3. text", or None for any other line."""
+    match = re.match(r"\s*(?:scene\s*)?(\d+)[.):]\s*(.+)", remove_thinking(line), flags=re.IGNORECASE)
+    return (int(match.group(1)), match.group(2).strip().strip('"')) if match else None
+
+def generate_scene_descriptions(scenario_id, llm_model: str, mode: Optional[str] = None,
+                                on_description: Optional[Callable[[int, str], Any]] = None) -> str:
+    """Generate the scenario's scene descriptions based on the scene summaries.
+
+    In the "single_call" mode (see SCENE_DESCRIPTIONS_MODE) one LLM call writes them all and
+    any scenes it missed are written one by one; in the "per_scene" mode each scene gets its
+    own call, passing on the previous description for continuity.
+
+    Each description is saved as soon as it is written. If the stage did not finish last
+    time, it continues after the descriptions saved so far; once finished, running it again
+    writes them all anew. `on_description` is called with the index and text of every
+    description in scene order, the ones saved before included, as soon as it is saved;
+    the single call is then streamed so it can hand on each scene as it is written.
+    """
+    mode = mode or settings.SCENE_DESCRIPTIONS_MODE
     scenario = get_scenario(scenario_id)
     if not scenario.scene_summaries:
         raise ValueError("Cannot generate scene descriptions: scene_summaries is empty.")
     scene_summaries = scenario.get_scene_summaries_as_array()
-    descriptions = []
-    previous_description = ""
-    for i, summary in enumerate(scene_summaries):
-        description = generate_scene_description(scenario, llm_model, i, previous_description)
+    if scenario.is_done("scene_descriptions"):
+        set_stage_done(Scenario, scenario_id, "scene_descriptions", done=False)
+        descriptions = []
+    else:
+        descriptions = [d for d in scenario.get_scene_descriptions() if d][:len(scene_summaries)]
+        if descriptions:
+            logger.info(f"Resuming scene descriptions of scenario {scenario_id} at scene {len(descriptions) + 1}")
+
+    def add(description: str):
         descriptions.append(description)
+        # Save the descriptions as a proper json array to the scene_descriptions field
+        scenario.scene_descriptions = json.dumps(descriptions)
+        save_scenario(scenario)
+        if on_description:
+            on_description(len(descriptions) - 1, description)
+
+    if on_description:
+        for i, description in enumerate(descriptions):
+            on_description(i, description)
+    if mode == "single_call" and not descriptions:
+        if on_description:
+            written = stream_all_scene_descriptions(scenario, llm_model)
+        else:
+            written = generate_all_scene_descriptions(scenario, llm_model)
+        for description in written:
+            add(description)
+    # One client for all the scenes written one by one
+    llm = scene_description_llm(llm_model)
+    previous_description = descriptions[-1] if descriptions else ""
+    for i in range(len(descriptions), len(scene_summaries)):
+        if cancel_event().is_set():
+            return scenario
+        description = generate_scene_description(scenario, llm_model, i, previous_description, llm=llm)
+        if not description:
+            raise RuntimeError(f"Scene description {i + 1} of scenario {scenario_id} was not generated")
+        add(description)
         previous_description = description
     if not descriptions:
         raise ValueError("No scene descriptions generated from scene summaries.")
-    # Save the descriptions as a proper json array to the scene_descriptions field
-    scenario.scene_descriptions = json.dumps(descriptions)
-    save_scenario(scenario)
+    set_stage_done(Scenario, scenario_id, "scene_descriptions")
     logger.info(f"Scenario scene descriptions saved to: {scenario.scene_descriptions}")
     return scenario
 
-def generate_scenario_images(scenario_id, image_model: str) -> str:
-    """Generate a set of images based on a scenario's scene descriptions."""
+def generate_scene_descriptions_and_images(scenario_id, llm_model: str, image_model: str) -> Optional[str]:
+    """Write the scene descriptions of a scenario and render each scene as soon as it is described.
+
+    The descriptions are written on another thread and handed to the image stage through
+    a queue, so the image backend renders the first scenes while the LLM writes the rest.
+    This needs both backends in VRAM at once; when they do not fit, or the profile has no
+    image seed yet, the two stages run one after the other instead.
+    """
     scenario = get_scenario(scenario_id)
-    if not scenario.scene_descriptions or scenario.scene_descriptions == "[]":
-        raise ValueError("Cannot generate images: scene_descriptions is empty.")
+    scheduler = get_scheduler()
+    if not scheduler.fits(LLM, IMAGE) or not scenario.profile.image_seed:
+        generate_scene_descriptions(scenario_id, llm_model)
+        return generate_scenario_images(scenario_id, image_model)
+    usage = model_usage()
+    if usage.status != "idle":
+        raise ModelsBusy("Model usage is not idle, cannot generate scene descriptions and images.")
+    status = usage_status(usage)
+    report = stage_reporter(status, "Generating Scenes")
+
+    handoff: queue.Queue = queue.Queue()
+    finished = object()
+    errors = []
+
+    def describe():
+        token = _stage_status.set(lambda stage_status: report("descriptions", stage_status))
+        try:
+            generate_scene_descriptions(scenario_id, llm_model, on_description=lambda i, d: handoff.put(d))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            _stage_status.reset(token)
+            report("descriptions", "idle")
+            handoff.put(finished)
+
+    def described() -> Iterator[str]:
+        while (description := handoff.get()) is not finished:
+            yield description
+
+    # Run in a copy of this context, so the writer sees the same cancel event and deadline
+    writer = threading.Thread(target=contextvars.copy_context().run, args=(describe,),
+                              name=f"scene-descriptions-{scenario_id}", daemon=True)
+    token = _stage_status.set(lambda stage_status: report("images", stage_status))
+    try:
+        status.update("Generating Scenes", force=True)
+        scheduler.ensure_resident(LLM)
+        scheduler.ensure_resident(IMAGE, keep=(LLM,))
+        writer.start()
+        try:
+            scenario = generate_scenario_images(scenario_id, image_model, descriptions=described())
+        finally:
+            writer.join()
+    except Exception:
+        # Scenes that were never described fail the images too, raise the cause below instead
+        if not errors:
+            raise
+    finally:
+        _stage_status.reset(token)
+        status.update("idle", force=True)
+    if errors:
+        raise errors[0]
+    return scenario
+
+def regenerate_scene_description(scenario_id, llm_model: str, scene_index: int) -> Optional[str]:
+    """Write the description of one scene again, following on from the scene before it."""
+    scenario = get_scenario(scenario_id)
+    descriptions = scenario.get_scene_descriptions()
+    if not 0 <= scene_index < len(descriptions):
+        raise ValueError(f"Scenario {scenario_id} has no description of scene {scene_index + 1} to regenerate.")
+    previous_description = descriptions[scene_index - 1] if scene_index > 0 else ""
+    description = generate_scene_description(scenario, llm_model, scene_index, previous_description)
+    if not description:
+        raise RuntimeError(f"Scene description {scene_index + 1} of scenario {scenario_id} was not generated")
+    descriptions[scene_index] = description
+    scenario.scene_descriptions = json.dumps(descriptions)
+    save_scenario(scenario)
+    return description
+
+def scene_image_prompt(index: int, description: str) -> str:
+    """The image prompt of scene `index`, growing more explicit as the scenario goes on."""
+    if index == 0:
+        return description
+    if index == 1:
+        return f"{description} pov"
+    if index in (2, 3):
+        return f"{description} pov, erotic"
+    return f"{description} pov, erotic, NSFW"
+
+def generate_scenario_images(scenario_id, image_model: str, descriptions: Optional[Iterable[str]] = None) -> str:
+    """Generate a set of images based on a scenario's scene descriptions.
+
+    `descriptions` streams in descriptions that are still being written, see
+    `generate_scene_descriptions_and_images`. Each scene is then rendered as soon as its
+    description arrives, and the stage is only marked done once every scene was described.
+    """
+    scenario = get_scenario(scenario_id)
+    if descriptions is None:
+        if not scenario.scene_descriptions or scenario.scene_descriptions == "[]":
+            raise ValueError("Cannot generate images: scene_descriptions is empty.")
+        descriptions = scenario.get_scene_descriptions()
+        total_scenes = len(descriptions)
+    else:
+        total_scenes = len(scenario.get_scene_summaries_as_array())
     if not scenario.profile.image_seed:
         raise ValueError("Cannot generate images: profile image_seed is empty.")
-    usage = get_model_usage()
+    usage = model_usage()
     if usage.status != "idle":
-        logger.warning("Model usage is not idle, cannot generate images.")
-        return
-    scene_descriptions = scenario.get_scene_descriptions()
-    total_scenes = len(scene_descriptions)
-    logger.debug(f"Generating scenario images for {scene_descriptions}")
+        raise ModelsBusy("Model usage is not idle, cannot generate images.")
+    logger.debug(f"Generating scenario images for scenario ID {scenario_id}")
+    prompts = []
+
+    def scene_prompts():
+        for i, description in enumerate(descriptions):
+            prompts.append(scene_image_prompt(i, description))
+            yield prompts[-1]
+
     images = []
+    topic = scenario_images_topic(scenario_id)
+    status = usage_status(usage)
     try:
-        for i, description in enumerate(scene_descriptions):
-            usage.status = f"Generating Scenario Images {i + 1} of {total_scenes}"
-            save_model_usage(usage)
-            prompt = ""
-            if i == 0:
-                prompt = description
-            if i == 1:
-                prompt = f"{description} pov"
-            if i == 2 or i == 3:
-                prompt = f"{description} pov, erotic"
-            if i > 3:
-                prompt = f"{description} pov, erotic, NSFW"
-            image = image_from_prompt(
-                prompt,
-                model=image_model,
-                preset="target",
-                seed=scenario.profile.image_seed
-            )
-            usage.status = "idle"
-            save_model_usage(usage)
+        get_scheduler().ensure_resident(IMAGE)
+        status.update(f"Generating Scenario Images 0 of {total_scenes} done", force=True)
+        done = set()
+        scene_percent = [0.0] * total_scenes
+        progress_lock = threading.Lock()
+
+        def publish(message, preview=None):
+            progress_bus.publish(topic, message=message, current=len(done), total=total_scenes,
+                                 percent=sum(scene_percent) / total_scenes, preview=preview)
+
+        def scene_done(index, filename):
+            with progress_lock:
+                done.add(index)
+                scene_percent[index] = 1.0
+                publish(f"Scene {index + 1} done, {len(done)} of {total_scenes} scenes finished", preview=filename)
+            status.update(f"Generating Scenario Images {len(done)} of {total_scenes} done")
+            logger.info(f"Scene {index + 1} image saved to {filename}")
+
+        def scene_progress(index, progress):
+            with progress_lock:
+                scene_percent[index] = float(progress.get("current_percent", 0))
+                publish(f"Rendering scene {index + 1}, {len(done)} of {total_scenes} scenes finished",
+                        preview=progress.get("preview"))
+
+        scene_images = image_from_prompt_stream(
+            scene_prompts(),
+            model=image_model,
+            preset="target",
+            seed=scenario.profile.image_seed,
+            on_image=scene_done,
+            on_progress=scene_progress,
+        )
+        for prompt, image in zip(prompts, scene_images):
             if not image:
                 logger.error(f"Failed to generate image for description: {prompt}")
                 continue
             images.append(image)
         logger.info(f"Image(s) generated and saved to {images}")
         if not images:
-            raise ValueError("No images generated from scene descriptions.")
+            raise RuntimeError("No images generated from scene descriptions.")
+        # Reload, the streamed descriptions were saved while the images rendered
+        scenario = get_scenario(scenario_id)
         # Save the images as a proper json array to the images field
         scenario.images = json.dumps(images)
         save_scenario(scenario)
+        if len(prompts) < total_scenes:
+            raise RuntimeError(f"Only {len(prompts)} of {total_scenes} scenes were described.")
+        set_stage_done(Scenario, scenario_id, "scene_images")
         logger.info(f"Scenario images saved to: {scenario.images}")
     except Exception as e:
         logger.error(f"Error generating images for scenario ID {scenario_id}: {e}")
+        raise
     finally:
+        status.update("idle", force=True)
+        progress_bus.publish(topic, message="Image generation finished", done=True)
         logger.info(f"Image generation completed for scenario ID {scenario_id}")
     return scenario
 
-def respond_to_chat(llm_model, profile_id, scenario_id, scene_num, message):
-    """Respond to a chat message based on the profile and scenario"""
+def chat_messages(profile, scenario, scene, previous_messages_str, message) -> list:
+    """Build the LLM messages for a character's reply to a chat message."""
+    return [
+        {
+            "role": "system",
+            "content": f"You are {profile.name}, having a conversation with the user during a scene in a "
+            "scenario. Write your gestures and other non-verbal actions between asterisks (e.g., "
+            "*waving* or *moving closer*). Write your vocalizations between angled brackets(e.g., "
+            "<laugh>, <chuckle>, <groan>, <sigh>). When describing your gestures and actions use 'I' and "
+            "'my' not your name. When referring to the user, use 'you' or 'your'. For example, you would "
+            "write *I move closer to you* or *I touch your arm*. "
+            "Be creative with words. Use onomatopoeia and describe sounds, smells, tastes, textures in "
+            "detail. Aim for 2-3 sentences per response on average. In sexual moments, be thorough and "
+            "expressive. Describe all sounds, feelings, touches, etc. that you experience. In "
+            "sexual situations, be progressively lewd, erotic, and explicit. Apply a slow-burn approach "
+            "to these scenes. Allow the user to control the speed at which they go. "
+            "Keep the response concise and focused on the user's message.",
+        },
+        {
+            "role": "user",
+            "content": f"Profile of {profile.name}: {profile.background}, {profile.personality}, {profile.interests}.\n"
+                       f"Scenario: {scenario.summary}.\n"
+                       f"Scene: {scene}\n"
+                       f"Previous messages: {previous_messages_str}.\n"
+                       f"Message: {message}",
+        },
+    ]
+
+def chat_context(profile_id, scenario_id, scene_num, message, exclude_message_id=None) -> list:
+    """Load the profile, scene and recent messages and build the LLM messages for a reply."""
     profile = get_profile(profile_id)
     scenario = get_scenario(scenario_id)
     if not profile or not scenario:
@@ -514,59 +1018,112 @@ def respond_to_chat(llm_model, profile_id, scenario_id, scene_num, message):
     if not scenes or scene_num >= len(scenes):
         raise ValueError(f"Cannot respond to chat: scene_num {scene_num} is out of bounds for scenario with {len(scenes)} scenes.")
     scene = scenes[scene_num]
-    previous_messages = get_messages(scenario_id)
+    previous_messages = [msg for msg in get_messages(scenario_id) if msg.id != exclude_message_id]
     previous_messages = previous_messages[-10:]  # Limit to last 10 messages
     previous_contents = [msg.content for msg in previous_messages]
     previous_messages_str = json.dumps(previous_contents)
-    usage = get_model_usage()
+    return chat_messages(profile, scenario, scene, previous_messages_str, message)
+
+def generate_chat_replies(
+        llm_model,
+        profile_id,
+        scenario_id,
+        scene_num,
+        message,
+        num_candidates: int = 1,
+        exclude_message_id=None
+    ) -> list[str]:
+    """Generate candidate replies to a chat message based on the profile and scenario."""
+    messages = chat_context(profile_id, scenario_id, scene_num, message, exclude_message_id)
+    usage = model_usage()
     if usage.status != "idle":
-        logger.warning("Model usage is not idle, cannot respond to chat.")
-        return
+        raise ModelsBusy("Model usage is not idle, cannot respond to chat.")
     usage.status = "Responding to Chat"
-    save_model_usage(usage)
+    save_usage(usage)
+    replies = []
     try:
+        get_scheduler().ensure_resident(LLM)
         llm = InferenceLLMConfig(
             model_name=llm_model,
             base_url=settings.INFERENCE_BASE_URL,
             api_key=settings.INFERENCE_API_KEY,
+            task="chat",
         )
         logger.info(f"Responding to: {message}")
-        response = llm.generate_from_messages(
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"You are {profile.name}, having a conversation with the user during a scene in a "
-                    "scenario. Write your gestures and other non-verbal actions between asterisks (e.g., "
-                    "*waving* or *moving closer*). Write your vocalizations between angled brackets(e.g., "
-                    "<laugh>, <chuckle>, <groan>, <sigh>). When describing your gestures and actions use 'I' and "
-                    "'my' not your name. When referring to the user, use 'you' or 'your'. For example, you would "
-                    "write *I move closer to you* or *I touch your arm*. "
-                    "Be creative with words. Use onomatopoeia and describe sounds, smells, tastes, textures in "
-                    "detail. Aim for 2-3 sentences per response on average. In sexual moments, be thorough and "
-                    "expressive. Describe all sounds, feelings, touches, etc. that you experience. In "
-                    "sexual situations, be progressively lewd, erotic, and explicit. Apply a slow-burn approach "
-                    "to these scenes. Allow the user to control the speed at which they go. "
-                    "Keep the response concise and focused on the user's message.",
-                },
-                {
-                    "role": "user",
-                    "content": f"Profile of {profile.name}: {profile.background}, {profile.personality}, {profile.interests}.\n"
-                               f"Scenario: {scenario.summary}.\n"
-                               f"Scene: {scene}\n"
-                               f"Previous messages: {previous_messages_str}.\n"
-                               f"Message: {message}",
-                },
-            ]
-        )
-        usage.status = "idle"
-        save_model_usage(usage)
-        if not response:
+        if num_candidates > 1:
+            replies = llm.generate_candidates_from_messages(messages=messages, n=num_candidates)
+        else:
+            replies = [llm.generate_from_messages(messages=messages)]
+        replies = [reply for reply in replies if reply]
+        if not replies:
             raise ValueError("Failed to generate chat response: No content in response")
     except Exception as e:
         logger.error(f"Error responding to chat: {e}")
+        raise
     finally:
-        logger.info(f"Chat response generated: {response}")
-    return response
+        usage.status = "idle"
+        save_usage(usage)
+        logger.info(f"Chat responses generated: {replies}")
+    return replies
+
+def respond_to_chat(llm_model, profile_id, scenario_id, scene_num, message):
+    """Respond to a chat message based on the profile and scenario"""
+    replies = generate_chat_replies(llm_model, profile_id, scenario_id, scene_num, message)
+    return replies[0] if replies else None
+
+def reply_to_chat(llm_model, profile_id, scenario_id, scene_num, message, num_candidates: int = 1) -> MessageSchema:
+    """Add the character's reply to a chat message, keeping any alternative replies for regenerate.
+
+    Only one reply is written by default, so sending is not slowed down by replies the user
+    may never ask for; `regenerate_reply` writes the alternatives when they are first needed.
+    """
+    replies = generate_chat_replies(llm_model, profile_id, scenario_id, scene_num, message, num_candidates)
+    if not replies:
+        raise ValueError("Failed to generate chat response: No content in response")
+    char_msg = add_message(scenario_id, "character", replies[0])
+    save_message_candidates(char_msg.id, replies[1:])
+    return char_msg
+
+def regenerate_reply(llm_model, message_id, profile_id, scenario_id, scene_num, message) -> MessageSchema:
+    """Swap a character message for its next stored candidate, generating new ones when none are left.
+
+    New replies come in a batch of INFERENCE_CHAT_CANDIDATES, one shown and the rest stored,
+    so only the first regenerate of a reply waits for the LLM.
+    """
+    char_msg = get_message(message_id)
+    if not char_msg:
+        raise ValueError(f"Message with ID {message_id} not found.")
+    content = pop_message_candidate(message_id)
+    if content is None:
+        logger.info(f"No candidates left for message ID {message_id}, generating new replies.")
+        replies = generate_chat_replies(
+            llm_model, profile_id, scenario_id, scene_num, message,
+            num_candidates=settings.INFERENCE_CHAT_CANDIDATES,
+            exclude_message_id=message_id,
+        )
+        if not replies:
+            raise ValueError("Failed to regenerate chat response: No content in response")
+        content = replies[0]
+        save_message_candidates(message_id, replies[1:])
+    if char_msg.speech:
+        discard_speech(char_msg.speech, message_id=message_id)
+    char_msg.content = content
+    char_msg.speech = None
+    return save_message(char_msg)
+
+def discard_speech(path: str, message_id=None):
+    """Detach a speech file from a message and delete it once nothing plays it.
+
+    Messages with the same text and voice share one file, so it is kept while another
+    message still plays it.
+    """
+    release_speech(path, message_id=message_id)
+
+def store_compressed_speech(path: str, compressed_path: str):
+    """Point messages at the compressed copy of their speech and drop the uncompressed file."""
+    updated = replace_speech(path, compressed_path)
+    logger.info(f"Switched {updated} message(s) to {compressed_path}")
+    discard_speech(path)
 
 def add_message(scenario_id, role, content):
     if not isinstance(content, str) or not content.strip():
@@ -587,22 +1144,356 @@ def voice_response(message_id, voice):
         raise ValueError(f"Message with ID {message_id} not found.")
     if not voice:
         raise ValueError("Voice must be specified for TTS.")
-    usage = get_model_usage()
+    usage = model_usage()
     if usage.status != "idle":
-        logger.warning("Model usage is not idle, cannot generate voice response.")
-        return
+        raise ModelsBusy("Model usage is not idle, cannot generate voice response.")
     usage.status = "Generating Voice Response"
-    save_model_usage(usage)
+    save_usage(usage)
+    topic = message_speech_topic(message_id)
+    play_chunk = speech_chunk_publisher(topic, str(message_id))
     try:
         # Strip out non-verbal actions written between asterisks
         input = remove_action_text(message.content)
-        message.speech = get_tts_audio(input=input, voice=voice)
+        # Lines voiced before are reused without loading the TTS model
+        message.speech = cached_speech(input, voice=voice)
+        if not message.speech:
+            get_scheduler().ensure_resident(TTS)
+            message.speech = get_tts_audio(input=input, voice=voice, on_chunk=play_chunk)
         save_message(message)
-        usage.status = "idle"
-        save_model_usage(usage)
         if not message.speech:
-            raise ValueError("Failed to generate voice response: No audio content returned")
+            raise RuntimeError("Failed to generate voice response: No audio content returned")
+        transcode_async(message.speech, on_done=store_compressed_speech)
         logger.info(f"Voice response generated for message ID {message_id}")
     except Exception as e:
         logger.error(f"Error generating voice response for message ID {message_id}: {e}")
+        raise
+    finally:
+        usage.status = "idle"
+        save_usage(usage)
+        progress_bus.publish(topic, message="Voice response finished", done=True)
     return message.speech
+
+def voice_messages(scenario_id=None, profile_id=None, max_parallel: Optional[int] = None) -> int:
+    """Voice every unvoiced character message of a scenario, a profile or all scenarios.
+
+    Messages are voiced `max_parallel` at a time, each with the voice of its own profile, and
+    their speech is saved in one update at the end. Lines that fail are left unvoiced, and
+    lines that were voiced come from the TTS cache if the job is run again; it only fails
+    when no line could be voiced. Progress is published on the voicing topic. When run as a
+    job, cancelling it skips the messages that were not started yet. Returns the number of
+    messages voiced.
+    """
+    pending = [(message, voice) for message, voice in get_unvoiced_messages(scenario_id, profile_id) if voice]
+    if not pending:
+        logger.info("No unvoiced messages to voice.")
+        return 0
+    usage = model_usage()
+    if usage.status != "idle":
+        raise ModelsBusy("Model usage is not idle, cannot voice messages.")
+    total = len(pending)
+    topic = voicing_topic(scenario_id, profile_id)
+    status = usage_status(usage)
+    speeches = {}
+    finished = []
+    progress_lock = threading.Lock()
+    cancelled = cancel_event()
+    cached = {}
+
+    def voice_one(message, voice):
+        if cancelled.is_set():
+            return
+        speech = cached.get(message.id)
+        if not speech:
+            # One chunk at a time per message, so at most max_parallel requests reach the TTS server
+            speech = get_tts_audio(input=remove_action_text(message.content), voice=voice, max_workers=1)
+        with progress_lock:
+            finished.append(message.id)
+            if speech:
+                speeches[message.id] = speech
+            else:
+                logger.error(f"Failed to voice message ID {message.id}")
+            done = len(finished)
+            progress_bus.publish(topic, message=f"Voiced {len(speeches)} of {total} messages", current=done,
+                                 total=total, percent=done / total, preview=speech or None)
+        status.update(f"Voicing Messages {done} of {total} done")
+
+    try:
+        status.update(f"Voicing Messages 0 of {total} done", force=True)
+        # Strip out non-verbal actions written between asterisks; lines voiced before need no TTS
+        for message, voice in pending:
+            cached[message.id] = cached_speech(remove_action_text(message.content), voice=voice)
+        if not all(cached.values()):
+            get_scheduler().ensure_resident(TTS)
+        with ThreadPoolExecutor(max_workers=max_parallel or settings.TTS_MAX_PARALLEL) as pool:
+            for future in [pool.submit(contextvars.copy_context().run, voice_one, message, voice) for message, voice in pending]:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Error voicing message: {e}")
+        set_message_speeches(speeches)
+        if not speeches and not cancelled.is_set():
+            raise RuntimeError(f"None of the {total} messages could be voiced")
+        # Compress once the messages point at their speech, so the switch is not overwritten
+        for speech in set(speeches.values()):
+            transcode_async(speech, on_done=store_compressed_speech)
+        logger.info(f"Voiced {len(speeches)} of {total} messages")
+    except Exception as e:
+        logger.error(f"Error voicing messages: {e}")
+        raise
+    finally:
+        status.update("idle", force=True)
+        progress_bus.publish(topic, message=f"Voiced {len(speeches)} of {total} messages", done=True)
+    return len(speeches)
+
+# Chunks nobody collected, e.g. because the page was closed, are removed after this many seconds
+SPEECH_CHUNK_MAX_AGE = 3600
+
+def speech_chunk_publisher(topic: str, name: str):
+    """Callback for voiced chunks that saves each one and publishes it as a playable preview.
+
+    The chunk files are left for the page that plays them, which removes them with
+    `remove_speech_chunks` once the full recording has replaced them. Chunks older than
+    `SPEECH_CHUNK_MAX_AGE` are cleared out here.
+    """
+    chunks_dir = os.path.join(SPEECH_DIR, "chunks")
+    remove_stale_speech_chunks(chunks_dir)
+
+    def play_chunk(index: int, total, audio: bytes):
+        # Each chunk is playable on its own while the rest of the message is voiced
+        chunk_file = os.path.join(chunks_dir, f"{name}_{index}.wav")
+        os.makedirs(chunks_dir, exist_ok=True)
+        with open(chunk_file, "wb") as f:
+            f.write(audio)
+        progress_bus.publish(topic, message=f"Voiced part {index + 1}" + (f" of {total}" if total else ""),
+                             current=index + 1, total=total, percent=(index + 1) / total if total else None,
+                             preview=chunk_file)
+
+    return play_chunk
+
+def remove_speech_chunks(chunk_files: list[str]):
+    for chunk_file in chunk_files:
+        try:
+            os.remove(chunk_file)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Error deleting speech chunk {chunk_file}: {e}")
+
+def remove_stale_speech_chunks(chunks_dir: str):
+    if not os.path.isdir(chunks_dir):
+        return
+    cutoff = time.time() - SPEECH_CHUNK_MAX_AGE
+    with os.scandir(chunks_dir) as entries:
+        stale = [entry.path for entry in entries if entry.is_file() and entry.stat().st_mtime < cutoff]
+    remove_speech_chunks(stale)
+
+def reply_to_chat_voiced(llm_model, profile_id, scenario_id, scene_num, message, voice) -> Optional[MessageSchema]:
+    """Add the character's reply to a chat message, voicing it while it is being written.
+
+    The reply is streamed from the LLM and each sentence goes to TTS as soon as it is
+    complete, so the first audio is ready before the text is finished. The text so far is
+    published on the chat reply topic and each voiced part on the reply speech topic. When
+    the LLM and TTS models do not fit in VRAM together, the reply is voiced after it is written.
+    """
+    if not voice:
+        raise ValueError("Voice must be specified for TTS.")
+    messages = chat_context(profile_id, scenario_id, scene_num, message)
+    topic = chat_reply_topic(scenario_id)
+    scheduler = get_scheduler()
+    if not scheduler.fits(LLM, TTS):
+        logger.info("LLM and TTS do not fit in VRAM together, voicing the reply once it is written.")
+        try:
+            char_msg = reply_to_chat(llm_model, profile_id, scenario_id, scene_num, message)
+            voice_response(char_msg.id, voice)
+            return get_message(char_msg.id)
+        finally:
+            progress_bus.publish(topic, message="Reply finished", done=True)
+    usage = model_usage()
+    if usage.status != "idle":
+        progress_bus.publish(topic, message="Models are busy", done=True)
+        raise ModelsBusy("Model usage is not idle, cannot respond to chat.")
+    usage.status = "Responding to Chat"
+    save_usage(usage)
+    play_chunk = speech_chunk_publisher(chat_reply_speech_topic(scenario_id), f"reply_{scenario_id}")
+    char_msg = None
+    try:
+        scheduler.ensure_resident(LLM)
+        scheduler.ensure_resident(TTS, keep=(LLM,))
+        llm = InferenceLLMConfig(
+            model_name=llm_model,
+            base_url=settings.INFERENCE_BASE_URL,
+            api_key=settings.INFERENCE_API_KEY,
+            task="chat",
+        )
+        logger.info(f"Responding to: {message}")
+
+        def stream():
+            text = ""
+            for delta in llm.stream_from_messages(messages=messages):
+                text += delta
+                progress_bus.publish(topic, message=text)
+                yield delta
+
+        content, speech = voice_stream(stream(), voice=voice, on_chunk=play_chunk)
+        if not content.strip():
+            raise ValueError("Failed to generate chat response: No content in response")
+        char_msg = add_message(scenario_id, "character", content)
+        if speech:
+            char_msg.speech = speech
+            char_msg = save_message(char_msg)
+            transcode_async(speech, on_done=store_compressed_speech)
+        logger.info(f"Voiced chat response saved as message ID {char_msg.id}")
+    except Exception as e:
+        logger.error(f"Error responding to chat with voice: {e}")
+        raise
+    finally:
+        usage.status = "idle"
+        save_usage(usage)
+        progress_bus.publish(topic, message="Reply finished", done=True)
+    return char_msg
+
+SURPRISE_ME_REQUESTS = ["Latina", "East Asian", "Northern European Blonde", "American Redhead", "Eastern European Brunette"]
+# Rough seconds per stage, only used to start the stages with the most work behind them first
+SURPRISE_ME_ESTIMATES = {
+    "profile": 30, "description": 15, "scenario": 30, "scene descriptions": 90,
+    "profile image": 30, "scenario images": 120, "voice": 20,
+}
+
+def surprise_me_tasks(llm_model: str, image_model: str, requests: Optional[list[str]] = None) -> list[Task]:
+    """The stages of Surprise Me as a graph, skipping the work that is already done.
+
+    Profiles are created up to one per request. Each profile then gets an image description
+    and a scenario from the LLM, scene descriptions for its scenarios, a profile image, scene
+    images seeded from it, and voiced messages. Stages of different profiles do not depend on
+    each other, so the LLM can write one profile while the image backend renders another.
+    """
+    requests = requests or SURPRISE_ME_REQUESTS
+    profiles = get_profiles()
+    tasks = []
+    # Each chain is the name of the task creating the profile, or the ID of an existing one
+    chains: list[tuple[str, Optional[int]]] = [(f"profile {p.id}", p.id) for p in profiles]
+    for request in requests[len(profiles):]:
+        name = f"profile {request}"
+        tasks.append(Task(name=name, resource=LLM, estimate=SURPRISE_ME_ESTIMATES["profile"],
+                          priority=len(chains), fn=lambda results, request=request: _new_profile(llm_model, request)))
+        chains.append((name, None))
+    for index, (name, known_id) in enumerate(chains):
+        created = [name] if known_id is None else []
+
+        def profile_id(results, name=name, known_id=known_id) -> int:
+            return known_id if known_id is not None else results[name]
+
+        def stage(label, resource, fn, deps, name=name, profile_id=profile_id, index=index):
+            # Finish the LLM work of a profile first, so its images render while the next one is written
+            tasks.append(Task(name=f"{name}: {label}", resource=resource, deps=deps, priority=index,
+                              estimate=SURPRISE_ME_ESTIMATES[label], fn=lambda results: fn(profile_id(results))))
+
+        stage("description", LLM, lambda pid: _profile_description(pid, llm_model), created)
+        stage("scenario", LLM, lambda pid: _profile_scenario(pid, llm_model), created)
+        stage("scene descriptions", LLM, lambda pid: _scene_descriptions(pid, llm_model), [f"{name}: scenario"])
+        stage("profile image", IMAGE, lambda pid: _profile_image(pid, image_model), [f"{name}: description"])
+        stage("scenario images", IMAGE, lambda pid: _scenario_images(pid, image_model),
+              [f"{name}: profile image", f"{name}: scene descriptions"])
+        stage("voice", TTS, lambda pid: voice_messages(profile_id=pid), [f"{name}: scenario"])
+    return tasks
+
+
+def _new_profile(llm_model, request) -> int:
+    profile = generate_profile(llm_model, request, gen_images=False)
+    if not profile:
+        raise ValueError(f"No {request} profile was generated")
+    return profile.id
+
+def _profile_description(profile_id, llm_model):
+    if not get_profile(profile_id).is_done("image_description"):
+        generate_profile_image_description(profile_id, llm_model)
+        if not get_profile(profile_id).is_done("image_description"):
+            raise ValueError(f"No image description was generated for profile {profile_id}")
+
+def _profile_scenario(profile_id, llm_model):
+    if not get_scenarios_for_profile(profile_id):
+        generate_scenario(profile_id, llm_model, gen_images=False)
+        if not get_scenarios_for_profile(profile_id):
+            raise ValueError(f"No scenario was generated for profile {profile_id}")
+
+def _scene_descriptions(profile_id, llm_model):
+    for scenario in get_scenarios_for_profile(profile_id):
+        if not scenario.is_done("scene_descriptions"):
+            generate_scene_descriptions(scenario.id, llm_model)
+
+def _profile_image(profile_id, image_model):
+    if not get_profile(profile_id).is_done("sample_images"):
+        generate_sample_profile_images(profile_id, image_model, num_images=1)
+    profile = get_profile(profile_id)
+    if profile.is_done("seed"):
+        return
+    if profile.is_done("sample_images"):
+        set_profile_seed(profile_id)
+    else:
+        # Scenario images are seeded from the first profile image, or random without one
+        profile.image_seed = -1
+        save_profile(profile)
+
+def _scenario_images(profile_id, image_model):
+    for scenario in get_scenarios_for_profile(profile_id):
+        if not scenario.is_done("scene_images"):
+            generate_scenario_images(scenario.id, image_model)
+
+def run_surprise_me(llm_model: str, image_model: str, requests: Optional[list[str]] = None,
+                    on_update=None) -> RunReport:
+    """Build the starter library of profiles and scenarios, overlapping the work on each backend.
+
+    The stages of `surprise_me_tasks` run as soon as their inputs are ready, at most
+    `SURPRISE_ME_CONCURRENCY` at a time per backend, and backends only run side by side when
+    they fit in VRAM together. The models are marked busy for the whole run, which is meant
+    to be queued as the `run_surprise_me` job; progress is published on the Surprise Me topic.
+    `on_update` is called on the calling thread whenever a stage starts or ends. Returns the
+    run report.
+    """
+    usage = get_model_usage()
+    if usage.status != "idle":
+        raise ModelsBusy("Model usage is not idle, cannot run Surprise Me.")
+    topic = surprise_me_topic()
+    status = usage_status(usage)
+    report = stage_reporter(status, "Surprise Me")
+
+    def staged(task: Task) -> Task:
+        def run(results):
+            token = _stage_status.set(lambda stage_status: report(task.name, stage_status))
+            try:
+                return task.fn(results)
+            finally:
+                _stage_status.reset(token)
+                report(task.name, "idle")
+        return task.model_copy(update={"fn": run})
+
+    tasks = [staged(task) for task in surprise_me_tasks(llm_model, image_model, requests)]
+    finished = []
+
+    def update(run):
+        if run.status != "running":
+            finished.append(run.name)
+        progress_bus.publish(topic, message=f"{run.name} {run.status}", current=len(finished),
+                             total=len(tasks), percent=len(finished) / len(tasks) if tasks else 1.0)
+        if on_update:
+            on_update(run)
+
+    scheduler = get_scheduler()
+    executor = DagExecutor(
+        settings.SURPRISE_ME_CONCURRENCY,
+        can_share=lambda busy, resource: scheduler.fits(*busy, resource),
+        before_start=lambda resource, busy: scheduler.ensure_resident(resource, keep=tuple(busy)),
+        on_update=update,
+    )
+    run_report = None
+    try:
+        status.update("Surprise Me", force=True)
+        run_report = executor.run(tasks)
+        logger.info(f"Surprise Me finished:\n{run_report.summary()}")
+    except Exception as e:
+        logger.error(f"Error running Surprise Me: {e}")
+        raise
+    finally:
+        status.update("idle", force=True)
+        progress_bus.publish(topic, message=run_report.summary() if run_report else "Surprise Me failed", done=True)
+    return run_report
@@ -14,12 +14,25 @@ class InferenceEnvironmentVariables(BaseEnvironmentVariables):
     INFERENCE_BASE_URL: Optional[str] = "http://localhost:11434"
     INFERENCE_API_KEY: Optional[SecretStr] = "tt"
     INFERENCE_DEPLOYMENT_NAME: Optional[str] = "ollama_chat/qwen2.5:0.5b"
+    INFERENCE_VRAM_MB: int = 8192
+    # Chat replies written at once on the first regenerate of a reply, so the next ones are instant
+    INFERENCE_CHAT_CANDIDATES: int = 3
+    # Longest wait for one completion when the caller set no deadline
+    INFERENCE_REQUEST_TIMEOUT_SECONDS: float = 600.0
+    # Local store of per-call latency and token metrics
+    INFERENCE_METRICS_ROTATION: str = "10 MB"
+    INFERENCE_METRICS_RETENTION: int = 5
 
     def get_inference_env_vars(self):
         return {
             "INFERENCE_BASE_URL": self.INFERENCE_BASE_URL,
             "INFERENCE_API_KEY": self.INFERENCE_API_KEY,
             "INFERENCE_DEPLOYMENT_NAME": self.INFERENCE_DEPLOYMENT_NAME,
+            "INFERENCE_VRAM_MB": self.INFERENCE_VRAM_MB,
+            "INFERENCE_CHAT_CANDIDATES": self.INFERENCE_CHAT_CANDIDATES,
+            "INFERENCE_REQUEST_TIMEOUT_SECONDS": self.INFERENCE_REQUEST_TIMEOUT_SECONDS,
+            "INFERENCE_METRICS_ROTATION": self.INFERENCE_METRICS_ROTATION,
+            "INFERENCE_METRICS_RETENTION": self.INFERENCE_METRICS_RETENTION,
         }
 
 
@@ -27,12 +40,20 @@ class EmbeddingsEnvironmentVariables(BaseEnvironmentVariables):
     EMBEDDINGS_BASE_URL: Optional[str] = None
     EMBEDDINGS_API_KEY: Optional[SecretStr] = "tt"
     EMBEDDINGS_DEPLOYMENT_NAME: Optional[str] = None
+    EMBEDDINGS_BATCH_SIZE: int = 32
+    EMBEDDINGS_BATCH_WAIT_MS: int = 10
+    EMBEDDINGS_CACHE_SIZE: int = 4096
+    EMBEDDINGS_CACHE_DIR: Optional[str] = None
 
     def get_embeddings_env_vars(self):
         return {
             "EMBEDDINGS_BASE_URL": self.EMBEDDINGS_BASE_URL,
             "EMBEDDINGS_API_KEY": self.EMBEDDINGS_API_KEY,
             "EMBEDDINGS_DEPLOYMENT_NAME": self.EMBEDDINGS_DEPLOYMENT_NAME,
+            "EMBEDDINGS_BATCH_SIZE": self.EMBEDDINGS_BATCH_SIZE,
+            "EMBEDDINGS_BATCH_WAIT_MS": self.EMBEDDINGS_BATCH_WAIT_MS,
+            "EMBEDDINGS_CACHE_SIZE": self.EMBEDDINGS_CACHE_SIZE,
+            "EMBEDDINGS_CACHE_DIR": self.EMBEDDINGS_CACHE_DIR,
         }
 
 
@@ -41,6 +62,25 @@ class SwarmUIEnvironmentVariables(BaseEnvironmentVariables):
     SWARMUI_BASE_URL: Optional[str] = "http://host.docker.internal:7801"
     SWARMUI_API_URL: Optional[str] = "http://host.docker.internal:7801/API"
     SWARMUI_WS_URL: Optional[str] = "ws://host.docker.internal:7801/API"
+    SWARMUI_VRAM_MB: int = 12288
+    SWARMUI_SESSION_TTL: float = 1800.0
+    # How long the backends' loaded models are trusted before ListBackends is asked again
+    SWARMUI_MODELS_TTL: float = 60.0
+    SWARMUI_WS_POOL_SIZE: int = 2
+    SWARMUI_WS_HEARTBEAT_INTERVAL: float = 20.0
+    # Longest wait for one API call when the caller set no deadline
+    SWARMUI_REQUEST_TIMEOUT_SECONDS: float = 300.0
+    SWARMUI_MAX_QUEUED_PROMPTS: int = 8
+    SWARMUI_DOWNLOAD_WORKERS: int = 4
+    # Cheap candidate renders for picking a seed, before the full quality target render.
+    # Drafts only cut steps: a different resolution would give the seed a different image.
+    SWARMUI_DRAFT_BATCH: int = 4
+    SWARMUI_DRAFT_STEPS: int = 6
+    # Per-model draft steps, e.g. {"flux.safetensors": 4}
+    SWARMUI_DRAFT_MODEL_STEPS: dict[str, int] = {}
+    # Fixed-seed renders are reused for identical prompts and parameters
+    SWARMUI_IMAGE_CACHE_ENABLED: bool = True
+    SWARMUI_IMAGE_CACHE_MB: int = 2048
 
     def get_swarmui_env_vars(self):
         return {
@@ -48,6 +88,19 @@ class SwarmUIEnvironmentVariables(BaseEnvironmentVariables):
             "SWARMUI_BASE_URL": self.SWARMUI_BASE_URL,
             "SWARMUI_API_URL": self.SWARMUI_API_URL,
             "SWARMUI_WS_URL": self.SWARMUI_WS_URL,
+            "SWARMUI_VRAM_MB": self.SWARMUI_VRAM_MB,
+            "SWARMUI_SESSION_TTL": self.SWARMUI_SESSION_TTL,
+            "SWARMUI_MODELS_TTL": self.SWARMUI_MODELS_TTL,
+            "SWARMUI_WS_POOL_SIZE": self.SWARMUI_WS_POOL_SIZE,
+            "SWARMUI_WS_HEARTBEAT_INTERVAL": self.SWARMUI_WS_HEARTBEAT_INTERVAL,
+            "SWARMUI_REQUEST_TIMEOUT_SECONDS": self.SWARMUI_REQUEST_TIMEOUT_SECONDS,
+            "SWARMUI_MAX_QUEUED_PROMPTS": self.SWARMUI_MAX_QUEUED_PROMPTS,
+            "SWARMUI_DOWNLOAD_WORKERS": self.SWARMUI_DOWNLOAD_WORKERS,
+            "SWARMUI_DRAFT_BATCH": self.SWARMUI_DRAFT_BATCH,
+            "SWARMUI_DRAFT_STEPS": self.SWARMUI_DRAFT_STEPS,
+            "SWARMUI_DRAFT_MODEL_STEPS": self.SWARMUI_DRAFT_MODEL_STEPS,
+            "SWARMUI_IMAGE_CACHE_ENABLED": self.SWARMUI_IMAGE_CACHE_ENABLED,
+            "SWARMUI_IMAGE_CACHE_MB": self.SWARMUI_IMAGE_CACHE_MB,
         }
 
 
@@ -55,12 +108,34 @@ class TTSEnvironmentVariables(BaseEnvironmentVariables):
     TTS_CONTAINER: Optional[str] = "orpheus-fastapi"
     TTS_BASE_URL: Optional[str] = "http://host.docker.internal:5005"
     TTS_API_URL: Optional[str] = "http://host.docker.internal:5005/v1/audio/speech"
+    TTS_VRAM_MB: int = 4096
+    # Sentence chunking: longest chunk, shortest chunk before merging, chunks voiced at once
+    TTS_CHUNK_MAX_CHARS: int = 240
+    TTS_CHUNK_MIN_CHARS: int = 40
+    TTS_MAX_PARALLEL: int = 2
+    # Longest wait for one chunk to be voiced when the caller set no deadline
+    TTS_REQUEST_TIMEOUT_SECONDS: float = 120.0
+    # Voiced messages and phrases are reused for identical text and voice settings
+    TTS_CACHE_MB: int = 512
+    # Voiced messages are compressed in the background: "opus", "mp3" or "wav" to keep them as is
+    TTS_STORAGE_FORMAT: str = "opus"
+    TTS_STORAGE_BITRATE: str = "32k"
+    TTS_TRANSCODE_WORKERS: int = 1
 
     def get_tts_env_vars(self):
         return {
             "TTS_CONTAINER": self.TTS_CONTAINER,
             "TTS_BASE_URL": self.TTS_BASE_URL,
             "TTS_API_URL": self.TTS_API_URL,
+            "TTS_VRAM_MB": self.TTS_VRAM_MB,
+            "TTS_CHUNK_MAX_CHARS": self.TTS_CHUNK_MAX_CHARS,
+            "TTS_CHUNK_MIN_CHARS": self.TTS_CHUNK_MIN_CHARS,
+            "TTS_MAX_PARALLEL": self.TTS_MAX_PARALLEL,
+            "TTS_REQUEST_TIMEOUT_SECONDS": self.TTS_REQUEST_TIMEOUT_SECONDS,
+            "TTS_CACHE_MB": self.TTS_CACHE_MB,
+            "TTS_STORAGE_FORMAT": self.TTS_STORAGE_FORMAT,
+            "TTS_STORAGE_BITRATE": self.TTS_STORAGE_BITRATE,
+            "TTS_TRANSCODE_WORKERS": self.TTS_TRANSCODE_WORKERS,
         }
 
 
@@ -115,11 +190,87 @@ class Settings(
 
     STREAMLIT_PORT: int = 8501
     DEV_MODE: bool = True
+    # Total VRAM shared by the LLM, image and TTS backends
+    GPU_VRAM_MB: int = 24576
+    # Image derivatives rendered at ingest, see media.py
+    MEDIA_THUMBNAIL_SIZES: list[int] = [256, 768]
+    MEDIA_FORMAT: str = "webp"
+    MEDIA_QUALITY: int = 82
+    MEDIA_WORKERS: int = 2
+    # Progress is published in memory; the status text in the DB is only refreshed this often
+    PROGRESS_PERSIST_INTERVAL: float = 2.0
+    PROGRESS_POLL_SECONDS: float = 1.0
+    # File server for audio playback with range requests, see api/media_server.py
+    MEDIA_SERVER_ENABLED: bool = True
+    # Interface the file server listens on; docker-compose sets 0.0.0.0 and publishes it on localhost
+    MEDIA_SERVER_HOST: str = "127.0.0.1"
+    MEDIA_SERVER_PORT: int = 8502
+    # Address of the file server as seen by the browser; without it Streamlit sends the audio
+    MEDIA_SERVER_URL: Optional[str] = None
+    # Background job queue, see jobs.py. Worker threads started inside the Streamlit process;
+    # set to 0 when jobs are run by `make run-worker` instead
+    JOB_WORKERS: int = 1
+    JOB_POLL_SECONDS: float = 1.0
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_SECONDS: float = 10.0
+    # A running job whose worker has not checked in for this long is handed to another worker
+    JOB_LEASE_SECONDS: float = 60.0
+    # Jobs of the same priority the VRAM scheduler chooses the next one from
+    JOB_CLAIM_WINDOW: int = 20
+    # "single_call" writes all scene descriptions of a scenario in one LLM call, "per_scene"
+    # makes one call per scene
+    SCENE_DESCRIPTIONS_MODE: str = "single_call"
+    # Render each scene image as soon as its description is written, when the LLM and the
+    # image backend fit in VRAM together
+    SCENE_IMAGES_HANDOFF: bool = True
+    # Stages of Surprise Me that may run at the same time on each backend
+    SURPRISE_ME_CONCURRENCY: dict[str, int] = {"llm": 1, "image": 1, "tts": 1}
+    # Retries of backend calls, see ml/resilience.py. The jittered backoff starts at
+    # RETRY_BASE_SECONDS and doubles up to RETRY_MAX_SECONDS
+    RETRY_ATTEMPTS: int = 3
+    RETRY_BASE_SECONDS: float = 0.05
+    RETRY_MAX_SECONDS: float = 10.0
+    # How long a retry waits for a backend that reports it is not ready, e.g. while booting
+    RETRY_READY_TIMEOUT_SECONDS: float = 120.0
+    RETRY_READY_POLL_SECONDS: float = 0.5
+    # Consecutive failures that open a backend's circuit breaker, and how long it stays open
+    BREAKER_FAILURES: int = 5
+    BREAKER_RESET_SECONDS: float = 30.0
+    # Time limit for the backend calls of interactive jobs, e.g. chat replies, retries included
+    INTERACTIVE_DEADLINE_SECONDS: float = 120.0
 
     def get_active_env_vars(self):
         env_vars = {
             "DEV_MODE": self.DEV_MODE,
             "STREAMLIT_PORT": self.STREAMLIT_PORT,
+            "GPU_VRAM_MB": self.GPU_VRAM_MB,
+            "MEDIA_THUMBNAIL_SIZES": self.MEDIA_THUMBNAIL_SIZES,
+            "MEDIA_FORMAT": self.MEDIA_FORMAT,
+            "MEDIA_QUALITY": self.MEDIA_QUALITY,
+            "MEDIA_WORKERS": self.MEDIA_WORKERS,
+            "PROGRESS_PERSIST_INTERVAL": self.PROGRESS_PERSIST_INTERVAL,
+            "PROGRESS_POLL_SECONDS": self.PROGRESS_POLL_SECONDS,
+            "MEDIA_SERVER_ENABLED": self.MEDIA_SERVER_ENABLED,
+            "MEDIA_SERVER_HOST": self.MEDIA_SERVER_HOST,
+            "MEDIA_SERVER_PORT": self.MEDIA_SERVER_PORT,
+            "MEDIA_SERVER_URL": self.MEDIA_SERVER_URL,
+            "JOB_WORKERS": self.JOB_WORKERS,
+            "JOB_POLL_SECONDS": self.JOB_POLL_SECONDS,
+            "JOB_MAX_ATTEMPTS": self.JOB_MAX_ATTEMPTS,
+            "JOB_RETRY_SECONDS": self.JOB_RETRY_SECONDS,
+            "JOB_LEASE_SECONDS": self.JOB_LEASE_SECONDS,
+            "JOB_CLAIM_WINDOW": self.JOB_CLAIM_WINDOW,
+            "SCENE_DESCRIPTIONS_MODE": self.SCENE_DESCRIPTIONS_MODE,
+            "SCENE_IMAGES_HANDOFF": self.SCENE_IMAGES_HANDOFF,
+            "SURPRISE_ME_CONCURRENCY": self.SURPRISE_ME_CONCURRENCY,
+            "RETRY_ATTEMPTS": self.RETRY_ATTEMPTS,
+            "RETRY_BASE_SECONDS": self.RETRY_BASE_SECONDS,
+            "RETRY_MAX_SECONDS": self.RETRY_MAX_SECONDS,
+            "RETRY_READY_TIMEOUT_SECONDS": self.RETRY_READY_TIMEOUT_SECONDS,
+            "RETRY_READY_POLL_SECONDS": self.RETRY_READY_POLL_SECONDS,
+            "BREAKER_FAILURES": self.BREAKER_FAILURES,
+            "BREAKER_RESET_SECONDS": self.BREAKER_RESET_SECONDS,
+            "INTERACTIVE_DEADLINE_SECONDS": self.INTERACTIVE_DEADLINE_SECONDS,
         }
 
         env_vars.update(self.get_inference_env_vars())
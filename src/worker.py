@@ -0,0 +1,198 @@
+"""Workers that run the jobs queued in jobs.py.
+
+By default the Streamlit process runs `settings.JOB_WORKERS` worker threads, so progress
+published on the bus reaches the pages directly. Run `python worker.py --processes N` (or
+`make run-worker`) to run jobs in a separate pool of processes instead, with JOB_WORKERS=0
+for the frontend; pages then follow the progress each worker stores in the jobs table.
+"""
+
+import argparse
+import json
+from contextlib import nullcontext
+import multiprocessing
+import os
+import socket
+import threading
+from typing import Callable, Optional
+
+from db import get_model_usage, init_db
+from jobs import (
+    CANCELLED, FAILED, PRIORITY_INTERACTIVE, SUCCEEDED, ModelsBusy, cancellable, claim_job, finish_job, heartbeat,
+    pending_kinds, requeue, retry_or_fail
+)
+from ml.resilience import deadline
+from ml.vram_scheduler import IMAGE, LLM, TTS, Job as BackendJob, get_scheduler
+from models import JobSchema
+from progress import bus as progress_bus
+from services import (
+    generate_main_profile_image, generate_profile, generate_profile_image_description, generate_sample_profile_images,
+    generate_scenario, generate_scenario_images, generate_scene_descriptions, regenerate_scene_description,
+    reply_to_chat_voiced, resume_profile, resume_scenario, run_surprise_me, voice_messages, voice_response
+)
+from utils import logger, settings
+
+# Job kinds and the services that run them
+HANDLERS: dict[str, Callable] = {
+    "generate_profile": generate_profile,
+    "generate_profile_image_description": generate_profile_image_description,
+    "generate_sample_profile_images": generate_sample_profile_images,
+    "generate_main_profile_image": generate_main_profile_image,
+    "generate_scenario": generate_scenario,
+    "generate_scene_descriptions": generate_scene_descriptions,
+    "regenerate_scene_description": regenerate_scene_description,
+    "generate_scenario_images": generate_scenario_images,
+    "resume_profile": resume_profile,
+    "resume_scenario": resume_scenario,
+    "voice_response": voice_response,
+    "voice_messages": voice_messages,
+    "reply_to_chat_voiced": reply_to_chat_voiced,
+    "run_surprise_me": run_surprise_me,
+}
+
+# The backend each kind of job needs first, so the VRAM scheduler can batch jobs by backend
+BACKENDS: dict[str, str] = {
+    "generate_profile": LLM,
+    "generate_profile_image_description": LLM,
+    "generate_sample_profile_images": IMAGE,
+    "generate_main_profile_image": IMAGE,
+    "generate_scenario": LLM,
+    "generate_scene_descriptions": LLM,
+    "regenerate_scene_description": LLM,
+    "generate_scenario_images": IMAGE,
+    "resume_profile": LLM,
+    "resume_scenario": LLM,
+    "voice_response": TTS,
+    "voice_messages": TTS,
+    "reply_to_chat_voiced": LLM,
+    "run_surprise_me": LLM,
+}
+
+
+def backend_jobs(kinds: list[str]) -> list[BackendJob]:
+    return [BackendJob(backend=BACKENDS.get(kind, LLM), name=kind) for kind in kinds]
+
+
+def choose_job(kinds: list[str]) -> int:
+    """Index of the job the VRAM scheduler's swap policy runs next, e.g. one on a resident backend."""
+    candidates = backend_jobs(kinds)
+    chosen = get_scheduler().choose(candidates)
+    return next(i for i, job in enumerate(candidates) if job is chosen)
+
+
+def pending_backend_jobs() -> list[BackendJob]:
+    return backend_jobs(pending_kinds())
+
+
+_threads: list[threading.Thread] = []
+_threads_lock = threading.Lock()
+
+
+class Worker:
+    """Claims jobs one at a time and runs their handler, renewing the lease while it runs."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def run_once(self) -> bool:
+        """Run the next job, if any. Returns True if a job was run."""
+        usage = get_model_usage()
+        if usage and usage.status != "idle":
+            # The models are busy, jobs would find them in use and give up
+            return False
+        job = claim_job(self.name, choose=choose_job)
+        if job is None:
+            return False
+        self.run(job)
+        return True
+
+    def run(self, job: JobSchema):
+        handler = HANDLERS.get(job.kind)
+        if handler is None:
+            finish_job(job.id, FAILED, f"Unknown job kind {job.kind}")
+            return
+        logger.info(f"Worker {self.name} running job {job.id}: {job.kind} (attempt {job.attempts})")
+        cancel, stop = threading.Event(), threading.Event()
+        beat = threading.Thread(target=self._heartbeat, args=(job, cancel, stop), daemon=True,
+                                name=f"job-{job.id}-heartbeat")
+        beat.start()
+        # Someone is waiting on interactive jobs, so their backend calls give up instead of retrying for long
+        interactive = job.priority <= PRIORITY_INTERACTIVE
+        limit = deadline(settings.INTERACTIVE_DEADLINE_SECONDS) if interactive else nullcontext()
+        try:
+            with cancellable(cancel), limit:
+                handler(**json.loads(job.args))
+        except ModelsBusy:
+            # Another worker took the models between the idle check and the claim
+            requeue(job.id)
+        except ValueError as e:
+            # Missing or invalid input, running it again would fail the same way
+            finish_job(job.id, FAILED, str(e))
+        except Exception as e:
+            retry_or_fail(job.id, f"{type(e).__name__}: {e}")
+        else:
+            finish_job(job.id, CANCELLED if cancel.is_set() else SUCCEEDED)
+        finally:
+            stop.set()
+            beat.join()
+
+    def _heartbeat(self, job: JobSchema, cancel: threading.Event, stop: threading.Event):
+        # Store the latest progress for pages in other processes and pick up cancellation
+        while not stop.wait(settings.PROGRESS_PERSIST_INTERVAL):
+            try:
+                if heartbeat(job.id, progress_bus.latest(job.topic) if job.topic else None):
+                    cancel.set()
+            except Exception as e:
+                logger.warning(f"Heartbeat for job {job.id} failed: {e}")
+
+    def run_forever(self, stop: Optional[threading.Event] = None):
+        stop = stop or threading.Event()
+        # Backends with queued jobs stay in VRAM while others are swapped out
+        get_scheduler().pending = pending_backend_jobs
+        logger.info(f"Worker {self.name} started")
+        while not stop.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception as e:
+                logger.error(f"Worker {self.name} failed to run a job: {e}")
+            stop.wait(settings.JOB_POLL_SECONDS)
+
+
+def worker_name(index: int) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+def start_workers(count: Optional[int] = None) -> list[threading.Thread]:
+    """Start the in-process worker threads once per process."""
+    count = settings.JOB_WORKERS if count is None else count
+    with _threads_lock:
+        while len(_threads) < count:
+            worker = Worker(worker_name(len(_threads)))
+            thread = threading.Thread(target=worker.run_forever, daemon=True, name=f"job-worker-{len(_threads)}")
+            thread.start()
+            _threads.append(thread)
+        return list(_threads)
+
+
+def run_process(index: int):
+    Worker(worker_name(index)).run_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=1, help="Number of worker processes")
+    args = parser.parse_args()
+    init_db()
+    if args.processes <= 1:
+        run_process(0)
+        return
+    processes = [multiprocessing.Process(target=run_process, args=(i,), name=f"job-worker-{i}")
+                 for i in range(args.processes)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
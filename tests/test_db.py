@@ -0,0 +1,87 @@
+from sqlalchemy import event
+
+import db
+from models import MessageSchema, Profile, Scenario
+
+
+def add_scenario(name="Ada", voice="tara") -> int:
+    profile = db.save_profile(Profile(name=name, voice=voice))
+    return db.save_scenario(Scenario(profile_id=profile.id, title="Title", summary="Summary")).id
+
+
+def add_message(scenario_id, role="character", content="Hello", speech=None) -> int:
+    order = db.get_next_message_order(scenario_id)
+    message = MessageSchema(scenario_id=scenario_id, order=order, role=role, content=content, speech=speech)
+    return db.save_message(message).id
+
+
+def test_message_candidates_are_popped_in_order_until_none_are_left(database):
+    message_id = add_message(add_scenario())
+    db.save_message_candidates(message_id, ["second", "third"])
+    assert db.pop_message_candidate(message_id) == "second"
+    assert db.pop_message_candidate(message_id) == "third"
+    assert db.pop_message_candidate(message_id) is None
+
+
+def test_saving_message_candidates_replaces_the_old_ones(database):
+    scenario_id = add_scenario()
+    message_id = add_message(scenario_id)
+    other_id = add_message(scenario_id)
+    db.save_message_candidates(message_id, ["old"])
+    db.save_message_candidates(other_id, ["other"])
+    db.save_message_candidates(message_id, ["new", "newer"])
+    assert db.pop_message_candidate(message_id) == "new"
+    assert db.pop_message_candidate(message_id) == "newer"
+    assert db.pop_message_candidate(message_id) is None
+    assert db.pop_message_candidate(other_id) == "other"
+
+
+def test_shared_speech_is_deleted_with_its_last_message(database, tmp_path):
+    speech = tmp_path / "line.wav"
+    speech.write_bytes(b"RIFF")
+    scenario_id = add_scenario()
+    first = add_message(scenario_id, speech=str(speech))
+    second = add_message(scenario_id, speech=str(speech))
+
+    assert db.release_speech(str(speech), message_id=first) is False
+    assert speech.exists()
+    assert db.get_message(first).speech is None
+    assert db.release_speech(str(speech), message_id=second) is True
+    assert not speech.exists()
+    assert db.get_message(second).speech is None
+
+
+def test_unvoiced_messages_come_with_the_voice_of_their_profile(database):
+    ada = add_scenario("Ada", voice="tara")
+    zoe = add_scenario("Zoe", voice="zoe")
+    first = add_message(ada, content="One")
+    add_message(ada, role="user", content="Not voiced")
+    add_message(ada, content="Voiced", speech="/tmp/voiced.wav")
+    second = add_message(ada, content="Two")
+    other = add_message(zoe, content="Three")
+
+    unvoiced = db.get_unvoiced_messages()
+    assert [(message.id, voice) for message, voice in unvoiced] == [(first, "tara"), (second, "tara"), (other, "zoe")]
+    assert [message.id for message, _ in db.get_unvoiced_messages(scenario_id=zoe)] == [other]
+    profile_id = db.get_scenario(ada).profile_id
+    assert [message.id for message, _ in db.get_unvoiced_messages(profile_id=profile_id)] == [first, second]
+
+
+def test_message_speeches_are_set_in_one_update(database):
+    scenario_id = add_scenario()
+    ids = [add_message(scenario_id, content=f"Line {i}") for i in range(3)]
+    updates = []
+    engine = database.kw["bind"]
+
+    def count_updates(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("UPDATE"):
+            updates.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_updates)
+    try:
+        assert db.set_message_speeches({ids[0]: "/tmp/0.wav", ids[2]: "/tmp/2.wav"}) == 2
+    finally:
+        event.remove(engine, "before_cursor_execute", count_updates)
+    assert len(updates) == 1
+    assert [db.get_message(message_id).speech for message_id in ids] == ["/tmp/0.wav", None, "/tmp/2.wav"]
+    assert db.set_message_speeches({}) == 0
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from ml.embeddings import BatchingEmbedder, EmbeddingCache
+
+
+class FakeConfig:
+    model_name = "fake-embed"
+
+    def __init__(self, replies=None):
+        self.calls = []
+        self.replies = list(replies or [])
+
+    def embed_texts(self, texts):
+        self.calls.append(texts)
+        if self.replies:
+            reply = self.replies.pop(0)
+            if isinstance(reply, Exception):
+                raise reply
+            return reply(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def embedder(config, cache=None) -> BatchingEmbedder:
+    return BatchingEmbedder(config, max_batch_size=8, max_wait=0.05, cache=cache)
+
+
+def test_concurrent_texts_are_batched_and_cached():
+    config = FakeConfig()
+    batcher = embedder(config)
+    vectors = batcher.embed_texts(["a", "bb", "a"])
+    assert vectors.tolist() == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert config.calls == [["a", "bb"]]
+    batcher.embed_text("bb")
+    assert len(config.calls) == 1
+
+
+def test_failed_batch_fails_its_futures_and_the_batcher_keeps_running():
+    config = FakeConfig([ConnectionError("refused")])
+    batcher = embedder(config)
+    with pytest.raises(ConnectionError):
+        batcher.embed_text("a")
+    assert batcher.embed_text("a").tolist() == [1.0, 1.0]
+
+
+def test_texts_without_a_vector_fail_instead_of_waiting_forever():
+    config = FakeConfig([lambda texts: [[1.0, 1.0]]])
+    batcher = embedder(config)
+    futures = [batcher.submit(text) for text in ["a", "b"]]
+    assert futures[0].result(timeout=5).tolist() == [1.0, 1.0]
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=5)
+
+
+def test_bad_vectors_and_cache_errors_only_fail_their_own_texts():
+    class ReadOnlyCache(EmbeddingCache):
+        def put(self, key, vector):
+            raise OSError("disk full")
+
+    config = FakeConfig([lambda texts: [["not a number"]] * len(texts)])
+    batcher = embedder(config, cache=ReadOnlyCache())
+    with pytest.raises(ValueError):
+        batcher.submit("a").result(timeout=5)
+    assert batcher.submit("b").result(timeout=5).tolist() == [1.0, 1.0]
+    assert isinstance(batcher.embed_texts(["c"]), np.ndarray)
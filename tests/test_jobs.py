@@ -0,0 +1,156 @@
+import time
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import db
+import jobs
+import worker
+from models import Job, ModelUsageSchema
+from utils import settings
+
+
+@pytest.fixture
+def idle_models(database):
+    db.save_model_usage(ModelUsageSchema(status="idle"))
+
+
+def test_jobs_are_claimed_by_priority_then_age(database):
+    batch = jobs.enqueue("voice_messages", priority=jobs.PRIORITY_BATCH)
+    first = jobs.enqueue("generate_profile")
+    chat = jobs.enqueue("reply_to_chat_voiced", priority=jobs.PRIORITY_INTERACTIVE)
+    second = jobs.enqueue("generate_scenario")
+    claimed = [jobs.claim_job("w").id for _ in range(4)]
+    assert claimed == [chat, first, second, batch]
+    assert jobs.claim_job("w") is None
+    assert jobs.get_job(chat).status == jobs.RUNNING
+    assert jobs.get_job(chat).attempts == 1
+
+
+def test_choose_picks_among_jobs_of_the_most_urgent_priority(database):
+    jobs.enqueue("generate_scenario")
+    images = jobs.enqueue("generate_scenario_images")
+    jobs.enqueue("voice_messages", priority=jobs.PRIORITY_BATCH)
+    seen = []
+
+    def choose(kinds):
+        seen.append(kinds)
+        return kinds.index("generate_scenario_images")
+
+    assert jobs.claim_job("w", choose=choose).id == images
+    assert seen == [["generate_scenario", "generate_scenario_images"]]
+
+
+def test_expired_lease_hands_the_job_to_another_worker(database, monkeypatch):
+    job_id = jobs.enqueue("generate_profile", max_attempts=2)
+    assert jobs.claim_job("gone").worker == "gone"
+    # The worker stops checking in
+    monkeypatch.setattr(settings, "JOB_LEASE_SECONDS", -1.0)
+    job = jobs.claim_job("other")
+    assert (job.id, job.worker, job.attempts) == (job_id, "other", 2)
+    # Out of attempts, the next expiry fails it instead
+    assert jobs.claim_job("third") is None
+    assert jobs.get_job(job_id).status == jobs.FAILED
+
+
+def test_failed_job_is_retried_after_a_growing_delay(database, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_RETRY_SECONDS", 100.0)
+    job_id = jobs.enqueue("generate_profile", max_attempts=2)
+    jobs.claim_job("w")
+    before = time.time()
+    jobs.retry_or_fail(job_id, "connection refused")
+    job = jobs.get_job(job_id)
+    assert job.status == jobs.PENDING
+    assert job.run_after >= before + 100
+    assert jobs.claim_job("w") is None
+
+    with database() as session:
+        session.get(Job, job_id).run_after = 0.0
+        session.commit()
+    jobs.claim_job("w")
+    jobs.retry_or_fail(job_id, "connection refused")
+    assert jobs.get_job(job_id).status == jobs.FAILED
+
+
+def test_cancel_drops_pending_jobs_and_signals_running_ones(database):
+    pending = jobs.enqueue("generate_profile")
+    running = jobs.enqueue("generate_scenario", priority=jobs.PRIORITY_INTERACTIVE)
+    assert jobs.claim_job("w").id == running
+    assert jobs.cancel_job(pending)
+    assert jobs.get_job(pending).status == jobs.CANCELLED
+    assert jobs.cancel_job(running)
+    assert jobs.heartbeat(running) is True
+    jobs.finish_job(running, jobs.CANCELLED)
+    assert not jobs.cancel_job(running)
+    assert jobs.claim_job("w") is None
+
+
+def run_job(monkeypatch, handler, **kwargs) -> int:
+    monkeypatch.setitem(worker.HANDLERS, "test", handler)
+    job_id = jobs.enqueue("test", **kwargs)
+    assert worker.Worker("w").run_once()
+    return job_id
+
+
+def test_worker_retries_failed_handlers(idle_models, monkeypatch):
+    def fail():
+        raise RuntimeError("backend down")
+
+    job = jobs.get_job(run_job(monkeypatch, fail))
+    assert job.status == jobs.PENDING
+    assert job.error == "RuntimeError: backend down"
+
+
+def test_worker_fails_jobs_with_invalid_input_at_once(idle_models, monkeypatch):
+    def invalid():
+        raise ValueError("profile is empty")
+
+    assert jobs.get_job(run_job(monkeypatch, invalid)).status == jobs.FAILED
+
+
+def test_worker_requeues_jobs_that_find_the_models_busy(idle_models, monkeypatch):
+    def busy():
+        raise jobs.ModelsBusy("Model usage is not idle")
+
+    job = jobs.get_job(run_job(monkeypatch, busy))
+    assert job.status == jobs.PENDING
+    assert job.attempts == 0
+
+
+def test_worker_waits_while_the_models_are_busy(database, monkeypatch):
+    db.save_model_usage(ModelUsageSchema(status="Generating Profile"))
+    monkeypatch.setitem(worker.HANDLERS, "test", lambda: None)
+    job_id = jobs.enqueue("test")
+    assert not worker.Worker("w").run_once()
+    assert jobs.get_job(job_id).status == jobs.PENDING
+
+
+def test_worker_marks_finished_handlers_succeeded(idle_models, monkeypatch):
+    assert jobs.get_job(run_job(monkeypatch, lambda value: None, value=1)).status == jobs.SUCCEEDED
+
+
+def test_claims_skip_jobs_locked_by_another_worker():
+    # Needs Postgres, SQLite has no row locks
+    if db.engine.dialect.name != "postgresql":
+        pytest.skip("SKIP LOCKED needs Postgres")
+    try:
+        db.init_db()
+    except OperationalError:
+        pytest.skip("Postgres is not reachable")
+    first = jobs.enqueue("test", priority=-1000)
+    second = jobs.enqueue("test", priority=-1000)
+    try:
+        with db.SessionLocal() as session:
+            locked = (
+                session.query(Job).filter(Job.id == first).with_for_update(skip_locked=True).one()
+            )
+            assert locked.id == first
+            assert jobs.claim_job("other").id == second
+    finally:
+        for job_id in (first, second):
+            jobs.cancel_job(job_id)
+            jobs.finish_job(job_id, jobs.CANCELLED)
+
+
+def test_every_job_kind_names_the_backend_it_needs_first():
+    assert worker.BACKENDS.keys() == worker.HANDLERS.keys()
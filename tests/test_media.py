@@ -0,0 +1,63 @@
+import os
+
+import pytest
+from PIL import Image
+
+import media
+from media_render import render_derivatives
+from utils import settings
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(media, "OBJECTS_DIR", str(tmp_path / "objects"))
+    monkeypatch.setattr(media, "DERIVED_DIR", str(tmp_path / "derived"))
+    monkeypatch.setattr(media, "derive_async", lambda source, sha256: None)
+    monkeypatch.setattr(settings, "MEDIA_THUMBNAIL_SIZES", [64, 256])
+    return tmp_path
+
+
+def write_image(path, size=(400, 200), color=(200, 30, 30)):
+    Image.new("RGB", size, color).save(path, format="PNG")
+    return str(path)
+
+
+def test_render_derivatives_resizes_and_skips_existing(tmp_path):
+    source = write_image(tmp_path / "1-a.png")
+    targets = {64: str(tmp_path / "out" / "thumb.webp"), None: str(tmp_path / "out" / "full.webp")}
+
+    assert render_derivatives(source, targets, "webp", 80) == list(targets.values())
+    with Image.open(targets[64]) as thumb:
+        assert thumb.size == (64, 32)
+    with Image.open(targets[None]) as full:
+        assert full.size == (400, 200)
+    assert render_derivatives(source, targets, "webp", 80) == []
+
+
+def test_display_image_picks_a_sharp_thumbnail_and_renders_it_once(store, monkeypatch):
+    source = write_image(store / "1-a.png")
+    thumb = media.display_image(source, width=32)
+    assert thumb == media.derivative_path(media.content_hash(source), 64)
+    assert os.path.isfile(thumb)
+
+    def render_again(*args):
+        raise AssertionError("derivative should be reused")
+
+    monkeypatch.setattr(media, "render_derivatives", render_again)
+    assert media.display_image(source, width=32) == thumb
+    # Too wide for any thumbnail, and rendering fails, so the original is shown
+    assert media.display_image(source, width=500) == source
+
+
+def test_ingest_shares_one_copy_and_remove_keeps_it_while_linked(store):
+    first = write_image(store / "1-a.png")
+    second = write_image(store / "2-b.png")
+    sha256 = media.ingest(first)
+    assert media.ingest(second) == sha256
+    assert os.path.samefile(first, second)
+
+    stored = media.object_path(sha256, ".png")
+    media.remove(first)
+    assert os.path.exists(stored)
+    media.remove(second)
+    assert not os.path.exists(stored)
@@ -0,0 +1,61 @@
+import pytest
+import requests
+
+from api import media_server
+from api.media_server import media_url, parse_range, serve
+from utils import settings
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / "speech").mkdir()
+    (tmp_path / "speech" / "line.ogg").write_bytes(bytes(range(256)) * 4)
+    (tmp_path / "secret.txt").write_text("not served")
+    server = serve(str(tmp_path / "speech"))
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=10-19", 100) == (10, 19)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+
+
+def test_range_requests_return_partial_content(server):
+    r = requests.get(f"{server}/line.ogg", headers={"Range": "bytes=256-511"})
+    assert r.status_code == 206
+    assert r.headers["Content-Range"] == "bytes 256-511/1024"
+    assert r.headers["Content-Type"] == "audio/ogg"
+    assert r.content == bytes(range(256))
+
+    full = requests.get(f"{server}/line.ogg")
+    assert full.status_code == 200
+    assert full.headers["Accept-Ranges"] == "bytes"
+    assert len(full.content) == 1024
+    assert "Access-Control-Allow-Origin" not in full.headers
+
+    assert requests.get(f"{server}/line.ogg", headers={"Range": "bytes=2048-"}).status_code == 416
+
+
+def test_files_outside_the_root_are_not_served(server):
+    assert requests.get(f"{server}/../secret.txt").status_code == 404
+    assert requests.get(f"{server}/%2e%2e/secret.txt").status_code == 404
+    assert requests.get(f"{server}/missing.ogg").status_code == 404
+
+
+def test_media_url_is_only_used_once_configured(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_server, "SPEECH_DIR", str(tmp_path))
+    monkeypatch.setattr(media_server, "start_media_server", lambda: object())
+    path = str(tmp_path / "a line.ogg")
+    monkeypatch.setattr(settings, "MEDIA_SERVER_URL", None)
+    assert media_url(path) == path
+
+    monkeypatch.setattr(settings, "MEDIA_SERVER_URL", "http://media.example:8502/")
+    assert media_url(path) == "http://media.example:8502/a%20line.ogg"
+    assert media_url("/elsewhere/line.ogg") == "/elsewhere/line.ogg"
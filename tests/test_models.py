@@ -0,0 +1,21 @@
+import json
+
+from models import Profile, Scenario
+
+
+def test_next_stage_follows_checkpoints():
+    profile = Profile(name="A", stages=json.dumps(["text", "image_description"]))
+    assert profile.is_done("image_description")
+    assert profile.next_stage() == "sample_images"
+    profile.stages = json.dumps(list(Profile.STAGES))
+    assert profile.next_stage() is None
+
+
+def test_stages_of_older_rows_are_judged_by_their_fields():
+    profile = Profile(name="A", profile_image_description="desc", image_seed="42")
+    # The seed counts as done, but the images it came from do not
+    assert profile.completed_stages() == ["text", "image_description", "seed"]
+    assert profile.next_stage() == "sample_images"
+
+    scenario = Scenario(title="T", profile_id=1, scene_descriptions=json.dumps(["a", "b"]), images="[]")
+    assert scenario.next_stage() == "scene_images"
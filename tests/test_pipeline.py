@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from pipeline import DagExecutor, Task
+
+
+def sleeper(seconds: float, log: list, name: str):
+    def run(results):
+        log.append(name)
+        time.sleep(seconds)
+        return name
+    return run
+
+
+def two_profile_pipeline(log: list, step: float = 0.1) -> list[Task]:
+    tasks = []
+    for n in range(2):
+        tasks.append(Task(name=f"text {n}", resource="llm", fn=sleeper(step, log, f"text {n}")))
+        tasks.append(Task(name=f"image {n}", resource="image", deps=[f"text {n}"],
+                          fn=sleeper(step, log, f"image {n}")))
+    return tasks
+
+
+def test_llm_and_image_stages_of_different_items_overlap():
+    log = []
+    report = DagExecutor({"llm": 1, "image": 1}).run(two_profile_pipeline(log))
+    assert all(run.status == "done" for run in report.runs.values())
+    # text 1 runs while image 0 renders: three steps instead of four
+    assert report.seconds < 0.35
+    assert report.busy_seconds()["llm"] == pytest.approx(0.2, abs=0.05)
+    assert report.critical_path()[-1].startswith("image")
+
+
+def test_resources_that_cannot_share_run_one_after_the_other():
+    log = []
+    executor = DagExecutor({"llm": 1, "image": 1}, can_share=lambda busy, resource: False)
+    report = executor.run(two_profile_pipeline(log, step=0.05))
+    spans = sorted((run.started_at, run.finished_at) for run in report.runs.values())
+    assert all(end <= next_start + 0.01 for (_, end), (next_start, _) in zip(spans, spans[1:]))
+
+
+def test_failed_task_skips_its_dependents_only():
+    def fail(results):
+        raise RuntimeError("no content")
+
+    tasks = [
+        Task(name="a", resource="llm", fn=fail),
+        Task(name="b", resource="image", deps=["a"], fn=lambda results: "b"),
+        Task(name="c", resource="llm", fn=lambda results: "c"),
+        Task(name="d", resource="image", deps=["c"], fn=lambda results: results["c"] + "d"),
+    ]
+    report = DagExecutor({"llm": 1, "image": 1}).run(tasks)
+    assert {name: run.status for name, run in report.runs.items()} == {
+        "a": "failed", "b": "skipped", "c": "done", "d": "done"
+    }
+    assert report.results["d"] == "cd"
+
+
+def test_cycles_are_rejected():
+    tasks = [
+        Task(name="a", resource="llm", deps=["b"], fn=lambda results: None),
+        Task(name="b", resource="llm", deps=["a"], fn=lambda results: None),
+    ]
+    with pytest.raises(ValueError):
+        DagExecutor({"llm": 1}).run(tasks)
@@ -0,0 +1,118 @@
+import time
+
+import pytest
+
+from ml.resilience import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, DeadlineExceeded, _breakers, deadline, get_breaker,
+    register_probe, resilient
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers():
+    _breakers.clear()
+    yield
+    _breakers.clear()
+
+
+def test_transient_failure_recovers_without_a_long_wait():
+    calls = []
+
+    @resilient("test", retry_on=(ConnectionError,))
+    def flaky():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise ConnectionError("connection reset")
+        return "ok"
+
+    started = time.monotonic()
+    assert flaky() == "ok"
+    assert time.monotonic() - started < 0.5
+    assert get_breaker("test").stats.retries == 1
+    assert get_breaker("test").state == CLOSED
+
+
+def test_breaker_opens_and_fails_fast_until_a_trial_call_succeeds():
+    now = [0.0]
+    breaker = CircuitBreaker("test", failures=2, reset_seconds=10, clock=lambda: now[0])
+    for _ in range(2):
+        breaker.allow()
+        breaker.failure(ConnectionError("refused"))
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    now[0] = 10.0
+    breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Only one trial call at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.success()
+    assert breaker.state == CLOSED
+    assert breaker.stats.rejected == 2
+
+
+def test_errors_of_the_request_are_not_retried():
+    calls = []
+
+    @resilient("test", retry_on=(ConnectionError,))
+    def rejected():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        rejected()
+    assert len(calls) == 1
+    assert get_breaker("test").stats.failures == 0
+
+
+def test_bad_replies_are_retried_without_tripping_the_breaker():
+    calls = []
+
+    @resilient("test", retry_on=(ValueError,), breaker=False)
+    @resilient("test", retry_on=(ConnectionError,))
+    def unparsable():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ValueError("not json")
+        return "ok"
+
+    assert unparsable() == "ok"
+    assert len(calls) == 2
+    assert get_breaker("test").stats.failures == 0
+    assert get_breaker("test").state == CLOSED
+
+
+def test_retries_wait_for_readiness_but_not_past_the_deadline():
+    register_probe("booting", lambda: False)
+
+    @resilient("booting", retry_on=(ConnectionError,), attempts=5)
+    def down():
+        raise ConnectionError("refused")
+
+    started = time.monotonic()
+    with deadline(0.3), pytest.raises(DeadlineExceeded):
+        down()
+    assert time.monotonic() - started < 0.5
+
+
+def test_a_trial_call_out_of_time_lets_the_next_one_through():
+    _breakers["test"] = CircuitBreaker("test", failures=1, reset_seconds=0)
+    outcomes = [ConnectionError("refused"), DeadlineExceeded("no time left"), None]
+
+    @resilient("test", retry_on=(ConnectionError,), attempts=1)
+    def call():
+        outcome = outcomes.pop(0)
+        if outcome:
+            raise outcome
+        return "ok"
+
+    with pytest.raises(ConnectionError):
+        call()
+    assert get_breaker("test").state == OPEN
+    with pytest.raises(DeadlineExceeded):
+        call()
+    assert get_breaker("test").state == HALF_OPEN
+    assert call() == "ok"
+    assert get_breaker("test").state == CLOSED
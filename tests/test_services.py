@@ -0,0 +1,179 @@
+import json
+import re
+
+import pytest
+
+import db
+import services
+from jobs import ModelsBusy
+from models import ModelUsageSchema, Profile, Scenario, SceneDescriptionsSchema
+from tests.test_db import add_message, add_scenario
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.loaded = []
+
+    def ensure_resident(self, backend, keep=()):
+        self.loaded.append(backend)
+
+
+@pytest.fixture
+def tts(database, monkeypatch):
+    """Records the lines voiced with each voice; lines containing "fail" get no audio."""
+    db.save_model_usage(ModelUsageSchema(status="idle"))
+    voiced = []
+    scheduler = FakeScheduler()
+
+    def get_tts_audio(input, voice, max_workers=None, on_chunk=None):
+        voiced.append((input, voice))
+        return "" if "fail" in input else f"/speech/{voice}/{len(voiced)}.wav"
+
+    monkeypatch.setattr(services, "get_tts_audio", get_tts_audio)
+    monkeypatch.setattr(services, "cached_speech", lambda input, voice: "/speech/cached.wav" if input == "Again." else None)
+    monkeypatch.setattr(services, "transcode_async", lambda path, on_done=None: None)
+    monkeypatch.setattr(services, "get_scheduler", lambda: scheduler)
+    return voiced, scheduler
+
+
+def test_voice_messages_uses_each_profiles_voice_and_saves_what_was_voiced(tts):
+    voiced, scheduler = tts
+    ada, zoe = add_scenario("Ada", voice="tara"), add_scenario("Zoe", voice="zoe")
+    hello = add_message(ada, content="*Waves* Hello there.")
+    again = add_message(ada, content="Again.")
+    broken = add_message(zoe, content="This will fail.")
+    bye = add_message(zoe, content="Bye.")
+
+    assert services.voice_messages(max_parallel=2) == 3
+    assert sorted(voiced) == [("Bye.", "zoe"), ("Hello there.", "tara"), ("This will fail.", "zoe")]
+    assert scheduler.loaded == [services.TTS]
+    assert db.get_message(again).speech == "/speech/cached.wav"
+    assert db.get_message(hello).speech.startswith("/speech/tara/")
+    assert db.get_message(bye).speech.startswith("/speech/zoe/")
+    assert db.get_message(broken).speech is None
+    assert db.get_model_usage().status == "idle"
+
+
+def test_voice_messages_skips_the_tts_model_when_every_line_is_cached(tts):
+    voiced, scheduler = tts
+    add_message(add_scenario(), content="Again.")
+    assert services.voice_messages(max_parallel=1) == 1
+    assert voiced == [] and scheduler.loaded == []
+
+
+def test_voice_messages_fails_when_nothing_could_be_voiced_or_models_are_busy(tts):
+    scenario_id = add_scenario()
+    add_message(scenario_id, content="This will fail.")
+    with pytest.raises(RuntimeError):
+        services.voice_messages(scenario_id=scenario_id)
+    assert db.get_model_usage().status == "idle"
+
+    db.save_model_usage(ModelUsageSchema(status="Generating Images"))
+    with pytest.raises(ModelsBusy):
+        services.voice_messages(scenario_id=scenario_id)
+
+
+class FakeSceneLLM:
+    """Answers the single call with `structured` or `streamed`, and each per-scene call with "<summary> scene"."""
+
+    model_name = "fake"
+
+    def __init__(self):
+        self.structured = []
+        self.streamed = []
+        self.scenes = []
+
+    def stream_from_messages(self, messages):
+        return iter(self.streamed)
+
+    def generate_from_messages(self, messages, schema=None):
+        if schema:
+            if isinstance(self.structured, Exception):
+                raise self.structured
+            return SceneDescriptionsSchema(scene_descriptions=self.structured)
+        prompt = messages[-1]["content"]
+        summary = re.search(r"Scene summary: (.*)\.\n", prompt).group(1)
+        previous = re.search(r"Previous scene description: (.*)\.$", prompt).group(1)
+        self.scenes.append((summary, previous))
+        return f"{summary} scene"
+
+
+@pytest.fixture
+def scene_llm(database, monkeypatch):
+    db.save_model_usage(ModelUsageSchema(status="idle"))
+    llm = FakeSceneLLM()
+    monkeypatch.setattr(services, "scene_description_llm", lambda llm_model, task="scene": llm)
+    monkeypatch.setattr(services, "get_scheduler", lambda: FakeScheduler())
+    return llm
+
+
+def add_scenes(*summaries, descriptions=None) -> int:
+    profile = db.save_profile(Profile(name="Ada", physical_characteristics="tall"))
+    scenario = Scenario(profile_id=profile.id, title="Title", summary="Summary", scene_summaries=json.dumps(summaries),
+                        scene_descriptions=json.dumps(descriptions) if descriptions else None, stages='["text"]')
+    return db.save_scenario(scenario).id
+
+
+def test_scenes_the_single_call_missed_are_described_one_by_one(scene_llm):
+    scene_llm.structured = ["Meet scene", "Walk scene"]
+    scenario_id = add_scenes("Meet", "Walk", "Kiss")
+
+    services.generate_scene_descriptions(scenario_id, "model", mode="single_call")
+    scenario = db.get_scenario(scenario_id)
+    assert scenario.get_scene_descriptions() == ["Meet scene", "Walk scene", "Kiss scene"]
+    assert scene_llm.scenes == [("Kiss", "Walk scene")]
+    assert scenario.is_done("scene_descriptions")
+
+
+def test_an_invalid_single_call_reply_falls_back_to_one_call_per_scene(scene_llm):
+    scene_llm.structured = ValueError("not json")
+    scenario_id = add_scenes("Meet", "Walk")
+
+    services.generate_scene_descriptions(scenario_id, "model", mode="single_call")
+    assert db.get_scenario(scenario_id).get_scene_descriptions() == ["Meet scene", "Walk scene"]
+    assert scene_llm.scenes == [("Meet", ""), ("Walk", "Meet scene")]
+    assert db.get_model_usage().status == "idle"
+
+
+def test_scene_descriptions_resume_after_the_ones_saved_before(scene_llm):
+    scene_llm.structured = ["Never used"] * 3
+    scenario_id = add_scenes("Meet", "Walk", "Kiss", descriptions=["Saved meet"])
+    handed_on = []
+
+    services.generate_scene_descriptions(scenario_id, "model", mode="single_call",
+                                         on_description=lambda i, d: handed_on.append((i, d)))
+    assert db.get_scenario(scenario_id).get_scene_descriptions() == ["Saved meet", "Walk scene", "Kiss scene"]
+    assert scene_llm.scenes == [("Walk", "Saved meet"), ("Kiss", "Walk scene")]
+    assert handed_on == [(0, "Saved meet"), (1, "Walk scene"), (2, "Kiss scene")]
+
+    # Once finished, running it again writes every scene anew
+    services.generate_scene_descriptions(scenario_id, "model", mode="per_scene")
+    assert db.get_scenario(scenario_id).get_scene_descriptions() == ["Meet scene", "Walk scene", "Kiss scene"]
+
+
+def test_streamed_descriptions_go_by_scene_number_and_stop_at_a_skipped_scene(scene_llm):
+    scene_llm.streamed = ["<think>1. Draft</think>\n1. Meet", " scene\n1. Meet again\n", "2. Walk scene\n4. Hug scene"]
+    scenario_id = add_scenes("Meet", "Walk", "Kiss", "Hug")
+    handed_on = []
+
+    services.generate_scene_descriptions(scenario_id, "model", mode="single_call",
+                                         on_description=lambda i, d: handed_on.append(d))
+    assert handed_on == ["Meet scene", "Walk scene", "Kiss scene", "Hug scene"]
+    assert scene_llm.scenes == [("Kiss", "Walk scene"), ("Hug", "Kiss scene")]
+
+
+def test_stage_reporter_shows_every_running_stage():
+    class Status:
+        def __init__(self):
+            self.texts = []
+
+        def update(self, text):
+            self.texts.append(text)
+
+    status = Status()
+    report = services.stage_reporter(status, "Surprise Me")
+    report("profile", "Writing")
+    report("images", "Rendering")
+    report("profile", "idle")
+    report("images", "idle")
+    assert status.texts == ["Surprise Me: Writing", "Surprise Me: Writing; Rendering", "Surprise Me: Rendering", "Surprise Me"]
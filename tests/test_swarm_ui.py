@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+
+import pytest
+import requests
+
+import media
+from ml import swarm_ui
+from ml.fake_swarmui import FakeSwarmUI
+from ml.image_cache import ImageCache
+from ml.resilience import deadline
+
+
+@pytest.fixture
+def fake():
+    with FakeSwarmUI() as server:
+        yield server
+
+
+@pytest.fixture
+def client(fake, tmp_path, monkeypatch):
+    client = swarm_ui.SwarmUIClient(
+        api_url=fake.api_url,
+        ws_url=fake.ws_url,
+        base_url=fake.base_url,
+        heartbeat_interval=0,
+        manage_container=False,
+    )
+    files_dir = str(tmp_path / "images")
+    monkeypatch.setattr(swarm_ui, "_client", client)
+    monkeypatch.setattr(swarm_ui, "FILES_DIR", files_dir)
+    monkeypatch.setattr(swarm_ui, "get_image_cache", lambda: ImageCache(os.path.join(files_dir, "cache"), 1 << 30))
+    monkeypatch.setattr(media, "OBJECTS_DIR", str(tmp_path / "media" / "objects"))
+    monkeypatch.setattr(media, "DERIVED_DIR", str(tmp_path / "media" / "derived"))
+    monkeypatch.setattr(media, "derive_async", lambda source, sha256: None)
+    yield client
+    client.close()
+
+
+def test_session_is_reused_and_renewed_after_expiry(fake, client):
+    session_id = client.session_id()
+    assert client.list_models() == fake.models
+    assert client.session_id() == session_id
+    assert fake.calls["GetNewSession"] == 1
+
+    fake.expire_sessions()
+    assert client.list_models() == fake.models
+    assert client.session_id() != session_id
+    assert fake.calls["GetNewSession"] == 2
+
+
+def test_api_calls_end_at_the_callers_deadline(fake, client):
+    client.session_id()
+    fake.load_latency = 2.0
+    started = time.monotonic()
+    with deadline(0.3), pytest.raises(requests.exceptions.Timeout):
+        client.select_model("model-a.safetensors")
+    assert time.monotonic() - started < 1.0
+
+
+def test_ensure_model_loads_each_model_once(fake, client):
+    assert client.ensure_model("model-a.safetensors") is True
+    assert client.ensure_model("model-a.safetensors") is False
+    assert client.ensure_model("model-b.safetensors") is True
+    assert fake.calls["model_load"] == 2
+
+
+def test_ensure_model_trusts_the_cached_backends_until_they_go_stale(fake, client):
+    client.ensure_model("model-a.safetensors")
+    backend_checks = fake.calls["ListBackends"]
+    for _ in range(3):
+        assert client.ensure_model("model-a.safetensors") is False
+    assert fake.calls["ListBackends"] == backend_checks
+
+    client.models_ttl = 0
+    assert client.ensure_model("model-a.safetensors") is False
+    assert fake.calls["ListBackends"] == backend_checks + 1
+
+
+def test_drafts_keep_the_target_resolution_and_only_cut_steps(monkeypatch):
+    monkeypatch.setattr(swarm_ui.settings, "SWARMUI_DRAFT_MODEL_STEPS", {"flux.safetensors": 4})
+    for model in ("model-a.safetensors", "flux.safetensors"):
+        params = swarm_ui.draft_params(model)
+        assert {k: v for k, v in params.items() if k != "steps"} == \
+            {k: v for k, v in swarm_ui.TARGET_PARAMS.items() if k != "steps"}
+        assert params["steps"] < swarm_ui.TARGET_PARAMS["steps"]
+    assert swarm_ui.draft_params("flux.safetensors")["steps"] == 4
+
+
+def test_image_from_prompt_downloads_each_image_of_a_batch(fake, client):
+    seen = []
+    files = swarm_ui.image_from_prompt("a castle", model="model-a.safetensors", num_images=3, on_image=seen.append)
+    assert len(files) == 3
+    assert seen == files
+    assert all(os.path.isfile(f) for f in files)
+    assert fake.calls["GenerateText2ImageWS"] == 1
+
+
+def test_download_reuses_an_identical_file_and_suffixes_a_different_one(fake, client, tmp_path):
+    fake.images["View/local/raw/7-a.png"] = b"first"
+    fake.images["View/local/raw/sub/7-a.png"] = b"second"
+    dest = str(tmp_path / "downloads")
+
+    first = client.download("View/local/raw/7-a.png", dest)
+    assert client.download("View/local/raw/7-a.png", dest) == first
+    other = client.download("View/local/raw/sub/7-a.png", dest)
+    assert other != first and os.path.basename(other).startswith("7-a")
+    assert sorted(os.listdir(dest)) == ["7-a.png", "7-a_1.png"]
+
+
+def test_image_from_prompts_keeps_order_and_reuses_cached_renders(fake, client):
+    prompts = ["a forest", "a lake", "a mountain"]
+    first = swarm_ui.image_from_prompts(prompts, model="model-a.safetensors", preset="target", seed=42)
+    assert [len(files) for files in first] == [1, 1, 1]
+    assert fake.calls["GenerateText2ImageWS"] == 3
+
+    second = swarm_ui.image_from_prompts(prompts, model="model-a.safetensors", preset="target", seed=42)
+    assert second == first
+    assert fake.calls["GenerateText2ImageWS"] == 3
+
+
+def test_prompt_stream_renders_each_prompt_as_it_arrives(fake, client):
+    first_image = threading.Event()
+
+    def prompts():
+        yield "a forest"
+        # The next prompt is only written once the first one has been rendered
+        assert first_image.wait(timeout=5)
+        yield "a lake"
+
+    seen = []
+
+    def on_image(index, filename):
+        seen.append(index)
+        first_image.set()
+
+    files = swarm_ui.image_from_prompt_stream(prompts(), model="model-a.safetensors", on_image=on_image)
+    assert [len(f) for f in files] == [1, 1]
+    assert seen == [0, 1]
@@ -0,0 +1,61 @@
+import time
+
+from ml.telemetry import LLMCallRecord, _requested_at, build_record, call_metadata, summarize_llm_calls, track_request
+
+
+def callback_kwargs(requested_at, stream=False, first_token=None, task="chat"):
+    return {
+        "model": "qwen",
+        "stream": stream,
+        "completion_start_time": first_token,
+        "litellm_params": {"metadata": {"task": task, "requested_at": requested_at}},
+    }
+
+
+def test_build_record_times_the_call_and_its_queue_wait():
+    usage = {"usage": {"prompt_tokens": 50, "completion_tokens": 20}}
+    record = build_record(callback_kwargs(99.5), usage, 100.0, 102.0)
+    assert record.model == "qwen" and record.task == "chat" and not record.streamed and record.success
+    assert record.queue_wait_ms == 500.0
+    assert record.latency_ms == 2000.0
+    # The whole reply arrives at once, so there is no time to first token
+    assert record.ttft_ms is None
+    assert record.tokens_per_s == 10.0
+    assert (record.prompt_tokens, record.completion_tokens) == (50, 20)
+
+    streamed = build_record(callback_kwargs(100.0, stream=True, first_token=100.5), usage, 100.0, 102.5, error="boom")
+    assert streamed.streamed and not streamed.success and streamed.error == "boom"
+    assert streamed.ttft_ms == 500.0
+    # Decoding starts at the first token
+    assert streamed.tokens_per_s == 10.0
+
+
+def test_summary_groups_by_model_and_task_and_leaves_unstreamed_calls_out_of_ttft():
+    def record(model, latency_ms, ttft_ms=None, success=True):
+        return LLMCallRecord(timestamp=0.0, model=model, task="chat", latency_ms=latency_ms, ttft_ms=ttft_ms,
+                             success=success, completion_tokens=10)
+
+    summary = summarize_llm_calls([
+        record("b", 1000.0),
+        record("a", 1000.0, ttft_ms=200.0),
+        record("a", 3000.0),
+        record("a", 9000.0, success=False),
+    ])
+    assert [(row["model"], row["calls"], row["errors"]) for row in summary] == [("a", 3, 1), ("b", 1, 0)]
+    assert summary[0]["p50_latency_s"] == 2.0
+    assert summary[0]["p50_ttft_s"] == 0.2
+    assert summary[0]["completion_tokens"] == 30
+    assert summary[1]["p50_ttft_s"] is None
+
+
+def test_streamed_calls_keep_the_time_they_were_requested():
+    @track_request
+    def stream():
+        yield call_metadata("chat")["requested_at"]
+
+    called_at = time.time()
+    pieces = stream()
+    assert _requested_at.get() is None
+    time.sleep(0.05)
+    assert next(pieces) - called_at < 0.04
+    assert list(pieces) == []
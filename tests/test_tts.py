@@ -0,0 +1,65 @@
+import io
+import wave
+
+from ml import tts
+from ml.resilience import deadline, remaining
+from ml.tts import SentenceBuffer, concat_wav, speech_key, split_text, synthesize_chunks
+
+
+def make_wav(frames: int) -> bytes:
+    output = io.BytesIO()
+    with wave.open(output, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(24000)
+        wav.writeframes(b"\x01\x00" * frames)
+    return output.getvalue()
+
+
+def test_split_text_keeps_sentences_whole_and_merges_short_ones():
+    text = 'Hi. Come in, darling, I was waiting for you. "Sit down," she said. ' + "and then, " * 30 + "the end."
+    chunks = split_text(text, max_chars=80, min_chars=20)
+    assert " ".join(chunks) == text.strip()
+    assert chunks[0] == "Hi. Come in, darling, I was waiting for you."
+    assert chunks[1] == '"Sit down," she said.'
+    assert all(len(chunk) <= 80 for chunk in chunks)
+
+
+def test_concat_wav_joins_frames_in_order():
+    joined = concat_wav([make_wav(100), make_wav(50), make_wav(25)])
+    with wave.open(io.BytesIO(joined), "rb") as wav:
+        assert wav.getnframes() == 175
+        assert wav.getframerate() == 24000
+
+
+def test_speech_key_ignores_whitespace_but_not_voice():
+    key = speech_key("Welcome back,  darling.", "orpheus", "tara", "wav", 0.5)
+    assert key == speech_key(" Welcome back,\ndarling. ", "orpheus", "tara", "wav", 0.5)
+    assert key != speech_key("Welcome back, darling.", "orpheus", "leo", "wav", 0.5)
+
+
+def test_sentence_buffer_cuts_completed_sentences_outside_actions():
+    buffer = SentenceBuffer(max_chars=80, min_chars=10)
+    chunks = []
+    for delta in ["<think>Be warm. Be", " kind.</think>Welcome back", ", darling. *She smiles. Then", " waves.* ",
+                  "Sit with me. I missed", " you."]:
+        chunks += buffer.feed(delta)
+    assert chunks == ["Welcome back, darling.", "Sit with me."]
+    assert buffer.flush() == ["I missed you."]
+
+
+def test_sentence_buffer_sees_tags_and_boundaries_split_across_deltas():
+    buffer = SentenceBuffer(max_chars=80, min_chars=5)
+    chunks = []
+    for delta in ["<thi", "nk>Plan it. Then", " speak.</th", "ink>", "*Laughs", ".* Of course", ".", " ", "Come in."]:
+        chunks += buffer.feed(delta)
+    assert chunks == ["Of course."]
+    assert buffer.flush() == ["Come in."]
+
+
+def test_synthesize_chunks_workers_see_the_callers_deadline(monkeypatch):
+    monkeypatch.setattr(tts, "_cached_synthesize", lambda chunk, **kwargs: remaining())
+    assert list(synthesize_chunks(["One.", "Two."])) == [None, None]
+    with deadline(60):
+        left = list(synthesize_chunks(["One.", "Two."]))
+    assert all(0 < seconds <= 60 for seconds in left)
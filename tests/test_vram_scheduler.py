@@ -0,0 +1,103 @@
+from pathlib import Path
+
+import pytest
+
+from ml.vram_scheduler import (
+    BatchingPolicy,
+    FifoPolicy,
+    Job,
+    SimulatedBackend,
+    SimulatedClock,
+    VRAMScheduler,
+    load_trace,
+    replay_trace,
+)
+
+TRACE = Path(__file__).parent / "data" / "vram_trace.jsonl"
+
+
+def make_scheduler(policy, capacity_mb=16000):
+    clock = SimulatedClock()
+    backends = [
+        SimulatedBackend("llm", 8000, clock, load_seconds=10),
+        SimulatedBackend("image", 12000, clock, load_seconds=20),
+        SimulatedBackend("tts", 4000, clock, load_seconds=5),
+    ]
+    return VRAMScheduler(backends, capacity_mb, policy=policy, clock=clock)
+
+
+def test_ensure_resident_unloads_only_what_is_needed():
+    scheduler = make_scheduler(FifoPolicy())
+    assert scheduler.ensure_resident("llm") == []
+    assert scheduler.ensure_resident("tts") == []
+    assert scheduler.resident() == {"llm", "tts"}
+    assert sorted(scheduler.ensure_resident("image")) == ["llm"]
+    assert scheduler.resident() == {"image", "tts"}
+    assert scheduler.used_mb() <= scheduler.capacity_mb
+
+
+def test_ensure_resident_keeps_pinned_backends():
+    scheduler = make_scheduler(FifoPolicy())
+    scheduler.ensure_resident("image")
+    scheduler.ensure_resident("tts")
+    # Pending image work would normally make the idle TTS backend the first to go
+    scheduler.submit("image", name="image", duration=1)
+    assert scheduler.fits("llm", "tts")
+    assert scheduler.ensure_resident("llm", keep=("tts",)) == ["image"]
+    assert scheduler.resident() == {"llm", "tts"}
+    assert not scheduler.fits("llm", "image")
+
+
+def test_ensure_resident_refuses_a_backend_that_does_not_fit_next_to_pinned_ones():
+    scheduler = make_scheduler(FifoPolicy())
+    scheduler.ensure_resident("llm")
+    scheduler.ensure_resident("tts")
+    with pytest.raises(ValueError):
+        scheduler.ensure_resident("image", keep=("llm",))
+    # Nothing was unloaded for a load that could not happen
+    assert scheduler.resident() == {"llm", "tts"}
+
+
+def test_batching_policy_swaps_less_than_fifo_on_recorded_trace():
+    trace = load_trace(TRACE)
+    fifo = replay_trace(trace, make_scheduler(FifoPolicy()))
+    batching = replay_trace(trace, make_scheduler(BatchingPolicy()))
+    assert fifo["jobs"] == batching["jobs"] == len(trace)
+    assert batching["swaps"] < fifo["swaps"]
+    assert batching["makespan"] < fifo["makespan"]
+    # Once the image backend is loaded, every pending image job runs before the LLM returns
+    images = [i for i, name in enumerate(batching["order"]) if name.startswith("profile_image")]
+    assert images == list(range(images[0], images[0] + len(images)))
+
+
+def test_batching_policy_max_batch_bounds_starvation():
+    scheduler = make_scheduler(BatchingPolicy(max_batch=1))
+    for i in range(3):
+        scheduler.submit("llm", name=f"llm_{i}", duration=1)
+    scheduler.submit("image", name="image", duration=1)
+    order = [job.name for job in scheduler.run()]
+    assert order.index("image") == 1
+
+
+def test_batching_policy_groups_jobs_by_model():
+    scheduler = make_scheduler(BatchingPolicy())
+    for i, model in enumerate(["a", "b", "a", "b", "a"]):
+        scheduler.submit("image", name=f"{model}_{i}", duration=1, model=model)
+    order = [job.model for job in scheduler.run()]
+    assert order == ["a", "a", "a", "b", "b"]
+
+
+def test_work_pending_elsewhere_keeps_its_backend_resident():
+    scheduler = make_scheduler(FifoPolicy(), capacity_mb=20000)
+    scheduler.pending = lambda: [Job(backend="llm"), Job(backend="llm")]
+    scheduler.ensure_resident("llm")
+    scheduler.ensure_resident("tts")
+    # Without the queued LLM jobs the larger LLM backend would be unloaded first
+    assert scheduler.ensure_resident("image") == ["tts"]
+
+
+def test_choose_prefers_jobs_on_resident_backends():
+    scheduler = make_scheduler(BatchingPolicy())
+    scheduler.ensure_resident("image")
+    jobs = [Job(backend="llm", name="scenario"), Job(backend="image", name="images")]
+    assert scheduler.choose(jobs).name == "images"